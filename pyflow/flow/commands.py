@@ -6,28 +6,59 @@ class Commands:
     """
 
     @staticmethod
-    def get_run_command(step_id: str, wave_id: int, time: int) -> str:
+    def get_run_command(step_id: str, wave_id: int, time: int, offset: int = 0) -> str:
         """
         Command used for running an array calculation for the specified step ID.
 
         :param step_id: the step ID to run
         :param wave_id: the wave ID to run
         :param time: the time limit for the calculation, in minutes
+        :param offset: the number of jobs in the job list file before the array chunk
         :return: a string with the command to run a calculation
         """
-        command = "pyflow run --wave_id {} --step_id \"{}\" --time {}"
-        return command.format(wave_id, step_id, time)
+        command = "pyflow run --wave_id {} --step_id \"{}\" --time {}".format(wave_id, step_id, time)
+        if offset:
+            command += " --offset {}".format(offset)
+        return command
 
     @staticmethod
-    def get_handle_command(step_id: str, wave_id: int) -> str:
+    def get_handle_command(step_id: str, wave_id: int, offset: int = 0) -> str:
         """
         Command used for handling a completed array calculation.
 
         :param step_id: the step ID to handle
         :param wave_id: the wave ID to handle
+        :param offset: the number of jobs in the job list file before the array chunk
         :return: a string with the command for handling the output of a calculation
         """
-        command = "pyflow handle --wave_id {} --step_id \"{}\""
+        command = "pyflow handle --wave_id {} --step_id \"{}\"".format(wave_id, step_id)
+        if offset:
+            command += " --offset {}".format(offset)
+        return command
+
+    @staticmethod
+    def get_submit_chunks_command(step_id: str, wave_id: int, first_chunk: int) -> str:
+        """
+        Command used to submit the remaining array chunks of a wave.
+
+        :param step_id: the step ID of the wave
+        :param wave_id: the wave ID of the wave
+        :param first_chunk: the index of the first array chunk to submit
+        :return: a string with the command for submitting array chunks
+        """
+        command = "pyflow submit_chunks --wave_id {} --step_id \"{}\" --first_chunk {}"
+        return command.format(wave_id, step_id, first_chunk)
+
+    @staticmethod
+    def get_flush_saves_command(step_id: str, wave_id: int) -> str:
+        """
+        Command used for saving the spooled outputs of a completed wave.
+
+        :param step_id: the step ID whose outputs to save
+        :param wave_id: the wave ID whose outputs to save
+        :return: a string with the command for saving outputs
+        """
+        command = "pyflow flush_saves --wave_id {} --step_id \"{}\""
         return command.format(wave_id, step_id)
 
     @staticmethod
@@ -45,3 +76,16 @@ class Commands:
         else:
             command = "pyflow begin --wave_id {} --step_id \"{}\" --attempt_restart"
         return command.format(wave_id, step_id)
+
+    @staticmethod
+    def get_throttle_command(step_id: str, wave_id: int, job_ids: list) -> str:
+        """
+        Command used to adapt the throttle of the arrays of a wave while they run.
+
+        :param step_id: the step ID of the wave
+        :param wave_id: the wave ID of the wave
+        :param job_ids: the job IDs of the arrays
+        :return: a string with the command for adapting the throttle
+        """
+        command = "pyflow throttle --wave_id {} --step_id \"{}\" --job_ids {}"
+        return command.format(wave_id, step_id, ",".join([str(job_id) for job_id in job_ids]))
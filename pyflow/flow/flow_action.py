@@ -14,7 +14,8 @@ class FlowAction:
     """
 
     ACTION_CHOICES = ('begin', 'run', 'handle', 'progress', 'tracker', 'setup',
-                      'g16', 'sbatch', 'update', 'build_config')
+                      'g16', 'sbatch', 'update', 'build_config', 'archive', 'flush_saves', 'ingest',
+                      'submit_chunks', 'throttle')
 
     ACTION_HELP = textwrap.dedent("""
         Actions:
@@ -27,7 +28,12 @@ class FlowAction:
         g16 = write a Gaussian 16 input file
         sbatch = write a Slurm submission script
         update = download the latest Pyflow code from GitHub
-        build_config = create a new workflow configuration""")
+        build_config = create a new workflow configuration
+        archive = pack the completed/failed files of a finished wave into an archive
+        flush_saves = save the spooled outputs of a wave to long-term storage
+        ingest = generate conformers from a SMILES file directly into a workflow
+        submit_chunks = submit the remaining array chunks of a large wave
+        throttle = adapt the number of simultaneously running jobs of a wave""")
 
     def __init__(self):
         """
@@ -173,6 +179,12 @@ class FlowAction:
             required=True,
             help="time limit in minutes")
 
+        parser.add_argument(
+            "-o", "--offset",
+            type=int,
+            default=0,
+            help="the number of jobs in the job list before the array chunk")
+
         args = vars(parser.parse_args(sys.argv[2:]))
 
         FlowRunner.run_array_calc(**args)
@@ -200,6 +212,12 @@ class FlowAction:
             required=True,
             help="the wave ID to run")
 
+        parser.add_argument(
+            "-o", "--offset",
+            type=int,
+            default=0,
+            help="the number of jobs in the job list before the array chunk")
+
         args = vars(parser.parse_args(sys.argv[2:]))
 
         FlowRunner.handle_array_output(**args)
@@ -316,6 +334,183 @@ class FlowAction:
 
         build_config(**args)
 
+    def archive(self) -> None:
+        """
+        Method used to pack the completed and failed files of a finished wave
+        into a single archive.
+
+        :return: None
+        """
+        from pyflow.flow.flow_runner import FlowRunner
+
+        parser = argparse.ArgumentParser(description="Archive the files of a finished wave")
+
+        parser.add_argument(
+            "step_id",
+            type=str,
+            help="the step ID to archive")
+
+        parser.add_argument(
+            "wave_id",
+            type=int,
+            help="the wave ID to archive")
+
+        parser.add_argument(
+            "-t", "--num_threads",
+            type=int,
+            required=False,
+            help="the number of compression threads (defaults to the number of CPUs)")
+
+        args = vars(parser.parse_args(sys.argv[2:]))
+
+        flow_runner = FlowRunner(step_id=args["step_id"], wave_id=args["wave_id"])
+        flow_runner.archive(num_threads=args["num_threads"])
+
+    def flush_saves(self) -> None:
+        """
+        Method used to save the spooled outputs of a wave to long-term storage.
+
+        :return: None
+        """
+        from pyflow.flow.flow_runner import FlowRunner
+
+        parser = argparse.ArgumentParser(description="Save the spooled outputs of a wave")
+
+        parser.add_argument(
+            "-s", "--step_id",
+            type=str,
+            required=True,
+            help="the step ID whose outputs to save")
+
+        parser.add_argument(
+            "-w", "--wave_id",
+            type=int,
+            required=True,
+            help="the wave ID whose outputs to save")
+
+        args = vars(parser.parse_args(sys.argv[2:]))
+
+        flow_runner = FlowRunner(step_id=args["step_id"], wave_id=args["wave_id"])
+        flow_runner.flush_saves()
+
+    def submit_chunks(self) -> None:
+        """
+        Method used to submit the remaining array chunks of a wave which was too
+        large to be submitted at once.
+
+        :return: None
+        """
+        from pyflow.flow.flow_runner import FlowRunner
+
+        parser = argparse.ArgumentParser(description="Submit the remaining array chunks of a wave")
+
+        parser.add_argument(
+            "-s", "--step_id",
+            type=str,
+            required=True,
+            help="the step ID of the wave")
+
+        parser.add_argument(
+            "-w", "--wave_id",
+            type=int,
+            required=True,
+            help="the wave ID of the wave")
+
+        parser.add_argument(
+            "-f", "--first_chunk",
+            type=int,
+            required=True,
+            help="the index of the first array chunk to submit")
+
+        args = vars(parser.parse_args(sys.argv[2:]))
+
+        flow_runner = FlowRunner(step_id=args["step_id"], wave_id=args["wave_id"])
+        flow_runner.submit_array_chunks(first_chunk=args["first_chunk"])
+
+    def throttle(self) -> None:
+        """
+        Method used to adapt the throttle of the arrays of a wave while they run.
+
+        :return: None
+        """
+        from pyflow.flow.flow_runner import FlowRunner
+
+        parser = argparse.ArgumentParser(description="Adapt the throttle of the arrays of a wave")
+
+        parser.add_argument(
+            "-s", "--step_id",
+            type=str,
+            required=True,
+            help="the step ID of the wave")
+
+        parser.add_argument(
+            "-w", "--wave_id",
+            type=int,
+            required=True,
+            help="the wave ID of the wave")
+
+        parser.add_argument(
+            "-j", "--job_ids",
+            type=str,
+            required=True,
+            help="comma-separated job IDs of the arrays")
+
+        args = vars(parser.parse_args(sys.argv[2:]))
+
+        flow_runner = FlowRunner(step_id=args["step_id"], wave_id=args["wave_id"])
+        flow_runner.run_throttle_controller([int(job_id) for job_id in args["job_ids"].split(",")])
+
+    def ingest(self) -> None:
+        """
+        Method used to generate conformers from a file of SMILES strings directly
+        into the ``unopt_pdbs`` directory of a workflow.
+
+        :return: None
+        """
+        from pyflow.flow.ingest import ingest
+
+        parser = argparse.ArgumentParser(description="Ingest a library of molecules into a workflow")
+
+        parser.add_argument(
+            "workflow_dir",
+            type=str,
+            help="the main directory of the workflow")
+
+        parser.add_argument(
+            "-s", "--smiles",
+            type=str,
+            required=True,
+            dest="smiles_file",
+            help="the path to a file with one SMILES string per line")
+
+        parser.add_argument(
+            "-c", "--num_confs",
+            type=int,
+            default=4,
+            help="the number of conformers to generate for each molecule")
+
+        parser.add_argument(
+            "-n", "--num_workers",
+            type=int,
+            default=1,
+            help="the number of processes used to generate conformers")
+
+        parser.add_argument(
+            "-e", "--energy_window",
+            type=float,
+            required=False,
+            help="discard conformers more than this MMFF energy (kcal/mol) above the lowest")
+
+        parser.add_argument(
+            "-r", "--rms_threshold",
+            type=float,
+            required=False,
+            help="discard conformers within this heavy-atom RMSD (Angstroms) of a lower-energy one")
+
+        args = vars(parser.parse_args(sys.argv[2:]))
+
+        ingest(**args)
+
 
 def main():
     FlowAction()
@@ -58,7 +58,7 @@ class FlowConfig:
     |                            | to proceed to the next step                        |                  |
     +----------------------------+----------------------------------------------------+------------------+
     | ``attempt_restart``        | whether to attempt to restart a calculation upon   | ``bool``         |
-    |                            | timeout or failure                                 |                  |
+    |                            | timeout or failure (gaussian16 and gamess only)    |                  |
     +----------------------------+----------------------------------------------------+------------------+
     | ``nproc``                  | number of cores to request through Slurm           | ``int``          |
     +----------------------------+----------------------------------------------------+------------------+
@@ -72,7 +72,24 @@ class FlowConfig:
     +----------------------------+----------------------------------------------------+------------------+
     | ``partition``              | the partition to request for the step              | ``str``          |
     +----------------------------+----------------------------------------------------+------------------+
-    | ``simul_jobs``             | the number of jobs to simultaneously run           | ``int``          |
+    | ``simul_jobs``             | the number of jobs to simultaneously run (split    | ``int``          |
+    |                            | across the array chunks queued at the same time)   |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``max_array_size``         | the ``MaxArraySize`` of the cluster; larger waves  | ``int``          |
+    |                            | are submitted as several array chunks              |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``max_submit_jobs``        | the maximum number of jobs of a wave in the queue  | ``int``          |
+    |                            | at once (e.g., ``MaxSubmitJobs``); the remaining   |                  |
+    |                            | chunks are submitted as earlier chunks finish, and |                  |
+    |                            | the submitter, saver and restarter jobs count      |                  |
+    |                            | towards it (0 disables the limit)                  |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``adaptive_throttle``      | whether to adjust ``simul_jobs`` while the step    | ``bool``         |
+    |                            | runs from the queue state, the idle cores of the   |                  |
+    |                            | partition, and the completion rate                 |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``max_simul_jobs``         | the maximum number of jobs to simultaneously run   | ``int``          |
+    |                            | with ``adaptive_throttle`` (0 for no maximum)      |                  |
     +----------------------------+----------------------------------------------------+------------------+
     | ``save_outputs``           | whether to save the results of a step in           | ``bool``         |
     |                            | /work/lopez/workflows                              |                  |
@@ -84,41 +101,104 @@ class FlowConfig:
     +----------------------------+----------------------------------------------------+------------------+
     | ``multiplicity``           | the multiplicity of the molecules                  | ``int``          |
     +----------------------------+----------------------------------------------------+------------------+
+    | ``shard_depth``            | the number of InChIKey-prefix shard directory      | ``int``          |
+    |                            | levels used to store the files of each wave        |                  |
+    |                            | (0 stores all files in flat directories)           |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``compression``            | the format ("none", "gzip" or "zstd") with which   | ``str``          |
+    |                            | to compress completed output files                 |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``dedup_rmsd``             | the heavy-atom RMSD (in Angstroms) below which two | ``float``        |
+    |                            | optimized conformers of a molecule are considered  |                  |
+    |                            | duplicates before the next step (0 disables)       |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``dedup_energy_tol``       | the maximum energy difference (in eV) between two  | ``float``        |
+    |                            | duplicate conformers                               |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``keep_top_k``             | the maximum number of lowest energy conformers of  | ``int``          |
+    |                            | each molecule passed from a conformer step to this |                  |
+    |                            | step                                               |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``energy_window_ev``       | the energy window (in eV) above the lowest energy  | ``float``        |
+    |                            | conformer within which the ``keep_top_k``          |                  |
+    |                            | conformers are kept (0 disables the window)        |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``use_cache``              | whether to reuse (and store) the results of        | ``bool``         |
+    |                            | identical calculations from the result cache       |                  |
+    |                            | shared by all workflows                            |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``escalate_time``          | the factor by which the time limit of a restarted  | ``float``        |
+    |                            | calculation is multiplied after each timeout       |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``escalate_memory``        | the factor by which the memory of a restarted      | ``float``        |
+    |                            | calculation is multiplied after each memory error  |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``escalate_partition``     | the partition on which calculations with escalated | ``str``          |
+    |                            | resources are restarted ("" keeps ``partition``)   |                  |
+    +----------------------------+----------------------------------------------------+------------------+
+    | ``max_escalations``        | the maximum number of times the time limit (or the | ``int``          |
+    |                            | memory) of a calculation is escalated              |                  |
+    +----------------------------+----------------------------------------------------+------------------+
 
     Supported step parameters specific to certain QC programs are shown below
     (refer to the documentation specific to each QC program for more details on
     valid arguments for each parameter):
 
-    +-------------+----------------------------+---------------------------------------------------+------------------+
-    | QC program  | Parameter                  | Description                                       | Data type        |
-    +=============+============================+===================================================+==================+
-    | gaussian16  | ``route`` *                | the full route for the calculation                | ``str``          |
-    |             +----------------------------+---------------------------------------------------+------------------+
-    |             | ``rwf``                    | whether to save the .rwf file                     | ``bool``         |
-    |             +----------------------------+---------------------------------------------------+------------------+
-    |             | ``chk``                    | whether to save the .chk file                     | ``bool``         |
-    +-------------+----------------------------+---------------------------------------------------+------------------+
-    | gamess      | ``gbasis`` *               | Gaussian basis set specification                  | ``str``          |
-    |             +----------------------------+---------------------------------------------------+------------------+
-    |             | ``runtyp``                 | the type of computation                           | ``str``          |
-    |             |                            | (e.g., energy, gradient, etc.)                    |                  |
-    |             +----------------------------+---------------------------------------------------+------------------+
-    |             | ``dfttyp``                 | DFT functional to use (ab initio if unspecified)  | ``str``          |
-    |             +----------------------------+---------------------------------------------------+------------------+
-    |             | ``maxit``                  | maximum number of SCF iteration cycles            | ``int``          |
-    |             +----------------------------+---------------------------------------------------+------------------+
-    |             | ``opttol``                 | gradient convergence tolerance, in Hartree/Bohr   | ``float``        |
-    |             +----------------------------+---------------------------------------------------+------------------+
-    |             | ``hess``                   | selects the initial Hessian matrix                | ``str``          |
-    |             +----------------------------+---------------------------------------------------+------------------+
-    |             | ``nstep``                  | maximum number of steps to take                   | ``int``          |
-    |             +----------------------------+---------------------------------------------------+------------------+
-    |             | ``idcver``                 | the dispersion correction implementation to use   | ``int``          |
-    +-------------+----------------------------+---------------------------------------------------+------------------+
+    +-------------+------------------------------+---------------------------------------------------+------------------+
+    | QC program  | Parameter                    | Description                                       | Data type        |
+    +=============+==============================+===================================================+==================+
+    | gaussian16  | ``route`` *                  | the full route for the calculation                | ``str``          |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``rwf``                      | whether to save the .rwf file                     | ``bool``         |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``chk``                      | whether to save the .chk file                     | ``bool``         |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``deadline_margin``          | the number of minutes before the time limit at    | ``int``          |
+    |             |                              | which calculations are stopped so that they can   |                  |
+    |             |                              | be restarted from their .chk file (0 disables)    |                  |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``reuse_guess_from_previous``| whether to read the guess (and the geometry) from | ``bool``         |
+    |             |                              | the .chk file of the previous (gaussian16) step,  |                  |
+    |             |                              | which is then kept (and compressed with           |                  |
+    |             |                              | ``compression``)                                  |                  |
+    +-------------+------------------------------+---------------------------------------------------+------------------+
+    | gamess      | ``gbasis`` *                 | Gaussian basis set specification                  | ``str``          |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``runtyp``                   | the type of computation                           | ``str``          |
+    |             |                              | (e.g., energy, gradient, etc.)                    |                  |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``dfttyp``                   | DFT functional to use (ab initio if unspecified)  | ``str``          |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``maxit``                    | maximum number of SCF iteration cycles            | ``int``          |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``opttol``                   | gradient convergence tolerance, in Hartree/Bohr   | ``float``        |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``hess``                     | selects the initial Hessian matrix                | ``str``          |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``nstep``                    | maximum number of steps to take                   | ``int``          |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``idcver``                   | the dispersion correction implementation to use   | ``int``          |
+    +-------------+------------------------------+---------------------------------------------------+------------------+
+    | xtb         | ``gfn``                      | the GFN-xTB parametrization to use                | ``int``          |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``solvent``                  | the ALPB implicit solvent (none if empty)         | ``str``          |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``inline``                   | whether to run the step locally on a process pool | ``bool``         |
+    |             |                              | from ``pyflow begin`` instead of as a Slurm array |                  |
+    |             +------------------------------+---------------------------------------------------+------------------+
+    |             | ``inline_workers``           | the number of local processes for inline steps    | ``int``          |
+    |             |                              | (0 uses as many as the CPUs allow given ``nproc``)|                  |
+    +-------------+------------------------------+---------------------------------------------------+------------------+
     """
 
     # list of supported programs
-    SUPPORTED_PROGRAMS = ["gaussian16", "gamess"]
+    SUPPORTED_PROGRAMS = ["gaussian16", "gamess", "xtb"]
+
+    # list of programs whose failed calculations can be restarted
+    RESTARTABLE_PROGRAMS = ["gaussian16", "gamess"]
+
+    # list of supported output compression formats
+    SUPPORTED_COMPRESSION = ["none", "gzip", "zstd"]
 
     # dict of parameters required in the config file
     REQUIRED_GENERAL_PARAMS = ["initial_step", "steps"]
@@ -148,7 +228,22 @@ class FlowConfig:
                                      "save_output": False,
                                      "partition": "short",
                                      "time_padding": RUN_PARAMS["slurm"]["time_padding"],
-                                     "simul_jobs": 50},
+                                     "simul_jobs": 50,
+                                     "max_array_size": RUN_PARAMS["slurm"]["max_array_size"],
+                                     "max_submit_jobs": RUN_PARAMS["slurm"]["max_submit_jobs"],
+                                     "adaptive_throttle": False,
+                                     "max_simul_jobs": 0,
+                                     "shard_depth": 0,
+                                     "compression": "none",
+                                     "dedup_rmsd": 0.0,
+                                     "dedup_energy_tol": 0.001,
+                                     "keep_top_k": 1,
+                                     "energy_window_ev": 0.0,
+                                     "use_cache": False,
+                                     "escalate_time": 1.5,
+                                     "escalate_memory": 2.0,
+                                     "escalate_partition": "",
+                                     "max_escalations": 2},
                              "gaussian16": {"route": "#p",
                                             "freq": False,
                                             "attempt_restart": False,
@@ -156,7 +251,9 @@ class FlowConfig:
                                             "memory": RUN_PARAMS["gaussian16"]["memory"],
                                             "time": RUN_PARAMS["gaussian16"]["time"],
                                             "rwf": False,
-                                            "chk": False},
+                                            "chk": False,
+                                            "deadline_margin": 0,
+                                            "reuse_guess_from_previous": False},
                              "gamess": {"attempt_restart": False,
                                         "memory": RUN_PARAMS["gamess"]["memory"],
                                         "nproc": RUN_PARAMS["gamess"]["nproc"],
@@ -168,7 +265,15 @@ class FlowConfig:
                                         "opttol": 0.0005,
                                         "hess": "CALC",
                                         "nstep": 400,
-                                        "idcver": 3}}
+                                        "idcver": 3},
+                             "xtb": {"attempt_restart": False,
+                                     "nproc": RUN_PARAMS["xtb"]["nproc"],
+                                     "memory": RUN_PARAMS["xtb"]["memory"],
+                                     "time": RUN_PARAMS["xtb"]["time"],
+                                     "gfn": 2,
+                                     "solvent": "",
+                                     "inline": False,
+                                     "inline_workers": 0}}
 
     def __init__(self, config_file: str, config_id: str):
         """
@@ -268,7 +373,54 @@ class FlowConfig:
                             print("Config error: invalid type for parameter '{}' in step '{}'".format(param, step_id))
                             return False
 
-            return True
+            # ensure that restarts are only attempted for programs which support them
+            if step_config.get("attempt_restart", False) and program not in FlowConfig.RESTARTABLE_PROGRAMS:
+                print("Config error: 'attempt_restart' is not supported for '{}' step '{}'".format(program, step_id))
+                return False
+
+            # ensure that the compression format is supported
+            compression = step_config.get("compression", "none")
+            if compression not in FlowConfig.SUPPORTED_COMPRESSION:
+                print("Config error: unsupported compression '{}' for step '{}'".format(compression, step_id))
+                return False
+
+            # ensure that at least one conformer is kept
+            if step_config.get("keep_top_k", 1) < 1:
+                print("Config error: 'keep_top_k' must be at least 1 for step '{}'".format(step_id))
+                return False
+
+            # ensure that escalation doesn't reduce resources
+            if step_config.get("escalate_time", 1.5) < 1 or step_config.get("escalate_memory", 2.0) < 1:
+                print("Config error: escalation factors must be at least 1 for step '{}'".format(step_id))
+                return False
+
+            # ensure that calculations are stopped before their time limit, but not before they start
+            deadline_margin = step_config.get("deadline_margin", 0)
+            time = step_config.get("time", FlowConfig.SUPPORTED_STEP_PARAMS[program]["time"])
+            if deadline_margin < 0 or (deadline_margin > 0 and deadline_margin >= time):
+                print("Config error: 'deadline_margin' must be between 0 and 'time' for step '{}'".format(step_id))
+                return False
+
+            # ensure that the guess is only reused from a previous Gaussian 16 step
+            if step_config.get("reuse_guess_from_previous", False):
+                prev_programs = [s["program"] for s in config["steps"].values() if step_id in s.get("dependents", [])]
+                if prev_programs != ["gaussian16"]:
+                    print("Config error: 'reuse_guess_from_previous' requires a previous gaussian16 step "
+                          "for step '{}'".format(step_id))
+                    return False
+
+            # ensure that the array chunks hold at least one job
+            if step_config.get("max_array_size", 2) < 2:
+                print("Config error: 'max_array_size' must be at least 2 for step '{}'".format(step_id))
+                return False
+            max_submit_jobs = step_config.get("max_submit_jobs", 0)
+            min_submit_jobs = FlowConfig.get_num_helper_jobs(step_config) + 1
+            if max_submit_jobs != 0 and max_submit_jobs < min_submit_jobs:
+                print("Config error: 'max_submit_jobs' must be 0 or at least {} for step '{}'".format(min_submit_jobs,
+                                                                                                   step_id))
+                return False
+
+        return True
 
     @staticmethod
     def valid_config_file(config_file: Path) -> bool:
@@ -282,6 +434,26 @@ class FlowConfig:
             configs = json.load(f)
         return all([FlowConfig.valid_config(v) for k, v in configs.items()])
 
+    @staticmethod
+    def get_num_helper_jobs(step_config: dict) -> int:
+        """
+        Returns the number of jobs which are queued alongside each batch of array
+        chunks of a step and count against its ``max_submit_jobs`` parameter:
+        the submitter of the next chunks or, after the last chunk, the submitters
+        of the dependent steps, the output saver and the restarter; and, with
+        the ``adaptive_throttle`` parameter, the throttle controller.
+
+        :param step_config: the configuration of the step
+        :return: the number of helper jobs
+        """
+        num_final_jobs = len(step_config.get("dependents", [])) \
+                         + int(step_config.get("save_output", False)) \
+                         + int(step_config.get("attempt_restart", False))
+        num_helper_jobs = max(num_final_jobs, 1)
+        if step_config.get("adaptive_throttle", False):
+            num_helper_jobs += 1
+        return num_helper_jobs
+
     @staticmethod
     def valid_step_id(step_id: str) -> bool:
         """
@@ -322,6 +494,12 @@ class FlowConfig:
                         if param not in step_config:
                             step_config[param] = default_val
 
+        # steps whose guess is reused by a dependent step keep their checkpoint files
+        for step_config in updated_config["steps"].values():
+            for dependent in step_config.get("dependents", []):
+                if updated_config["steps"][dependent].get("reuse_guess_from_previous", False):
+                    step_config["chk"] = True
+
         return updated_config
 
     def get_step(self, step_id: str) -> dict:
@@ -1,27 +1,44 @@
 import json
 import os
 import shutil
+import signal
 import subprocess
 import sys
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from getpass import getuser
 from glob import glob
 from linecache import getline
+from math import ceil
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import grp
+import numpy as np
 from tqdm import tqdm
 
 import pyflow.flow.flow_utils as flow_utils
 from pyflow.flow.commands import Commands
 from pyflow.flow.flow_config import FlowConfig
+from pyflow.flow.slurm_executor import SlurmExecutor
+from pyflow.flow.task_metrics import TaskMetrics
+from pyflow.flow.throttle_controller import ThrottleController
+from pyflow.flow.wave_layout import WaveLayout
+from pyflow.io.file_writer import FileWriter
 from pyflow.io.gamess_writer import GamessWriter
 from pyflow.io.gaussian_writer import GaussianWriter
-from pyflow.io.io_utils import upsearch, find_string
+from pyflow.io.io_utils import upsearch, find_string, compress_file, decompress_file, get_compression
+from pyflow.io.object_store import ObjectStore
+from pyflow.io.result_cache import ResultCache
+from pyflow.io.output_parser import (CHECKPOINT_MARKER, TIMEOUT_MARKER, classify_failure, parse_gamess_output,
+                                     parse_gamess_termination, parse_gaussian_output, parse_gaussian_times,
+                                     parse_xtb_output)
 from pyflow.io.sbatch_writer import SbatchWriter
-from pyflow.mol.mol_utils import get_energy
+from pyflow.io.sidecar import get_sidecar_file, read_sidecar, write_sidecar
+from pyflow.io.wave_archive import WaveArchive
+from pyflow.io.xtb_writer import XtbWriter
+from pyflow.mol.mol_utils import get_energy, get_formatted_geometry, get_pairwise_rmsd
 
 
 class FlowRunner:
@@ -30,25 +47,47 @@ class FlowRunner:
     """
 
     PROGRAM_INFILE_EXTENSIONS = {"gaussian16": "com",
-                                 "gamess": "inp"}
+                                 "gamess": "inp",
+                                 "xtb": "xyz"}
 
     PROGRAM_OUTFILE_EXTENSIONS = {"gaussian16": "log",
-                                  "gamess": "o"}
+                                  "gamess": "o",
+                                  "xtb": "out"}
 
     PROGRAM_OPENBABEL_IN_FORMATS = {"gaussian16": "com",
-                                    "gamess": "inp"}
+                                    "gamess": "inp",
+                                    "xtb": "xyz"}
 
+    # xtb outputs are read through their final-geometry sidecars
     PROGRAM_OPENBABEL_OUT_FORMATS = {"gaussian16": "log",
-                                     "gamess": "gam"}
+                                     "gamess": "gam",
+                                     "xtb": "xyz"}
 
     PROGRAM_INPUT_WRITER = {"gaussian16": GaussianWriter,
-                            "gamess": GamessWriter}
+                            "gamess": GamessWriter,
+                            "xtb": XtbWriter}
 
     PROGRAM_COMMANDS = {"gaussian16": "g16",
-                        "gamess": "rungms"}
+                        "gamess": "rungms",
+                        "xtb": "xtb"}
 
     SAVE_OUTPUT_LOCATION = Path("/work/lopez/workflows")
 
+    SAVE_OUTPUT_OBJECTS = SAVE_OUTPUT_LOCATION / ".objects"
+
+    SAVE_SPOOL_FILENAME = "save_spool.txt"
+
+    RESULT_CACHE_LOCATION = SAVE_OUTPUT_LOCATION / ".cache"
+
+    # file in each restart wave directory with the resource escalation levels of its jobs
+    ESCALATIONS_FILENAME = "escalations.tsv"
+
+    # file in each (non-restart) wave directory with the number of conformers of each molecule set up in the wave
+    CONFORMERS_FILENAME = "conformers.tsv"
+
+    # number of seconds given to Gaussian 16 to exit after being stopped at its deadline
+    DEADLINE_GRACE_PERIOD = 30
+
     def __init__(self,
                  step_id: str,
                  wave_id: int,
@@ -87,6 +126,7 @@ class FlowRunner:
         self.current_step_dir = self.workflow_dir / self.current_step_id
         self.current_wave_dir = self.current_step_dir / "wave_{}_calcs".format(wave_id)
         self.step_program = self.flow_config.get_step(step_id)["program"]
+        self.executor = None
 
     def run(self, show_progress: bool = False, overwrite: bool = True) -> None:
         """
@@ -109,12 +149,299 @@ class FlowRunner:
 
         num_input_files = self._create_job_list_file()
 
-        sbatch_file = self.setup_sbatch_file(array_size=num_input_files)
+        if self.current_step_config.get("inline", False):
+            self.run_inline(num_input_files, show_progress)
+            print("Ran step '{}' inline (wave {})".format(self.current_step_id, self.current_wave_id))
+            self.queue_dependents(None)
+            return None
+
+        if num_input_files == 0:
+            # e.g., all of the calculations were found in the result cache
+            print("No jobs to submit for step '{}' (wave {})".format(self.current_step_id, self.current_wave_id))
+            self.queue_dependents(None)
+            return None
+
+        self.submit_array_chunks(num_input_files)
+
+    def get_array_chunks(self, num_input_files: int) -> List[Tuple[int, int, Tuple[int, int]]]:
+        """
+        Splits the jobs of the current wave into array chunks which respect the
+        ``max_array_size`` and ``max_submit_jobs`` step parameters. Array task IDs
+        must be smaller than ``MaxArraySize``, so each chunk is submitted as the
+        array ``1-size`` and its tasks find their input files in the job list file
+        by adding the offset of the chunk to ``$SLURM_ARRAY_TASK_ID``.
+
+        Jobs with escalated resources (see :meth:`get_escalated_step_config`) are
+        listed after the other jobs of a restart wave and are split into separate
+        chunks for each escalation level.
+
+        :param num_input_files: the number of jobs in the job list file
+        :return: a list of (offset, size, (time level, memory level)) tuples
+        """
+        chunk_size = self.current_step_config["max_array_size"] - 1
+
+        max_submit_jobs = self.current_step_config["max_submit_jobs"]
+        if max_submit_jobs > 0:
+            # leaves room for the jobs which submit the next chunks and adapt the throttle
+            chunk_size = min(chunk_size, max_submit_jobs - self.get_num_helper_jobs())
+
+        chunks = []
+        group_offset = 0
+        for levels, group_size in self.get_escalation_groups(num_input_files):
+            for start in range(0, group_size, chunk_size):
+                chunks.append((group_offset + start, min(chunk_size, group_size - start), levels))
+            group_offset += group_size
+
+        return chunks
+
+    def get_escalation_groups(self, num_input_files: int) -> List[Tuple[Tuple[int, int], int]]:
+        """
+        Groups the consecutive jobs of the job list file which share the same
+        escalation levels.
+
+        :param num_input_files: the number of jobs in the job list file
+        :return: a list of ((time level, memory level), number of jobs) tuples
+        """
+        escalations = self.load_escalations()
+        if not escalations:
+            return [((0, 0), num_input_files)]
+
+        groups = []
+        with (self.current_wave_dir / "input_files.txt").open() as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                levels = escalations.get(Path(line.strip()).name, (0, 0))
+                if groups and groups[-1][0] == levels:
+                    groups[-1][1] += 1
+                else:
+                    groups.append([levels, 1])
+
+        return [(levels, size) for levels, size in groups]
+
+    def submit_array_chunks(self, num_input_files: int = None, first_chunk: int = 0) -> None:
+        """
+        Submits the array chunks of the current wave (see :meth:`get_array_chunks`),
+        starting from ``first_chunk``. If the ``max_submit_jobs`` step parameter
+        doesn't allow all of the chunks to be queued at once, a submitter job which
+        depends on the submitted chunks runs ``pyflow submit_chunks`` to submit the
+        next ones. Once the last chunk is submitted, the dependents of the step
+        are queued with a dependency on all of the chunks in the queue.
+
+        The ``simul_jobs`` step parameter limits the number of running jobs of
+        the whole wave, so it is split across the chunks which are queued at the
+        same time (see :meth:`split_simul_jobs`), and at most ``simul_jobs``
+        chunks are queued at once.
+
+        :param num_input_files: the number of jobs in the job list file (by default, counted from the file)
+        :param first_chunk: the index of the first chunk to submit
+        :return: None
+        """
+        if num_input_files is None:
+            num_input_files = self.get_num_jobs()
+
+        chunks = self.get_array_chunks(num_input_files)
+        max_submit_jobs = self.current_step_config["max_submit_jobs"]
+        simul_jobs = self.current_step_config["simul_jobs"]
+        num_helper_jobs = self.get_num_helper_jobs()
+
+        # determines the chunks which fit in the queue at once
+        last_chunk = first_chunk + 1
+        num_queued_jobs = chunks[first_chunk][1]
+        while last_chunk < len(chunks) and last_chunk - first_chunk < simul_jobs:
+            size = chunks[last_chunk][1]
+            if 0 < max_submit_jobs < num_queued_jobs + size + num_helper_jobs:
+                break
+            num_queued_jobs += size
+            last_chunk += 1
+
+        job_ids = []
+        shares = FlowRunner.split_simul_jobs(simul_jobs, last_chunk - first_chunk)
+        for chunk_id, share in zip(range(first_chunk, last_chunk), shares):
+            offset, size, levels = chunks[chunk_id]
+            chunk_label = chunk_id if len(chunks) > 1 else None
+            sbatch_file = self.setup_sbatch_file(array_size=size, offset=offset, chunk_id=chunk_label, levels=levels,
+                                                 simul_jobs=share)
+            job_ids.append(sbatch_file.submit(self.get_executor()))
+        chunk_id = last_chunk
+
+        job_list = ", ".join([str(job_id) for job_id in job_ids])
+        if len(chunks) > 1:
+            print("Submitted chunks {}-{} (of {}) of step '{}' with job IDs {} (wave {})".format(
+                first_chunk, chunk_id - 1, len(chunks), self.current_step_id, job_list, self.current_wave_id))
+        else:
+            print("Submitted step '{}' with job ID {} (wave {})".format(self.current_step_id, job_list,
+                                                                        self.current_wave_id))
+
+        if self.current_step_config["adaptive_throttle"]:
+            self.queue_throttle_controller(job_ids)
+
+        if chunk_id < len(chunks):
+            self.queue_chunk_submitter(job_ids, chunk_id)
+        else:
+            self.queue_dependents(job_ids)
+
+    @staticmethod
+    def split_simul_jobs(simul_jobs: int, num_chunks: int) -> List[int]:
+        """
+        Splits the ``simul_jobs`` throttle of a wave as evenly as possible across
+        the given number of array chunks which are queued at the same time, so
+        that at most ``simul_jobs`` jobs of the wave run at once.
+
+        :param simul_jobs: the maximum number of simultaneously running jobs of the wave
+        :param num_chunks: the number of array chunks (at most ``simul_jobs``)
+        :return: a list with the throttle of each chunk
+        """
+        share, remainder = divmod(simul_jobs, num_chunks)
+        return [share + 1 if i < remainder else share for i in range(num_chunks)]
+
+    def get_num_helper_jobs(self) -> int:
+        """
+        Returns the number of jobs which are queued alongside each batch of array
+        chunks of the current wave (see :meth:`FlowConfig.get_num_helper_jobs`).
+
+        :return: the number of helper jobs
+        """
+        return FlowConfig.get_num_helper_jobs(self.current_step_config)
+
+    def queue_throttle_controller(self, job_ids: List[int]) -> None:
+        """
+        Submits a job which adapts the throttle of the given arrays while they
+        run (see :meth:`run_throttle_controller`). The job runs for at most the
+        ``throttle_time`` run parameter (in minutes).
+
+        :param job_ids: the job IDs of the submitted array chunks
+        :return: None
+        """
+        sbatch_filename = "{}_wave_{}_throttle_{}.sbatch".format(self.current_step_id, self.current_wave_id,
+                                                                 job_ids[0])
+
+        sbatch_filepath = self.current_step_dir / sbatch_filename
+
+        sbatch_commands = Commands.get_throttle_command(step_id=self.current_step_id,
+                                                        wave_id=self.current_wave_id,
+                                                        job_ids=job_ids)
+
+        jobname = "{}_{}_wave-{}_throttle".format(self.workflow_dir.name, self.current_step_id,
+                                                  self.current_wave_id)
 
-        job_id = sbatch_file.submit()
-        print("Submitted step '{}' with job ID {} (wave {})".format(self.current_step_id, job_id, self.current_wave_id))
+        sbatch_writer = SbatchWriter(jobname=jobname,
+                                     commands=sbatch_commands,
+                                     filepath=sbatch_filepath,
+                                     output="/dev/null",
+                                     error="/dev/null",
+                                     partition=self.current_step_config["partition"],
+                                     time=flow_utils.load_run_params(program="slurm").get("throttle_time", 1440),
+                                     overwrite=True)
+        sbatch_writer.write()
+        sbatch_writer.submit(self.get_executor())
+
+    def run_throttle_controller(self, job_ids: List[int]) -> None:
+        """
+        Adapts the throttle of the given arrays of the current wave until all of
+        their tasks have finished, or until the controller job is about to reach
+        its time limit (see
+        :class:`pyflow.flow.throttle_controller.ThrottleController`).
+
+        :param job_ids: the job IDs of the arrays
+        :return: None
+        """
+        controller = ThrottleController(executor=self.get_executor(),
+                                        job_ids=job_ids,
+                                        partition=self.current_step_config["partition"],
+                                        cores_per_task=self.current_step_config["nproc"],
+                                        throttle=self.current_step_config["simul_jobs"],
+                                        max_throttle=self.current_step_config["max_simul_jobs"])
+        run_params = flow_utils.load_run_params(program="slurm")
+        controller.run(interval=run_params.get("throttle_interval", 300),
+                       max_time=run_params.get("throttle_time", 1440) * 60)
+
+    def queue_chunk_submitter(self, job_ids: List[int], first_chunk: int) -> None:
+        """
+        Submits a job which submits the array chunks of the current wave starting
+        from ``first_chunk`` once the given jobs have finished.
+
+        :param job_ids: the job IDs of the submitted array chunks
+        :param first_chunk: the index of the first chunk to submit
+        :return: None
+        """
+        sbatch_filename = "{}_wave_{}_chunk_{}_submitter.sbatch".format(self.current_step_id, self.current_wave_id,
+                                                                        first_chunk)
+
+        sbatch_filepath = self.current_step_dir / sbatch_filename
+
+        sbatch_commands = Commands.get_submit_chunks_command(step_id=self.current_step_id,
+                                                             wave_id=self.current_wave_id,
+                                                             first_chunk=first_chunk)
 
-        self.queue_dependents(job_id)
+        jobname = "{}_{}_wave-{}_chunk-{}_submitter".format(self.workflow_dir.name, self.current_step_id,
+                                                            self.current_wave_id, first_chunk)
+
+        sbatch_writer = SbatchWriter(jobname=jobname,
+                                     commands=sbatch_commands,
+                                     filepath=sbatch_filepath,
+                                     output="/dev/null",
+                                     error="/dev/null",
+                                     dependency_id=job_ids,
+                                     dependency_type="afterany",
+                                     overwrite=True)
+        sbatch_writer.write()
+        sbatch_writer.submit(self.get_executor())
+
+    def run_inline(self, num_input_files: int, show_progress: bool = False) -> None:
+        """
+        Runs and handles all of the calculations of the current wave locally on a
+        pool of processes instead of submitting them as a Slurm array. This is
+        intended for fast calculations (e.g., xtb) for which the queue wait would
+        dominate the run time. The number of processes is set by the
+        ``inline_workers`` step parameter (if 0, the CPUs available to the
+        process are divided by the ``nproc`` step parameter; see
+        :func:`pyflow.flow.flow_utils.get_available_cpus`).
+
+        :param num_input_files: the number of input files in the job list file
+        :param show_progress: if True, displays a progress bar in the CLI
+        :return: None
+        """
+        num_workers = self.current_step_config.get("inline_workers", 0)
+        if num_workers <= 0:
+            num_workers = max(1, flow_utils.get_available_cpus() // self.current_step_config["nproc"])
+
+        task_ids = range(1, num_input_files + 1)
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = executor.map(FlowRunner._run_inline_calc,
+                                   [self.flow_config] * num_input_files,
+                                   [self.workflow_dir] * num_input_files,
+                                   [self.current_step_id] * num_input_files,
+                                   [self.current_wave_id] * num_input_files,
+                                   task_ids)
+            if show_progress:
+                desc = "Running {} calculations".format(self.current_step_id)
+                results = tqdm(results, total=num_input_files, desc=desc)
+            for _ in results:
+                pass
+
+    @staticmethod
+    def _run_inline_calc(flow_config: FlowConfig, workflow_dir: Path, step_id: str, wave_id: int,
+                         task_id: int) -> None:
+        """
+        Runs and handles the calculation with the given (1-based) task ID of the
+        job list file as part of an inline step.
+
+        :param flow_config: the workflow configuration object
+        :param workflow_dir: the main directory of the workflow
+        :param step_id: the step ID to run
+        :param wave_id: the wave ID to run
+        :param task_id: the line of the job list file to run
+        :return: None
+        """
+        flow_runner = FlowRunner(step_id=step_id, wave_id=wave_id, flow_config=flow_config,
+                                 workflow_dir=workflow_dir)
+        input_file = flow_runner.get_input_file(task_id)
+        try:
+            flow_runner.run_quantum_chem(input_file, flow_runner.current_step_config["time"])
+        except subprocess.TimeoutExpired:
+            flow_runner.record_timeout(input_file)
+        flow_runner.handle_output(input_file)
 
     def is_first_step(self) -> bool:
         """
@@ -134,11 +461,28 @@ class FlowRunner:
         """
         if self.attempt_restart:
             outfile_ext = FlowRunner.PROGRAM_OUTFILE_EXTENSIONS[self.step_program]
-            search_pattern = str(self.current_wave_dir / "failed" / "*.{}".format(outfile_ext))
-            num_failed_jobs = len(glob(search_pattern))
+            layout = self.get_wave_layout()
+            num_failed_jobs = len(layout.glob("*.{}".format(outfile_ext), sub_dir="failed"))
             return num_failed_jobs > 0
         return False
 
+    def get_wave_layout(self, step_id: str = None, wave_dir: Path = None) -> WaveLayout:
+        """
+        Returns the layout of the given wave directory of the given step. If
+        no step ID or wave directory is given, the layout of the current wave
+        directory (``self.current_wave_dir``) is returned.
+
+        :param step_id: the step ID whose ``shard_depth`` parameter to use
+        :param wave_dir: the wave directory
+        :return: a WaveLayout object
+        """
+        if step_id is None:
+            step_id = self.current_step_id
+        if wave_dir is None:
+            wave_dir = self.current_wave_dir
+        shard_depth = self.flow_config.get_step(step_id)["shard_depth"]
+        return WaveLayout(wave_dir, shard_depth=shard_depth)
+
     def setup_wave_dir(self) -> None:
         """
         Creates the current wave's calculation directory, including the
@@ -179,27 +523,31 @@ class FlowRunner:
             source_file_extension = "pdb"
 
             file_pattern = "*.{}".format(source_file_extension)
+
+            structure_files = list(source_structures_path.glob(file_pattern))
         elif not self.attempt_restart:
             # determine the previous step
             prev_step_id = self.get_prev_step_id()
             prev_program = self.flow_config.get_step(prev_step_id)["program"]
 
-            source_structures_path = self.get_prev_step_wave_dir() / "completed"
+            layout = self.get_wave_layout(prev_step_id, self.get_prev_step_wave_dir())
 
             source_file_extension = FlowRunner.PROGRAM_OUTFILE_EXTENSIONS[prev_program]
 
             file_pattern = "*_{}*.{}".format(prev_step_id, source_file_extension)
+
+            structure_files = layout.glob(file_pattern, sub_dir="completed")
         else:
-            source_structures_path = self.get_prev_wave_dir() / "failed"
+            layout = self.get_wave_layout(wave_dir=self.get_prev_wave_dir())
 
             source_file_extension = FlowRunner.PROGRAM_OUTFILE_EXTENSIONS[self.step_program]
 
             file_pattern = "*_{}*.{}".format(self.current_step_id, source_file_extension)
 
-        structure_files = source_structures_path.glob(file_pattern)
+            structure_files = layout.glob(file_pattern, sub_dir="failed")
 
         if not self.is_first_step():
-            structure_files = self.filter_conformers(list(structure_files))
+            structure_files = self.filter_conformers(structure_files)
 
         return structure_files
 
@@ -225,37 +573,56 @@ class FlowRunner:
         prev_wave_dir = self.current_step_dir / "wave_{}_calcs".format(prev_wave_id)
         return prev_wave_dir
 
-    def get_input_filenames(self, structure_files: List[Path], structure_dest: Path) -> List[Tuple[Path, Path]]:
+    def get_input_filenames(self,
+                            structure_files: List[Path],
+                            structure_dest: Path) -> List[Tuple[Path, Path, Optional[Path]]]:
         """
-        Returns a list of 2-tuples where the first element is a Path object to
-        an input file for the next step in the workflow, and the second element
-        is a Path object to the corresponding output file from the previous step.
+        Returns a list of 3-tuples where the first element is a Path object to
+        an input file for the next step in the workflow, the second element is a
+        Path object to the corresponding output file from the previous step, and
+        the third element is a Path object to the checkpoint file of that output
+        file if the current step reuses it (see the ``reuse_guess_from_previous``
+        step parameter), or None otherwise.
+
+        The input files are placed in ``structure_dest`` according to the layout
+        of the current step (see :class:`pyflow.flow.wave_layout.WaveLayout`), and
+        any required shard directories are created.
 
         :param structure_files: a list of output files from the previous step
         :param structure_dest: the destination directory for the new input files
-        :return: a list of 2-tuples of Path objects
+        :return: a list of 3-tuples of Path objects
         """
         input_file_extension = FlowRunner.PROGRAM_INFILE_EXTENSIONS[self.step_program]
 
+        layout = self.get_wave_layout(wave_dir=structure_dest)
+
+        reuse_guess = self.current_step_config.get("reuse_guess_from_previous", False)
+        prev_chk_files = self.get_prev_checkpoint_files() if reuse_guess else set()
+
         input_filenames = []
 
         for structure in structure_files:
             inchi_key = structure.stem.split("_")[0]
 
-            if self.current_step_config["conformers"]:
+            if self.has_conformers(self.current_step_id):
                 conf_id = structure.stem.split("_")[-1]
 
-                input_filename = structure_dest / "{}_{}_{}.{}".format(inchi_key,
-                                                                       self.current_step_id,
-                                                                       conf_id,
-                                                                       input_file_extension)
+                input_filename = "{}_{}_{}.{}".format(inchi_key,
+                                                      self.current_step_id,
+                                                      conf_id,
+                                                      input_file_extension)
             else:
-                input_filename = structure_dest / "{}_{}.{}".format(inchi_key,
-                                                                    self.current_step_id,
-                                                                    input_file_extension)
+                input_filename = "{}_{}.{}".format(inchi_key,
+                                                   self.current_step_id,
+                                                   input_file_extension)
 
-            filename_and_structure = (input_filename, structure)
-            input_filenames.append(filename_and_structure)
+            input_filename = layout.get_path(input_filename, create=True)
+
+            prev_chk_file = structure.with_suffix(".chk")
+            if prev_chk_file not in prev_chk_files:
+                prev_chk_file = None
+
+            input_filenames.append((input_filename, structure, prev_chk_file))
 
         return input_filenames
 
@@ -281,24 +648,39 @@ class FlowRunner:
             input_writer = FlowRunner.PROGRAM_INPUT_WRITER[self.step_program]
 
             input_filenames = self.get_input_filenames(structure_files, structure_dest)
-
-            if show_progress:
-                desc = "Setting up {} input files".format(self.current_step_id)
-                input_filenames = tqdm(input_filenames, desc=desc)
-
-            for f in input_filenames:
-                input_filename = f[0]
-                source_geometry = f[1]
-                inchi_key = input_filename.stem.split("_")[0]
-                unopt_pdb_file = self.get_unopt_pdb_file(inchi_key)
-                input_writer = input_writer.from_config(step_config=self.current_step_config,
-                                                        filepath=input_filename,
-                                                        geometry_file=source_geometry,
-                                                        geometry_format=source_structure_format,
-                                                        smiles_geometry_file=unopt_pdb_file,
-                                                        smiles_geometry_format="pdb",
-                                                        overwrite=overwrite)
-                input_writer.write()
+            input_files = [f[0] for f in input_filenames]
+
+            if self.has_conformers(self.current_step_id):
+                self.write_num_conformers(input_files)
+
+            # input files which read the guess from the checkpoint file of the previous step are
+            # rendered from their own template, as are those whose previous step left no checkpoint
+            groups = [(self.current_step_config, input_filenames)]
+            if self.current_step_config.get("reuse_guess_from_previous", False):
+                reused = [f for f in input_filenames if f[2] is not None]
+                fresh_step_config = dict(self.current_step_config, reuse_guess_from_previous=False)
+                groups = [(self.current_step_config, reused),
+                          (fresh_step_config, [f for f in input_filenames if f[2] is None])]
+                for input_filename, _, prev_chk_file in reused:
+                    self.stage_prev_checkpoint(prev_chk_file, input_filename)
+                print("Reusing the guess of {} of {} calculation(s) of the previous step".format(len(reused),
+                                                                                             len(input_filenames)))
+
+            for step_config, group_filenames in groups:
+                if len(group_filenames) == 0:
+                    continue
+
+                if show_progress:
+                    desc = "Setting up {} input files".format(self.current_step_id)
+                    group_filenames = tqdm(group_filenames, desc=desc)
+
+                # the input files are rendered from a template compiled once for the step
+                records = self._get_input_records(input_writer, group_filenames, source_structure_format)
+                batch = input_writer.write_batch(step_config, records, overwrite=overwrite)
+                print("Set up input files for step '{}': {}".format(self.current_step_id, batch.get_summary()))
+
+            if self.current_step_config["use_cache"]:
+                self.apply_result_cache(input_files)
         else:
             failed_input_files = self.get_prev_wave_failed_input_files()
 
@@ -309,12 +691,266 @@ class FlowRunner:
                 output_file = input_file.with_suffix(".{}".format(output_file_ext))
                 failed_files.append((input_file, output_file))
 
+            prev_wave_dir = self.get_prev_wave_dir()
+            prev_escalations = self.load_escalations(prev_wave_dir)
+            escalations = {}
+            restarted_files = []
+
             for files in failed_files:
                 input_file = files[0]
                 output_file = files[1]
-                if self.update_input_file(input_file, output_file, structure_dest):
-                    input_file.unlink()
-                    output_file.unlink()
+
+                failure = classify_failure(output_file, self.step_program, input_file.with_suffix(".e"))
+                levels = self.escalate(prev_escalations.get(input_file.name, (0, 0)), failure)
+                step_config = self.get_escalated_step_config(levels)
+
+                if self.update_input_file(input_file, output_file, structure_dest, step_config, failure):
+                    input_file.unlink(missing_ok=True)
+                    output_file.unlink(missing_ok=True)
+                    restarted_files.extend([input_file, output_file])
+                    if levels != (0, 0):
+                        escalations[input_file.name] = levels
+
+            # restarted jobs which were archived with their wave are removed from the archive,
+            # so that they aren't found (and restarted) again
+            archive = WaveArchive.get(prev_wave_dir)
+            if archive.exists():
+                archive.remove([f.relative_to(prev_wave_dir).as_posix() for f in restarted_files])
+
+            self.write_escalations(escalations)
+
+    def escalate(self, levels: Tuple[int, int], failure: str) -> Tuple[int, int]:
+        """
+        Raises the given escalation levels according to the given type of failure
+        (see :func:`pyflow.io.output_parser.classify_failure`): a timeout raises
+        the time level and a memory failure raises the memory level, up to the
+        ``max_escalations`` step parameter.
+
+        :param levels: the (time level, memory level) of the failed job
+        :param failure: the type of failure of the job
+        :return: the (time level, memory level) of the restarted job
+        """
+        time_level, memory_level = levels
+        max_escalations = self.current_step_config["max_escalations"]
+
+        if failure == "timeout":
+            time_level = min(time_level + 1, max_escalations)
+        elif failure == "memory":
+            memory_level = min(memory_level + 1, max_escalations)
+
+        return time_level, memory_level
+
+    def get_escalated_step_config(self, levels: Tuple[int, int]) -> dict:
+        """
+        Returns a copy of the current step configuration with its resources
+        escalated to the given levels: the time limit is multiplied by the
+        ``escalate_time`` step parameter for each time level, the memory by the
+        ``escalate_memory`` step parameter for each memory level, and escalated
+        jobs run on the ``escalate_partition`` partition (if set).
+
+        :param levels: the (time level, memory level) of the job
+        :return: the escalated step configuration
+        """
+        step_config = dict(self.current_step_config)
+        time_level, memory_level = levels
+
+        step_config["time"] = int(ceil(step_config["time"] * step_config["escalate_time"] ** time_level))
+        step_config["memory"] = int(ceil(step_config["memory"] * step_config["escalate_memory"] ** memory_level))
+        if levels != (0, 0) and step_config["escalate_partition"]:
+            step_config["partition"] = step_config["escalate_partition"]
+
+        return step_config
+
+    def load_escalations(self, wave_dir: Path = None) -> Dict[str, Tuple[int, int]]:
+        """
+        Loads the escalation levels of the jobs of the given wave (by default, the
+        current wave). Jobs which are not listed run with the resources of the step.
+
+        :param wave_dir: the wave directory
+        :return: a dict mapping input filenames to (time level, memory level) tuples
+        """
+        if wave_dir is None:
+            wave_dir = self.current_wave_dir
+
+        escalations = {}
+        escalations_file = wave_dir / FlowRunner.ESCALATIONS_FILENAME
+        if escalations_file.is_file():
+            with escalations_file.open() as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) == 3:
+                        escalations[fields[0]] = (int(fields[1]), int(fields[2]))
+        return escalations
+
+    def write_escalations(self, escalations: Dict[str, Tuple[int, int]]) -> None:
+        """
+        Writes the escalation levels of the jobs of the current wave.
+
+        :param escalations: a dict mapping input filenames to (time level, memory level) tuples
+        :return: None
+        """
+        escalations_file = self.current_wave_dir / FlowRunner.ESCALATIONS_FILENAME
+        if not escalations:
+            escalations_file.unlink(missing_ok=True)
+            return None
+
+        lines = ["{}\t{}\t{}\n".format(name, *levels) for name, levels in sorted(escalations.items())]
+        FileWriter(escalations_file, "".join(lines), overwrite=True).write()
+
+    def _get_input_records(self,
+                           input_writer: type,
+                           input_filenames: Iterable[Tuple[Path, Path]],
+                           source_structure_format: str) -> Iterator[Tuple[Path, str, int, str]]:
+        """
+        Yields the per-molecule fields of the given input files (see
+        :meth:`pyflow.io.file_writer.AbstractInputFileWriter.write_batch`). The
+        charge of each molecule is determined from its unoptimized PDB file.
+
+        :param input_writer: the input file writer class of the current step
+        :param input_filenames: (input file, source geometry, checkpoint file) tuples from
+                                :meth:`get_input_filenames`
+        :param source_structure_format: the format of the source geometries
+        :return: an iterator of (filepath, title, charge, coordinates) tuples
+        """
+        for input_filename, source_geometry, _ in input_filenames:
+            inchi_key = input_filename.stem.split("_")[0]
+            unopt_pdb_file = self.get_unopt_pdb_file(inchi_key)
+            coordinates, charge = input_writer.load_geometry(source_geometry,
+                                                             source_structure_format,
+                                                             smiles_geometry_file=unopt_pdb_file,
+                                                             smiles_geometry_format="pdb",
+                                                             charge=self.current_step_config["charge"])
+            yield input_filename, input_filename.stem, charge, coordinates
+
+    def get_prev_checkpoint_files(self) -> Set[Path]:
+        """
+        Returns the checkpoint files of the completed calculations of the previous
+        step, listed once for the whole wave (including those in its archive).
+
+        :return: a set of Path objects to the checkpoint files
+        """
+        layout = self.get_wave_layout(self.get_prev_step_id(), self.get_prev_step_wave_dir())
+        return set(layout.glob("*.chk", sub_dir="completed"))
+
+    @staticmethod
+    def get_prev_checkpoint_file(input_file: Path) -> Path:
+        """
+        Returns the path at which the checkpoint file of the previous step is
+        placed for the given Gaussian 16 input file (see :meth:`stage_prev_checkpoint`).
+
+        :param input_file: the input file
+        :return: a Path object to the checkpoint file
+        """
+        return input_file.with_name(GaussianWriter.PREV_CHK_TEMPLATE.format(title=input_file.stem))
+
+    def stage_prev_checkpoint(self, prev_chk_file: Path, input_file: Path, copy: bool = False) -> None:
+        """
+        Places the given checkpoint file of the previous step (or of a failed
+        calculation) next to the given input file, from which the calculation
+        reads its guess with ``%oldchk``. Uncompressed checkpoint files are
+        symlinked, while compressed (or archived) ones are decompressed.
+
+        :param prev_chk_file: the checkpoint file of the previous step
+        :param input_file: the input file which reuses the checkpoint file
+        :param copy: if True, uncompressed checkpoint files are hardlinked or copied instead of symlinked,
+                     so that the staged file outlives the original (e.g., once its wave is archived)
+        :return: None
+        """
+        staged_chk_file = FlowRunner.get_prev_checkpoint_file(input_file)
+        staged_chk_file.unlink(missing_ok=True)
+
+        if prev_chk_file.is_file() and get_compression(prev_chk_file) is None:
+            if not copy:
+                staged_chk_file.symlink_to(prev_chk_file.resolve())
+                return None
+            try:
+                os.link(prev_chk_file, staged_chk_file)
+            except OSError:
+                shutil.copyfile(prev_chk_file, staged_chk_file)
+        else:
+            decompress_file(prev_chk_file, staged_chk_file)
+
+    def is_chk_reused(self) -> bool:
+        """
+        Determines if a dependent step of the current step reads its guess from
+        the checkpoint files of the current step.
+
+        :return: True if the checkpoint files are reused, False otherwise
+        """
+        return any(self.flow_config.get_step(step_id).get("reuse_guess_from_previous", False)
+                   for step_id in self.flow_config.get_dependents(self.current_step_id))
+
+    def get_executor(self) -> SlurmExecutor:
+        """
+        Returns the SlurmExecutor used to submit the jobs of this FlowRunner. The
+        submissions are recorded in the main directory of the workflow.
+
+        :return: a SlurmExecutor object
+        """
+        if self.executor is None:
+            self.executor = SlurmExecutor.from_run_params(state_dir=self.workflow_dir)
+        return self.executor
+
+    def get_result_cache(self) -> ResultCache:
+        """
+        Returns the cache of calculation results shared by all workflows.
+
+        :return: a ResultCache object
+        """
+        return ResultCache(FlowRunner.RESULT_CACHE_LOCATION)
+
+    def apply_result_cache(self, input_files: List[Path]) -> None:
+        """
+        Looks up the given input files in the result cache (see
+        :class:`pyflow.io.result_cache.ResultCache`) and marks the cache hits as
+        completed: the cached output file and its sidecar are placed in the
+        ``completed`` directory along with the input file, so the calculation
+        is not submitted.
+
+        :param input_files: the input files of the current wave
+        :return: None
+        """
+        cache = self.get_result_cache()
+        keys = {f: ResultCache.get_key(f, self.step_program, self.current_step_config) for f in input_files
+                if ResultCache.is_cacheable(f, self.step_program)}
+        hits = cache.lookup(keys.values())
+
+        layout = self.get_wave_layout()
+        out_file_ext = FlowRunner.PROGRAM_OUTFILE_EXTENSIONS[self.step_program]
+
+        num_hits = 0
+        for input_file, key in keys.items():
+            if key not in hits:
+                continue
+
+            output_file = input_file.with_suffix(".{}".format(out_file_ext))
+            completed_dest = layout.get_path(output_file.name, sub_dir="completed", create=True).parent
+            cached_output_file = completed_dest / output_file.name
+
+            cache.restore(hits[key], cached_output_file, completed_dest / get_sidecar_file(output_file).name)
+            os.rename(input_file, completed_dest / input_file.name)
+
+            if self.current_step_config["save_output"]:
+                self.save_output(cached_output_file)
+
+            num_hits += 1
+
+        print("Found {} of {} calculation(s) in the result cache".format(num_hits, len(input_files)))
+
+    def cache_output(self, input_file: Path, output_file: Path) -> None:
+        """
+        Adds the given completed output file (and its sidecar) to the result cache
+        under the key of the given input file.
+
+        :param input_file: the input file of the completed calculation
+        :param output_file: the completed output file
+        :return: None
+        """
+        if not ResultCache.is_cacheable(input_file, self.step_program):
+            return None
+
+        key = ResultCache.get_key(input_file, self.step_program, self.current_step_config)
+        self.get_result_cache().add(key, output_file, get_sidecar_file(output_file))
 
     def get_prev_wave_failed_input_files(self) -> List[Path]:
         """
@@ -322,13 +958,13 @@ class FlowRunner:
 
         :return: a list of Path objects to the previous wave's failed input files
         """
-        input_files_source = self.get_prev_wave_dir() / "failed"
+        layout = self.get_wave_layout(wave_dir=self.get_prev_wave_dir())
 
         input_file_ext = FlowRunner.PROGRAM_INFILE_EXTENSIONS[self.step_program]
 
         file_pattern = "*_{}*.{}".format(self.current_step_id, input_file_ext)
 
-        input_files = [Path(f) for f in input_files_source.glob(file_pattern)]
+        input_files = layout.glob(file_pattern, sub_dir="failed")
 
         return input_files
 
@@ -370,25 +1006,49 @@ class FlowRunner:
         """
         try:
             prev_step_id = self.flow_config.get_previous_step_id(self.current_step_id)
-            return self.flow_config.get_step(prev_step_id)["conformers"] and not \
+            return self.has_conformers(prev_step_id) and not \
                 self.flow_config.get_step(self.current_step_id)["conformers"]
         except ValueError:
             return False
 
+    def has_conformers(self, step_id: str) -> bool:
+        """
+        Determines if the given step runs multiple conformers of each molecule.
+        This is the case for conformer steps and for steps which keep several low
+        energy conformers (see the ``keep_top_k`` step parameter) of a preceding
+        step with conformers.
+
+        :param step_id: the step ID
+        :return: True if the step runs multiple conformers per molecule, False otherwise
+        """
+        step_config = self.flow_config.get_step(step_id)
+        if step_config["conformers"]:
+            return True
+
+        try:
+            prev_step_id = self.flow_config.get_previous_step_id(step_id)
+        except ValueError:
+            return False
+
+        return step_config["keep_top_k"] > 1 and self.has_conformers(prev_step_id)
+
     def filter_conformers(self, source_files: List[Path]) -> List[Path]:
         """
         Filters the conformers based on various workflow step parameters. The
-        list of Path objects is filtered by removing failed conformers and/or by
-        removing all but the lowest energy conformers.
+        list of Path objects is filtered by removing failed conformers, by
+        collapsing duplicate conformers, and/or by removing all but the lowest
+        energy conformers.
 
         :param source_files: a list of Path objects to filter
         :return: a filtered list of Path objects
         """
         prev_step_id = self.get_prev_step_id()
-        if self.flow_config.get_step(prev_step_id)["conformers"]:
+        if self.has_conformers(prev_step_id):
             if not self.is_first_step():
                 if not self.flow_config.get_step(prev_step_id)["proceed_on_failed_conf"]:
                     source_files = self.remove_failed_confs(source_files)
+            if self.flow_config.get_step(prev_step_id)["dedup_rmsd"] > 0:
+                source_files = self.remove_duplicate_confs(source_files)
             if self.need_lowest_energy_confs():
                 source_files = self.get_lowest_energy_confs(source_files)
         return source_files
@@ -396,97 +1056,269 @@ class FlowRunner:
     def remove_failed_confs(self, source_files: List[Path]) -> List[Path]:
         """
         Returns a list of Path objects where the molecules for which all conformers
-        have not successfully completed are removed.
+        have not successfully completed are removed. The number of conformers of
+        each molecule is the number of conformers set up in the previous step (see
+        :meth:`get_prev_step_num_conformers`).
+
+        Conformers which failed in the previous step may complete in one of its
+        restart waves. The conformers of a molecule which completed in the waves
+        of the previous step which ran before the corresponding wave are therefore
+        added to the molecule, so that it proceeds (once) along with the wave in
+        which its last conformer completed.
 
         :param source_files: a list of Path objects from which to remove failed molecules
         :return: a filtered list of Path objects
         """
-        completed_confs = {}
-
+        conf_files = OrderedDict()  # inchi_key: List[source_file]
         for f in source_files:
             inchi_key = f.stem.split("_")[0]
+            conf_files.setdefault(inchi_key, []).append(f)
 
-            if inchi_key not in completed_confs:
-                completed_confs[inchi_key] = 1
+        expected_confs = self.get_prev_step_num_conformers()
+        earlier_confs = None
+
+        filtered_source_files = []
+        for inchi_key, files in conf_files.items():
+            if inchi_key in expected_confs:
+                num_conformers = expected_confs[inchi_key]
             else:
-                completed_confs[inchi_key] += 1
+                num_conformers = flow_utils.get_num_conformers(inchi_key)
+
+            if len(files) < num_conformers:
+                if earlier_confs is None:
+                    earlier_confs = self.get_prev_step_earlier_confs()
+                names = set([f.name for f in files])
+                files = [f for f in earlier_confs.get(inchi_key, []) if f.name not in names] + files
+
+            if len(files) == num_conformers:
+                filtered_source_files.extend(files)
+
+        return filtered_source_files
+
+    def get_prev_step_num_conformers(self) -> dict:
+        """
+        Returns the number of conformers of each molecule that were set up in the
+        previous step, as recorded in its wave directories when their input files
+        were written (see :meth:`write_num_conformers`). Since conformers may be
+        filtered between steps (e.g., by :meth:`remove_duplicate_confs`), this can
+        be smaller than the number of conformers in ``unopt_pdbs``. Restart waves
+        don't set up new conformers, so they don't change the counts.
+
+        :return: a dict mapping InChIKeys to numbers of conformers (empty if no counts were recorded)
+        """
+        num_conformers = {}
+        prev_step_dir = self.workflow_dir / self.get_prev_step_id()
+        for conformers_file in glob(str(prev_step_dir / "wave_*_calcs" / FlowRunner.CONFORMERS_FILENAME)):
+            with open(conformers_file) as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) == 2:
+                        num_conformers[fields[0]] = num_conformers.get(fields[0], 0) + int(fields[1])
+        return num_conformers
+
+    def write_num_conformers(self, input_files: List[Path]) -> None:
+        """
+        Records the number of conformers of each molecule set up in the current
+        wave, including the conformers whose results are then found in the result
+        cache, so that the next step can tell which molecules completed.
+
+        :param input_files: the input files of the current wave
+        :return: None
+        """
+        num_conformers = {}
+        for f in input_files:
+            inchi_key = f.stem.split("_")[0]
+            num_conformers[inchi_key] = num_conformers.get(inchi_key, 0) + 1
 
+        lines = ["{}\t{}\n".format(inchi_key, num) for inchi_key, num in sorted(num_conformers.items())]
+        conformers_file = self.current_wave_dir / FlowRunner.CONFORMERS_FILENAME
+        FileWriter(conformers_file, "".join(lines), overwrite=True).write()
+
+    def get_prev_step_earlier_confs(self) -> Dict[str, List[Path]]:
+        """
+        Returns the completed conformers of the previous step from its waves which
+        ran before the corresponding wave (see :meth:`get_prev_step_wave_dir`).
+
+        :return: a dict mapping InChIKeys to lists of Path objects to completed output files
+        """
+        prev_step_id = self.get_prev_step_id()
+        prev_program = self.flow_config.get_step(prev_step_id)["program"]
+        file_pattern = "*_{}*.{}".format(prev_step_id, FlowRunner.PROGRAM_OUTFILE_EXTENSIONS[prev_program])
+
+        confs = {}
+        for wave_dir in glob(str(self.workflow_dir / prev_step_id / "wave_*_calcs")):
+            wave_dir = Path(wave_dir)
+            if int(wave_dir.name.split("_")[1]) >= self.current_wave_id:
+                continue
+            layout = self.get_wave_layout(prev_step_id, wave_dir)
+            for f in layout.glob(file_pattern, sub_dir="completed"):
+                confs.setdefault(f.stem.split("_")[0], []).append(f)
+        return confs
+
+    def remove_duplicate_confs(self, source_files: List[Path]) -> List[Path]:
+        """
+        Returns a list of Path objects where duplicate conformers are collapsed
+        into a single representative. Two conformers of the same molecule are
+        duplicates if the RMSD between their aligned heavy atoms is below the
+        ``dedup_rmsd`` parameter of the previous step and their energies differ
+        by at most its ``dedup_energy_tol`` parameter (in eV). The lowest energy
+        conformer of each set of duplicates is kept.
+
+        The geometries and energies are read from the final-geometry sidecars of
+        the output files (see :mod:`pyflow.io.sidecar`); conformers without a
+        sidecar are always kept.
+
+        :param source_files: a list of Path objects from which to remove duplicate conformers
+        :return: a filtered list of Path objects
+        """
+        prev_step_id = self.get_prev_step_id()
+        prev_step_config = self.flow_config.get_step(prev_step_id)
+        rmsd_threshold = prev_step_config["dedup_rmsd"]
+        energy_tol = prev_step_config["dedup_energy_tol"]
+
+        confs = {}  # inchi_key: List[(source_file, coordinates, energy)]
         filtered_source_files = []
         for f in source_files:
-            inchi_key = f.stem.split("_")[0]
-            num_conformers = flow_utils.get_num_conformers(inchi_key)
-            if completed_confs[inchi_key] == num_conformers:
+            try:
+                sidecar = read_sidecar(get_sidecar_file(f))
+            except FileNotFoundError:
                 filtered_source_files.append(f)
+                continue
+
+            coordinates = [line.split() for line in sidecar["coordinates"]]
+            heavy_atoms = [[float(i) for i in line[1:4]] for line in coordinates if line[0] != "H"]
+            energy = sidecar["energy"] if sidecar["energy"] is not None else np.inf
+
+            inchi_key = f.stem.split("_")[0]
+            confs.setdefault(inchi_key, []).append((f, heavy_atoms, energy))
+
+        num_duplicates = 0
+        for inchi_key, mol_confs in confs.items():
+            mol_confs.sort(key=lambda x: x[2])
+            energies = np.array([energy for _, _, energy in mol_confs])
+
+            if len(mol_confs) == 1 or len(set(len(c) for _, c, _ in mol_confs)) != 1:
+                filtered_source_files.extend([f for f, _, _ in mol_confs])
+                continue
+
+            rmsd = get_pairwise_rmsd(np.array([c for _, c, _ in mol_confs]))
+            with np.errstate(invalid="ignore"):
+                duplicates = (rmsd < rmsd_threshold) & (np.abs(energies[:, None] - energies[None, :]) <= energy_tol)
+
+            # keep each conformer unless it duplicates a lower energy conformer that was kept
+            kept = []
+            for i in range(len(mol_confs)):
+                if not duplicates[i, kept].any():
+                    kept.append(i)
+
+            num_duplicates += len(mol_confs) - len(kept)
+            filtered_source_files.extend([mol_confs[i][0] for i in kept])
+
+        print("Removed {} duplicate conformer(s)".format(num_duplicates))
 
         return filtered_source_files
 
     def get_lowest_energy_confs(self, source_files: List[Path]) -> List[Path]:
         """
         Returns a list of the lowest energy conformers from the given list of
-        output files.
+        output files. By default, only the lowest energy conformer of each
+        molecule is kept; with the ``keep_top_k`` and ``energy_window_ev``
+        parameters of the current step, up to ``keep_top_k`` conformers of each
+        molecule within ``energy_window_ev`` eV of its lowest energy conformer
+        are kept instead.
 
         :param source_files: list of Path objects
         :return: a list of Path objects to the lowest energy conformers
         """
+        if len(source_files) == 0:
+            return []
 
         prev_step_id = self.get_prev_step_id()
         prev_program = self.flow_config.get_step(prev_step_id)["program"]
-        source_file_ext = FlowRunner.PROGRAM_OUTFILE_EXTENSIONS[prev_program]
+
+        keep_top_k = self.current_step_config["keep_top_k"]
+        energy_window = self.current_step_config["energy_window_ev"]
 
         # compile energies for the conformers
-        uniq_inchi_keys = set()
-        conf_energies = {}  # inchi_key: List[(conf_id, energy)]
-        for f in source_files:
-            stem = f.stem.split("_")
-            inchi_key = stem[0]
-            conf_id = stem[-1]
+        inchi_keys = np.array([f.stem.split("_")[0] for f in source_files])
+        energies = [FlowRunner.get_output_energy(f, prev_program) for f in source_files]
+        energies = np.array([np.inf if e is None else e for e in energies], dtype=float)
 
-            uniq_inchi_keys.add(inchi_key)
+        # sort the conformers by molecule, then by energy
+        _, groups = np.unique(inchi_keys, return_inverse=True)
+        order = np.lexsort((energies, groups))
+        sorted_groups = groups[order]
+        sorted_energies = energies[order]
 
-            energy = get_energy(str(f), format=prev_program)
+        # rank each conformer within its molecule and compare it to the lowest energy conformer
+        group_starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, len(order)])
+        ranks = np.arange(len(order)) - np.repeat(group_starts, group_sizes)
+        min_energies = np.repeat(sorted_energies[group_starts], group_sizes)
 
-            if inchi_key in conf_energies:
-                conf_energies[inchi_key].append((conf_id, energy))
-            else:
-                conf_energies[inchi_key] = [(conf_id, energy)]
-
-        # determine the lowest energy conformers
-        lowest_energy_confs = []
-        for inchi_key, confs in conf_energies.items():
-            sorted_confs = sorted(confs, key=lambda x: x[1])
-            lowest_energy_conf_id = sorted_confs[0][0]
-            lowest_energy_confs.append("{}_{}_{}.{}".format(inchi_key,
-                                                            prev_step_id,
-                                                            lowest_energy_conf_id,
-                                                            source_file_ext))
-
-        lowest_energy_source_files = []
-        for f in source_files:
-            if f.name in lowest_energy_confs:
-                lowest_energy_source_files.append(f)
+        keep = ranks < keep_top_k
+        if energy_window > 0:
+            keep &= (ranks == 0) | (sorted_energies - min_energies <= energy_window)
+
+        kept_indices = np.sort(order[keep])
+
+        return [source_files[i] for i in kept_indices]
+
+    @staticmethod
+    def get_output_energy(output_file: Path, program: str) -> float:
+        """
+        Returns the energy (in eV) of the given output file. The energy is read
+        from the output file's final-geometry sidecar if it exists; otherwise, it
+        is extracted from the output file itself.
 
-        return lowest_energy_source_files
+        :param output_file: the path to the output file
+        :param program: the program which produced the output file
+        :return: an energy in eV
+        """
+        try:
+            energy = read_sidecar(get_sidecar_file(output_file))["energy"]
+        except FileNotFoundError:
+            energy = None
+
+        if energy is None:
+            energy = get_energy(str(output_file), format=program)
 
-    def setup_sbatch_file(self, array_size: int) -> SbatchWriter:
+        return energy
+
+    def setup_sbatch_file(self, array_size: int, offset: int = 0, chunk_id: int = None,
+                          levels: Tuple[int, int] = (0, 0), simul_jobs: int = None) -> SbatchWriter:
         """
         Creates an array sbatch file for the current workflow step and writes
         the sbatch file.
 
+        :param array_size: the number of jobs in the array
+        :param offset: the number of jobs in the job list file before the array
+        :param chunk_id: the index of the array chunk, if the wave is split into chunks
+        :param levels: the escalation levels of the jobs in the array (see :meth:`get_escalated_step_config`)
+        :param simul_jobs: the throttle of the array (by default, the ``simul_jobs`` step parameter)
         :return: an SbatchWriter object
         """
-        sbatch_filename = "{}_wave_{}.sbatch".format(self.current_step_id, self.current_wave_id)
-        sbatch_filepath = self.current_wave_dir / sbatch_filename
-
-        sbatch_commands = self.get_array_commands()
+        step_config = self.get_escalated_step_config(levels)
+        if simul_jobs is not None:
+            step_config["simul_jobs"] = simul_jobs
 
+        sbatch_filename = "{}_wave_{}".format(self.current_step_id, self.current_wave_id)
         jobname = "{}_{}_wave-{}".format(self.workflow_dir.name, self.current_step_id, self.current_wave_id)
+        if chunk_id is not None:
+            sbatch_filename += "_chunk_{}".format(chunk_id)
+            jobname += "_chunk-{}".format(chunk_id)
+
+        sbatch_filepath = self.current_wave_dir / "{}.sbatch".format(sbatch_filename)
 
-        sbatch_writer = SbatchWriter.from_config(step_config=self.current_step_config,
+        sbatch_commands = self.get_array_commands(offset, step_config["time"])
+
+        # from_config consumes the time parameters of the config it's given
+        sbatch_writer = SbatchWriter.from_config(step_config=step_config,
                                                  filepath=sbatch_filepath,
                                                  jobname=jobname,
                                                  array=array_size,
                                                  commands=sbatch_commands,
-                                                 cores=self.current_step_config["nproc"],
+                                                 cores=step_config["nproc"],
                                                  output="%A_%a.o",
                                                  error="%A_%a.e",
                                                  overwrite=True)
@@ -494,19 +1326,26 @@ class FlowRunner:
 
         return sbatch_writer
 
-    def get_array_commands(self) -> str:
+    def get_array_commands(self, offset: int = 0, time: int = None) -> str:
         """
         Retrieves the command strings used to create the Slurm submission script
         for the current step. The commands make calls to ``pyflow`` to both run
         calculations and handle outputs.
 
+        :param offset: the number of jobs in the job list file before the array
+        :param time: the time limit of the calculations in minutes (by default, the ``time`` step parameter)
         :return: a string of commands to run
         """
+        if time is None:
+            time = self.current_step_config["time"]
+
         run_command = Commands.get_run_command(step_id=self.current_step_id,
                                                wave_id=self.current_wave_id,
-                                               time=self.current_step_config["time"])
+                                               time=time,
+                                               offset=offset)
         job_handling = Commands.get_handle_command(step_id=self.current_step_id,
-                                                   wave_id=self.current_wave_id)
+                                                   wave_id=self.current_wave_id,
+                                                   offset=offset)
         commands = [run_command, job_handling]
 
         command_string = "\n".join(commands)
@@ -517,14 +1356,18 @@ class FlowRunner:
         """
         Creates a file named input_files.txt in the current workflow step directory.
         This text file is used by the array submission script to determine which input
-        files to run.
+        files to run. The input files are listed relative to the current wave directory.
 
         :return: the number of jobs in the array
         """
         input_file_extension = FlowRunner.PROGRAM_INFILE_EXTENSIONS[self.step_program]
-        input_files = self.current_wave_dir.glob("*.{}".format(input_file_extension))
-        input_files = [f.name for f in input_files]
-        input_files.sort()
+        layout = self.get_wave_layout()
+        input_files = layout.glob("*.{}".format(input_file_extension))
+        input_files = [layout.get_relative_path(f) for f in input_files]
+
+        # escalated jobs are grouped at the end of the list so that they can run as separate arrays
+        escalations = self.load_escalations()
+        input_files.sort(key=lambda f: (escalations.get(Path(f).name, (0, 0)), f))
         input_files_string = "\n".join(input_files)
         input_files_string += "\n"
 
@@ -534,16 +1377,22 @@ class FlowRunner:
 
         return len(input_files)
 
-    def queue_dependents(self, job_id: int) -> None:
+    def queue_dependents(self, job_ids: Optional[List[int]]) -> None:
         """
         Submits the dependent jobs for the currently running step with ID
-        ``self.current_step_id``. The dependent jobs have a dependency on the
-        given ``job_id``. This method also queues the wave restarter if the
-        ``attempt_restart`` parameter is set to True for the current step.
+        ``self.current_step_id``. The dependent jobs have a dependency on all of
+        the given ``job_ids`` (one per array chunk). This method also queues the
+        wave restarter if the ``attempt_restart`` parameter is set to True for the
+        current step.
 
-        :param job_id: the job ID for the currently running step
+        If ``job_ids`` is None (e.g., for steps run inline), the jobs are submitted
+        without a dependency.
+
+        :param job_ids: the job IDs for the currently running step
         :return: None
         """
+        dependency_type = "afterany" if job_ids else None
+
         dependents = self.flow_config.get_dependents(self.current_step_id)
         for dependent_id in dependents:
             sbatch_filename = "{}_wave_{}_submitter.sbatch".format(dependent_id, self.current_wave_id)
@@ -560,11 +1409,34 @@ class FlowRunner:
                                          filepath=sbatch_filepath,
                                          output="/dev/null",
                                          error="/dev/null",
-                                         dependency_id=job_id,
-                                         dependency_type="afterany",
+                                         dependency_id=job_ids,
+                                         dependency_type=dependency_type,
+                                         overwrite=True)
+            sbatch_writer.write()
+            sbatch_writer.submit(self.get_executor())
+
+        # save output flushing
+        if self.current_step_config["save_output"]:
+            sbatch_filename = "{}_wave_{}_saver.sbatch".format(self.current_step_id, self.current_wave_id)
+
+            sbatch_filepath = self.current_step_dir / sbatch_filename
+
+            sbatch_commands = Commands.get_flush_saves_command(step_id=self.current_step_id,
+                                                               wave_id=self.current_wave_id)
+
+            jobname = "{}_{}_wave-{}_saver".format(self.workflow_dir.name, self.current_step_id,
+                                                   self.current_wave_id)
+
+            sbatch_writer = SbatchWriter(jobname=jobname,
+                                         commands=sbatch_commands,
+                                         filepath=sbatch_filepath,
+                                         output="/dev/null",
+                                         error="/dev/null",
+                                         dependency_id=job_ids,
+                                         dependency_type=dependency_type,
                                          overwrite=True)
             sbatch_writer.write()
-            sbatch_writer.submit()
+            sbatch_writer.submit(self.get_executor())
 
         # restart queueing
         if self.current_step_config["attempt_restart"]:
@@ -584,11 +1456,11 @@ class FlowRunner:
                                          filepath=sbatch_filepath,
                                          output="/dev/null",
                                          error="/dev/null",
-                                         dependency_id=job_id,
-                                         dependency_type="afterany",
+                                         dependency_id=job_ids,
+                                         dependency_type=dependency_type,
                                          overwrite=True)
             sbatch_writer.write()
-            sbatch_writer.submit()
+            sbatch_writer.submit(self.get_executor())
 
     @staticmethod
     def print_slurm_report() -> None:
@@ -613,7 +1485,7 @@ class FlowRunner:
         print(json.dumps({"SLURM_REPORT": info}, indent=4))
 
     @staticmethod
-    def run_array_calc(step_id: str, wave_id: int, time: int = None) -> None:
+    def run_array_calc(step_id: str, wave_id: int, time: int = None, offset: int = 0) -> None:
         """
         Static method for running a calculation as part of an array. This method
         should only be called from within a Slurm array submission script as it
@@ -623,25 +1495,105 @@ class FlowRunner:
         :param step_id: the step ID to run
         :param wave_id: the wave ID to run
         :param time: time limit in minutes
+        :param offset: the number of jobs in the job list file before the array chunk
         :return: None
         """
+        metrics = TaskMetrics("run")
         FlowRunner.print_slurm_report()
         flow_runner = FlowRunner(step_id=step_id, wave_id=wave_id)
-        input_file = flow_runner.get_input_file()
-        flow_runner.run_quantum_chem(input_file, time)
+        input_file = flow_runner.get_input_file(offset=offset)
+        metrics.add(input_file=input_file.name, timed_out=False)
+        metrics.add_queue_wait(flow_runner.get_executor().get_submit_time(os.environ.get("SLURM_ARRAY_JOB_ID")))
+        try:
+            with metrics.timer("qc_wall_time"):
+                flow_runner.run_quantum_chem(input_file, time)
+        except subprocess.TimeoutExpired:
+            print("Calculation {} exceeded its time limit of {} minutes".format(input_file.name, time))
+            flow_runner.record_timeout(input_file)
+            metrics.add(timed_out=True)
+        metrics.add_child_usage()
+        metrics.add(**flow_runner.get_output_metrics(input_file))
+        metrics.write(flow_runner.current_wave_dir)
+
+    def get_output_metrics(self, input_file: Path) -> dict:
+        """
+        Returns the metrics of the output file of the given input file for its
+        task metrics (see :class:`pyflow.flow.task_metrics.TaskMetrics`): the size
+        of the output file and, for Gaussian 16, the CPU and elapsed times which
+        it reports.
+
+        :param input_file: the input file of the calculation
+        :return: a dict of metrics
+        """
+        output_file = self.get_running_output_file(input_file)
+
+        metrics = {"log_size": None}
+        if self.step_program == "gaussian16":
+            metrics.update({"qc_cpu_time": None, "qc_elapsed_time": None})
+
+        if not output_file.is_file():
+            return metrics
+
+        metrics["log_size"] = output_file.stat().st_size
+        if self.step_program == "gaussian16":
+            times = parse_gaussian_times(output_file)
+            metrics.update({"qc_cpu_time": times["cpu_time"], "qc_elapsed_time": times["elapsed_time"]})
+
+        return metrics
+
+    def get_running_output_file(self, input_file: Path) -> Path:
+        """
+        Returns the file to which the calculation of the given input file writes
+        its output while it runs. GAMESS writes to the standard output, i.e., to
+        the Slurm ``.o`` file of the array task, which is only renamed after the
+        input file by :meth:`handle_array_output`.
 
-    def get_input_file(self) -> Path:
+        :param input_file: the input file of the calculation
+        :return: a Path object to the output file
         """
-        Determines the input file to run based on the ``$SLURM_ARRAY_TASK_ID``
-        environment variable.
+        if self.step_program == "gamess" and "SLURM_ARRAY_JOB_ID" in os.environ:
+            return self.current_wave_dir / "{}_{}.o".format(os.environ["SLURM_ARRAY_JOB_ID"],
+                                                            os.environ["SLURM_ARRAY_TASK_ID"])
 
+        out_file_ext = FlowRunner.PROGRAM_OUTFILE_EXTENSIONS[self.step_program]
+        return input_file.with_suffix(".{}".format(out_file_ext))
+
+    def record_timeout(self, input_file: Path) -> None:
+        """
+        Marks the output file of the given input file as killed at its time limit
+        (see :func:`pyflow.io.output_parser.classify_failure`), so that a restart
+        can give the calculation more time.
+
+        :param input_file: the input file of the calculation
+        :return: None
+        """
+        with self.get_running_output_file(input_file).open("a") as f:
+            f.write("\n{}\n".format(TIMEOUT_MARKER))
+
+    def get_input_file(self, task_id: int = None, offset: int = 0) -> Path:
+        """
+        Determines the input file to run based on the given ``task_id`` or, by
+        default, on the ``$SLURM_ARRAY_TASK_ID`` environment variable.
+
+        :param task_id: the (1-based) task ID within the array
+        :param offset: the number of jobs in the job list file before the array (see :meth:`get_array_chunks`)
         :return: a Path object pointing to the input file
         """
-        task_id = int(os.environ["SLURM_ARRAY_TASK_ID"])
+        if task_id is None:
+            task_id = int(os.environ["SLURM_ARRAY_TASK_ID"])
         job_list_file = str(self.current_wave_dir / "input_files.txt")
-        input_file = Path(getline(job_list_file, task_id).strip()).resolve()
+        input_file = (self.current_wave_dir / getline(job_list_file, offset + task_id).strip()).resolve()
         return input_file
 
+    def get_num_jobs(self) -> int:
+        """
+        Counts the jobs in the job list file of the current wave.
+
+        :return: the number of jobs
+        """
+        with (self.current_wave_dir / "input_files.txt").open() as f:
+            return sum(1 for line in f if line.strip())
+
     def run_quantum_chem(self, input_file: Path, time: int = None) -> None:
         """
         Runs a quantum chemistry calculation as a subprocess.
@@ -658,11 +1610,134 @@ class FlowRunner:
         if time is not None:
             time = time * 60
 
+        if self.step_program == "xtb":
+            self.run_xtb(input_file, time, updated_env)
+            return None
+
+        if self.step_program == "gaussian16" and time is not None \
+                and self.current_step_config.get("deadline_margin", 0) > 0:
+            self.run_gaussian(input_file, time, updated_env)
+            return None
+
         process = subprocess.run([qc_command, input_file.name],
                                  timeout=time,
                                  cwd=working_dir,
                                  env=updated_env)
 
+    def run_gaussian(self, input_file: Path, time: int, env: dict) -> None:
+        """
+        Runs a Gaussian 16 calculation which is stopped ``deadline_margin``
+        minutes before its time limit rather than killed at it, so that its
+        checkpoint file is left intact and the calculation can be restarted from
+        it (see :meth:`update_input_file`). Gaussian 16 and its links run in their
+        own process group, which is sent SIGTERM at the deadline and SIGKILL if it
+        hasn't exited within ``DEADLINE_GRACE_PERIOD`` seconds.
+
+        :param input_file: the input file to run
+        :param time: time limit in seconds
+        :param env: the environment variables
+        :return: None
+        :raises subprocess.TimeoutExpired: if the calculation was stopped at its deadline
+        """
+        deadline = max(time - self.current_step_config["deadline_margin"] * 60, 0)
+
+        process = subprocess.Popen([FlowRunner.PROGRAM_COMMANDS["gaussian16"], input_file.name],
+                                   cwd=input_file.parent,
+                                   env=env,
+                                   start_new_session=True)
+        try:
+            process.wait(timeout=deadline)
+            return None
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGTERM)
+
+        try:
+            process.wait(timeout=FlowRunner.DEADLINE_GRACE_PERIOD)
+            stopped = True
+        except subprocess.TimeoutExpired:  # a killed process may leave a partially written checkpoint file
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            stopped = False
+
+        if stopped:
+            self.record_checkpoint(input_file)
+
+        raise subprocess.TimeoutExpired(process.args, deadline)
+
+    def record_checkpoint(self, input_file: Path) -> None:
+        """
+        Records the progress of the given Gaussian 16 calculation, which was
+        stopped at its deadline, in its output file. The calculation is marked as
+        restartable from its checkpoint file (see
+        :meth:`pyflow.flow.gaussian_restarter.GaussianRestarter.has_checkpoint`)
+        if the checkpoint file exists and the calculation has completed at least
+        one optimization step, so that the file holds both a geometry and a
+        converged wavefunction.
+
+        :param input_file: the input file of the calculation
+        :return: None
+        """
+        output_file = input_file.with_suffix(".{}".format(FlowRunner.PROGRAM_OUTFILE_EXTENSIONS["gaussian16"]))
+        chk_file = input_file.with_suffix(".chk")
+        if not output_file.is_file():
+            return None
+
+        num_steps = len(find_string(output_file, "Step number"))
+        if chk_file.is_file() and chk_file.stat().st_size > 0 and num_steps > 0:
+            message = "{} after {} optimization step(s)".format(CHECKPOINT_MARKER, num_steps)
+        else:
+            message = "PyFlow: no usable checkpoint after {} optimization step(s)".format(num_steps)
+        print("Calculation {} stopped at its deadline; {}".format(input_file.name, message))
+
+        with output_file.open("a") as f:
+            f.write("\n{}\n".format(message))
+
+    def run_xtb(self, input_file: Path, time: int, env: dict) -> None:
+        """
+        Runs an xtb calculation in its own scratch directory (see
+        :meth:`get_xtb_scratch_dir`) so that the files written by xtb don't clash
+        with those of other calculations. The output (stdout and stderr) is
+        written to the output file next to the input file.
+
+        :param input_file: the input file to run
+        :param time: time limit in seconds
+        :param env: the environment variables
+        :return: None
+        """
+        charge, uhf = XtbWriter.read_charge_and_uhf(input_file)
+
+        command = [FlowRunner.PROGRAM_COMMANDS["xtb"], str(input_file.resolve()),
+                   "--gfn", str(self.current_step_config["gfn"]),
+                   "--chrg", str(charge),
+                   "--uhf", str(uhf),
+                   "-P", str(self.current_step_config["nproc"])]
+        if self.current_step_config["opt"]:
+            command.append("--opt")
+        if self.current_step_config["solvent"]:
+            command.extend(["--alpb", self.current_step_config["solvent"]])
+
+        scratch_dir = self.get_xtb_scratch_dir(input_file)
+        scratch_dir.mkdir(exist_ok=True)
+
+        output_file = input_file.with_suffix(".{}".format(FlowRunner.PROGRAM_OUTFILE_EXTENSIONS["xtb"]))
+        with output_file.open("w") as f:
+            subprocess.run(command,
+                           timeout=time,
+                           cwd=scratch_dir,
+                           env=env,
+                           stdout=f,
+                           stderr=subprocess.STDOUT)
+
+    @staticmethod
+    def get_xtb_scratch_dir(input_file: Path) -> Path:
+        """
+        Returns the scratch directory in which the given xtb input file is run.
+
+        :param input_file: the xtb input file
+        :return: a Path object to the scratch directory
+        """
+        return input_file.parent / ".{}.xtb".format(input_file.stem)
+
     def _update_qc_environment(self) -> dict:
         """
         Updates the current environment (``os.environ``) by adding additional,
@@ -671,6 +1746,9 @@ class FlowRunner:
         :return: a dict of environment variables
         """
         env = os.environ.copy()
+        if self.step_program == "xtb":
+            env["OMP_NUM_THREADS"] = "{},1".format(self.current_step_config["nproc"])
+            env["OMP_STACKSIZE"] = "1G"
         return env
 
     def is_complete(self, output_file: Path) -> bool:
@@ -690,13 +1768,20 @@ class FlowRunner:
             elif self.current_step_config["single_point"]:
                 return num_matches == 1
         elif self.step_program == "gamess":
-            num_matches = len(find_string(output_filepath, "GAMESS TERMINATED NORMALLY"))
-            return num_matches == sum([self.current_step_config["opt"]])
+            results = parse_gamess_termination(output_filepath)
+            if self.current_step_config["opt"]:
+                return results["normal_termination"] and results["opt_converged"]
+            return results["normal_termination"]
+        elif self.step_program == "xtb":
+            results = parse_xtb_output(output_filepath)
+            if self.current_step_config["opt"]:
+                return results["normal_termination"] and results["opt_converged"]
+            return results["normal_termination"]
         else:
             raise AttributeError("Unknown program: {}".format(self.step_program))
 
     @staticmethod
-    def handle_array_output(step_id: str, wave_id: int) -> None:
+    def handle_array_output(step_id: str, wave_id: int, offset: int = 0) -> None:
         """
         Static method for handling the output of an array calculation in a workflow.
         The method determines if the calculation completed, and moves the input/output
@@ -704,36 +1789,205 @@ class FlowRunner:
 
         :param step_id: the step ID to handle
         :param wave_id: the wave ID to handle
+        :param offset: the number of jobs in the job list file before the array chunk
         :return: None
         """
+        metrics = TaskMetrics("handle")
         flow_runner = FlowRunner(step_id=step_id, wave_id=wave_id)
-        input_file = flow_runner.get_input_file()
+        input_file = flow_runner.get_input_file(offset=offset)
+        metrics.add(input_file=input_file.name)
+
+        with metrics.timer("handle_time"):
+            FlowRunner._rename_array_files(input_file.with_suffix(""))
 
-        in_file_ext = FlowRunner.PROGRAM_INFILE_EXTENSIONS[flow_runner.step_program]
-        out_file_ext = FlowRunner.PROGRAM_OUTFILE_EXTENSIONS[flow_runner.step_program]
+            flow_runner.handle_output(input_file)
 
-        output_file = str(input_file).replace(in_file_ext, out_file_ext)
-        output_file = Path(output_file).resolve()
+        metrics.write(flow_runner.current_wave_dir)
 
-        FlowRunner._rename_array_files(output_file.stem)
+    def handle_output(self, input_file: Path) -> None:
+        """
+        Determines if the calculation of the given input file completed, and moves
+        the input/output files to the completed or failed directory accordingly.
 
-        if flow_runner.is_complete(output_file):
-            completed_dest = flow_runner.current_wave_dir / "completed"
+        :param input_file: a Path object pointing to the input file
+        :return: None
+        """
+        out_file_ext = FlowRunner.PROGRAM_OUTFILE_EXTENSIONS[self.step_program]
 
-            if flow_runner.current_step_config["save_output"]:
-                flow_runner.save_output(output_file)
+        output_file = input_file.with_suffix(".{}".format(out_file_ext))
+
+        layout = self.get_wave_layout()
+
+        job_artifacts = self.get_job_artifacts(input_file)
+
+        # the checkpoint file of the previous step (or of the restarted calculation) is only
+        # needed while the calculation runs
+        if self.step_program == "gaussian16":
+            FlowRunner.get_prev_checkpoint_file(input_file).unlink(missing_ok=True)
+
+        if self.is_complete(output_file):
+            completed_dest = layout.get_path(output_file.name, sub_dir="completed", create=True).parent
+
+            self.write_sidecar(output_file, completed_dest)
+
+            if self.current_step_config["compression"] != "none":
+                compress_file(output_file, self.current_step_config["compression"])
+
+                chk_file = input_file.with_suffix(".chk")
+                if self.step_program == "gaussian16" and chk_file.is_file() and self.is_chk_reused():
+                    compress_file(chk_file, self.current_step_config["compression"])
 
             # move completed input/output files
-            for f in glob("{}*".format(output_file.with_suffix(""))):
-                shutil.move(f, str(completed_dest))
+            FlowRunner._move_files(job_artifacts, completed_dest)
+
+            if self.current_step_config["save_output"]:
+                self.save_output(completed_dest / output_file.name)
 
-            flow_runner.clear_scratch_files(input_file.stem)
+            if self.current_step_config["use_cache"]:
+                self.cache_output(completed_dest / input_file.name, completed_dest / output_file.name)
+
+            self.clear_scratch_files(input_file.stem)
         else:
-            failed_dest = flow_runner.current_wave_dir / "failed"
+            failed_dest = layout.get_path(output_file.name, sub_dir="failed", create=True).parent
 
-            # move completed input/output files
-            for f in glob("{}*".format(output_file.with_suffix(""))):
-                shutil.move(f, str(failed_dest))
+            # move failed input/output files
+            FlowRunner._move_files(job_artifacts, failed_dest)
+
+            if self.step_program == "xtb":
+                self.clear_scratch_files(input_file.stem)
+
+    def write_sidecar(self, output_file: Path, dest: Path) -> None:
+        """
+        Writes the final-geometry sidecar of the given completed output file to
+        the ``dest`` directory. The sidecar holds the final coordinates, the energy,
+        the charge and multiplicity, and the termination status of the calculation
+        so that subsequent steps don't need to parse the full output file (see
+        :mod:`pyflow.io.sidecar`). No sidecar is written if no coordinates can be
+        extracted from the output file.
+
+        :param output_file: a Path object pointing to the completed output file
+        :param dest: the directory in which to write the sidecar
+        :return: None
+        """
+        if self.step_program == "gaussian16":
+            results = parse_gaussian_output(output_file)
+            coordinates = results.pop("coordinates")
+            results.pop("num_normal_terminations")
+        elif self.step_program == "gamess":
+            results = parse_gamess_output(output_file)
+            coordinates = results.pop("coordinates")
+            results = {"energy": results["energy"],
+                       "charge": results["charge"],
+                       "multiplicity": results["multiplicity"]}
+        elif self.step_program == "xtb":
+            # optimized geometries are written by xtb to its scratch directory
+            input_file = output_file.with_suffix(".{}".format(FlowRunner.PROGRAM_INFILE_EXTENSIONS["xtb"]))
+            geometry_file = self.get_xtb_scratch_dir(input_file) / "xtbopt.xyz"
+            if not geometry_file.is_file():
+                geometry_file = input_file
+            with geometry_file.open() as f:
+                coordinates = [line.rstrip("\n") for line in f.readlines()[2:] if line.strip()]
+            charge, uhf = XtbWriter.read_charge_and_uhf(input_file)
+            results = {"energy": parse_xtb_output(output_file)["energy"],
+                       "charge": charge,
+                       "multiplicity": uhf + 1}
+        else:
+            out_format = FlowRunner.PROGRAM_OPENBABEL_OUT_FORMATS[self.step_program]
+            xyz = get_formatted_geometry(str(output_file), output_format="xyz", geometry_format=out_format)
+            coordinates = xyz.strip().split("\n")[2:]
+            results = {"energy": None,
+                       "charge": None,
+                       "multiplicity": None}
+
+        if len(coordinates) == 0:
+            return None
+
+        sidecar_file = dest / get_sidecar_file(output_file).name
+        write_sidecar(sidecar_file,
+                      coordinates,
+                      program=self.step_program,
+                      normal_termination=True,
+                      **results)
+
+    def get_job_artifacts(self, input_file: Path) -> List[Path]:
+        """
+        Returns the exact list of files that may be produced by running the given
+        input file in the current step: the input and output files, the renamed
+        Slurm .o and .e files and, for Gaussian 16, the .chk and .rwf files. Some of
+        these files may not exist (e.g., the .chk file is deleted upon normal
+        termination unless the ``chk`` step parameter is True).
+
+        :param input_file: a Path object pointing to the input file
+        :return: a list of Path objects
+        """
+        out_file_ext = FlowRunner.PROGRAM_OUTFILE_EXTENSIONS[self.step_program]
+
+        artifact_exts = [out_file_ext, "o", "e"]
+        if self.step_program == "gaussian16":
+            artifact_exts.extend(["chk", "rwf"])
+
+        artifacts = [input_file]
+        for ext in artifact_exts:
+            artifact = input_file.with_suffix(".{}".format(ext))
+            if artifact not in artifacts:
+                artifacts.append(artifact)
+
+        return artifacts
+
+    @staticmethod
+    def _move_files(files: List[Path], dest: Path) -> None:
+        """
+        Moves the given files into the ``dest`` directory using ``os.rename``.
+        Files which do not exist are skipped.
+
+        :param files: a list of Path objects to move
+        :param dest: the destination directory
+        :return: None
+        """
+        for f in files:
+            try:
+                os.rename(f, dest / f.name)
+            except FileNotFoundError:
+                continue
+
+    def archive(self, num_threads: int = None) -> None:
+        """
+        Packs the files in the ``completed`` and ``failed`` folders of the current
+        wave into a single wave archive (see :class:`pyflow.io.wave_archive.WaveArchive`)
+        and removes the original files. Archived files remain readable by the
+        workflow, so later steps and restarts can still use them. Archiving an
+        already (partially) archived wave resumes where it stopped.
+
+        :param num_threads: the number of compression threads
+        :return: None
+        """
+        layout = self.get_wave_layout()
+
+        files = []
+        for sub_dir in ["completed", "failed"]:
+            files.extend([f for f in layout.glob("*", sub_dir=sub_dir) if f.is_file()])
+
+        if len(files) == 0:
+            print("No files to archive for wave {} of step '{}'.".format(self.current_wave_id, self.current_step_id))
+            return None
+
+        WaveArchive.get(self.current_wave_dir).add(files, num_threads=num_threads)
+
+        for f in files:
+            f.unlink()
+
+        # remove the emptied shard directories
+        if layout.is_sharded():
+            shard_dirs = set([f.parent for f in files])
+            for shard_dir in sorted(shard_dirs, key=lambda d: len(d.parts), reverse=True):
+                for d in [shard_dir] + list(shard_dir.parents)[:layout.shard_depth - 1]:
+                    try:
+                        d.rmdir()
+                    except OSError:
+                        break
+
+        print("Archived {} files from wave {} of step '{}'.".format(len(files), self.current_wave_id,
+                                                                     self.current_step_id))
 
     def clear_scratch_files(self, filename: str) -> None:
         """
@@ -743,17 +1997,22 @@ class FlowRunner:
         :param filename: the file whose scratch files to remove
         :return: None
         """
-        if self.step_program == "gamess":
+        if self.step_program == "xtb":
+            input_file = self.get_wave_layout().get_path("{}.{}".format(filename,
+                                                                        FlowRunner.PROGRAM_INFILE_EXTENSIONS["xtb"]))
+            shutil.rmtree(self.get_xtb_scratch_dir(input_file), ignore_errors=True)
+        elif self.step_program == "gamess":
             try:
                 scratch_dir = Path(os.environ["SCRATCH"]).resolve()
                 gamess_scr = scratch_dir / "scr"
-                scratch_files = [Path(f) for f in glob(str(gamess_scr / "{}*.*".format(filename)))]
+                scratch_files = [Path(f) for f in glob(str(gamess_scr / "{}.*".format(filename)))]
                 for f in scratch_files:
                     f.unlink()
-            except ValueError:
+            except (KeyError, ValueError):
                 return None
 
-    def update_input_file(self, input_file: Path, output_file: Path, dest: Path) -> bool:
+    def update_input_file(self, input_file: Path, output_file: Path, dest: Path,
+                          step_config: dict = None, failure: str = "error") -> bool:
         """
         Updates the given failed or timed-out ``input_file`` to be restarted. The
         method uses the results in the ``output_file`` to determine how to update
@@ -762,8 +2021,13 @@ class FlowRunner:
         :param input_file: the input file to update
         :param output_file: the failed or timed-out output file
         :param dest: the destination for the updated input file
+        :param step_config: the (escalated) step configuration with which to write the input file
+        :param failure: the type of failure (see :func:`pyflow.io.output_parser.classify_failure`)
         :return: True if the input file has been updated, False otherwise
         """
+        if step_config is None:
+            step_config = self.current_step_config
+
         if self.step_program == "gaussian16":
             from pyflow.flow.gaussian_restarter import GaussianRestarter
             inchi_key = input_file.name.split("_")[0]
@@ -772,12 +2036,27 @@ class FlowRunner:
             restarter = GaussianRestarter(input_file, output_file)
             new_route = restarter.get_new_route()
 
+            # calculations which ran out of memory are rerun from their last geometry with more memory
+            if new_route is None and failure == "memory":
+                new_route = restarter.route
+
             if new_route is not None:
-                new_step_config = dict(self.current_step_config)
-                new_step_config["route"] = new_route
+                # restarted calculations don't read the checkpoint file of the previous step
+                new_step_config = dict(step_config, reuse_guess_from_previous=False)
+                new_step_config["route"] = GaussianWriter.remove_checkpoint_keywords(new_route)
+
+                layout = self.get_wave_layout(wave_dir=dest)
+                new_input_file = layout.get_path(input_file.name, create=True)
+
+                # calculations stopped at their deadline continue from their checkpoint file, which
+                # is staged in the restart wave since the failed wave may be archived before it runs
+                if failure == "timeout" and restarter.has_checkpoint():
+                    self.stage_prev_checkpoint(input_file.with_suffix(".chk"), new_input_file, copy=True)
+                    new_step_config["route"] = GaussianRestarter.restart_from_checkpoint(new_route)
+                    new_step_config["oldchk"] = FlowRunner.get_prev_checkpoint_file(new_input_file).name
 
                 input_writer = GaussianWriter.from_config(step_config=new_step_config,
-                                                          filepath=dest / input_file.name,
+                                                          filepath=new_input_file,
                                                           geometry_file=output_file,
                                                           geometry_format="log",
                                                           smiles_geometry_file=unopt_pdb_file,
@@ -787,6 +2066,20 @@ class FlowRunner:
                 return True
             return False
 
+        elif self.step_program == "gamess":
+            from pyflow.flow.gamess_restarter import GamessRestarter
+            restarter = GamessRestarter(input_file, output_file)
+            new_input = restarter.get_new_input(failure, GamessWriter.get_system_options(step_config))
+
+            if new_input is not None:
+                # GAMESS refuses to run if the scratch files of the failed calculation exist
+                self.clear_scratch_files(input_file.stem)
+
+                layout = self.get_wave_layout(wave_dir=dest)
+                FileWriter(layout.get_path(input_file.name, create=True), new_input, overwrite=True).write()
+                return True
+            return False
+
         else:
             msg = "Restarting '{}' calculations is not yet supported.".format(self.step_program)
             raise NotImplementedError(msg)
@@ -807,12 +2100,12 @@ class FlowRunner:
             f.unlink()
 
     @staticmethod
-    def _rename_array_files(name: str) -> None:
+    def _rename_array_files(name: Path) -> None:
         """
         Renames the .o and .e files corresponding to the current ``$SLURM_ARRAY_JOB_ID``
         and ``$SLURM_ARRAY_TASK_ID`` with the given name.
 
-        :param name: the new name for the array files
+        :param name: the new name (or path, without a suffix) for the array files
         :return: None
         """
         array_id = os.environ["SLURM_ARRAY_JOB_ID"]
@@ -824,14 +2117,54 @@ class FlowRunner:
 
     def save_output(self, output_file: Path) -> None:
         """
-        Creates a copy of the given output file in /work/lopez/workflows.
+        Enqueues the given output file to be saved in /work/lopez/workflows by
+        appending it to the save spool of the current wave. The spooled files are
+        saved in bulk by :meth:`flush_saves`.
 
         :param output_file: the output file to save
         :return: None
         """
+        spool_file = self.current_wave_dir / FlowRunner.SAVE_SPOOL_FILENAME
+        with spool_file.open("a") as f:
+            f.write("{}\n".format(Path(output_file).resolve()))
+
+    def flush_saves(self) -> None:
+        """
+        Saves the output files enqueued by :meth:`save_output` in the current wave
+        to /work/lopez/workflows. The outputs are stored by content hash (see
+        :class:`pyflow.io.object_store.ObjectStore`), so identical outputs (e.g.,
+        from reruns) are only stored once, and each saved output is a hardlink to
+        its stored object. A flush interrupted before completion is resumed by
+        the next flush.
+
+        :return: None
+        """
+        spool_file = self.current_wave_dir / FlowRunner.SAVE_SPOOL_FILENAME
+        flushing_file = spool_file.with_suffix(".flushing")
+
+        # set the spool aside so that outputs enqueued during the flush are kept for the next flush
+        if spool_file.exists() and not flushing_file.exists():
+            os.rename(spool_file, flushing_file)
+
+        if not flushing_file.exists():
+            print("No outputs to save for wave {} of step '{}'.".format(self.current_wave_id, self.current_step_id))
+            return None
+
+        with flushing_file.open() as f:
+            output_files = list(OrderedDict.fromkeys([Path(line.strip()) for line in f if line.strip()]))
+
         workflow_params = flow_utils.load_workflow_params()
         config_file = Path(workflow_params["config_file"])
         config_id = workflow_params["config_id"]
-        dest = FlowRunner.SAVE_OUTPUT_LOCATION / config_file.stem / config_id / self.workflow_dir
+        dest = FlowRunner.SAVE_OUTPUT_LOCATION / config_file.stem / config_id / self.workflow_dir.name
         os.makedirs(dest, exist_ok=True)
-        shutil.copy(str(output_file), str(dest / output_file.name))
+
+        object_store = ObjectStore(FlowRunner.SAVE_OUTPUT_OBJECTS)
+        for output_file in output_files:
+            digest = object_store.put(output_file)
+            object_store.link(digest, dest / output_file.name)
+
+        flushing_file.unlink()
+
+        print("Saved {} outputs from wave {} of step '{}' to {}".format(len(output_files), self.current_wave_id,
+                                                                       self.current_step_id, dest))
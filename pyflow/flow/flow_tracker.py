@@ -9,6 +9,7 @@ from pandas.errors import EmptyDataError
 from tabulate import tabulate
 
 from pyflow.flow.flow_utils import load_workflow_params, WORKFLOW_PARAMS_FILENAME
+from pyflow.flow.wave_layout import WaveLayout
 from pyflow.io.io_utils import upsearch
 
 
@@ -137,10 +138,10 @@ class FlowTracker:
         for step_id in config.get_step_ids():
             step_config = config.get_step(step_id)
 
-            step_dir = workflow_dir / step_id / "wave_*_calcs"
-            completed_dir = step_dir / "completed"
-            failed_dir = step_dir / "failed"
+            wave_layouts = [WaveLayout(wave_dir, shard_depth=step_config["shard_depth"])
+                            for wave_dir in (workflow_dir / step_id).glob("wave_*_calcs")]
             output_file_ext = FlowRunner.PROGRAM_OUTFILE_EXTENSIONS[step_config["program"]]
+            output_file_pattern = "*.{}".format(output_file_ext)
 
             if step_config["conformers"]:
                 num_jobs = num_structures
@@ -148,18 +149,20 @@ class FlowTracker:
                 num_jobs = num_molecules
             total_num_calcs += num_jobs
 
-            num_completed = len(glob(str(completed_dir / "*.{}".format(output_file_ext))))
+            num_completed = sum([len(layout.glob(output_file_pattern, sub_dir="completed"))
+                                 for layout in wave_layouts])
             completion_rate = num_completed / num_jobs
             total_num_completed += num_completed
 
-            num_failed = len(glob(str(failed_dir / "*.{}".format(output_file_ext))))
+            num_failed = sum([len(layout.glob(output_file_pattern, sub_dir="failed"))
+                              for layout in wave_layouts])
             failure_rate = num_failed / num_jobs
 
             num_incomplete = num_jobs - num_completed
             incompletion_rate = num_incomplete / num_jobs
 
             running_jobs = []
-            for f in glob(str(step_dir / "*.{}".format(output_file_ext))):
+            for f in [f for layout in wave_layouts for f in layout.glob(output_file_pattern)]:
                 mtime = datetime.fromtimestamp(os.path.getmtime(f))
                 now = datetime.now()
 
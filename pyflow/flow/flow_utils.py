@@ -1,5 +1,6 @@
 import json
 import os
+from functools import lru_cache
 from glob import glob
 from pathlib import Path
 
@@ -9,6 +10,7 @@ from pyflow.io.io_utils import upsearch
 CONFIG_FILE = "flow_config.json"
 RUN_PARAMS_FILENAME = "run_params.json"
 WORKFLOW_PARAMS_FILENAME = ".params"
+CONFORMER_INDEX_FILENAME = "conformers.idx"
 LONG_TERM_STORAGE = "/work/lopez/workflows/"
 
 
@@ -106,6 +108,24 @@ def get_path_to_pyflow() -> Path:
     return Path(os.environ["PYFLOW"])
 
 
+def get_available_cpus() -> int:
+    """
+    Returns the number of CPUs available to the current process: the CPUs
+    allocated to each task of the Slurm job it runs in (``$SLURM_CPUS_PER_TASK``)
+    or, outside of Slurm, the CPUs the process may be scheduled on. This is
+    usually far fewer than the CPUs of the node (i.e., ``os.cpu_count()``).
+
+    :return: the number of available CPUs
+    """
+    slurm_cpus = os.environ.get("SLURM_CPUS_PER_TASK", "")
+    if slurm_cpus.isdigit():
+        return int(slurm_cpus)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not available on all platforms
+        return os.cpu_count() or 1
+
+
 def get_default_config_file() -> Path:
     """
     Returns a ``Path`` object pointing to the default config file.
@@ -127,15 +147,42 @@ def get_default_params_file() -> Path:
 def get_num_conformers(inchi_key: str) -> int:
     """
     Returns the number of conformers for the molecule with the given InChIKey.
+    Molecules added with ``pyflow ingest`` are looked up in the conformer index
+    of the workflow; otherwise, the conformers in ``unopt_pdbs`` are counted.
 
     :param inchi_key: the InChIKey of the molecule
     :return: the number of conformers
     """
     params_file = upsearch(WORKFLOW_PARAMS_FILENAME)
 
+    conformer_index = load_conformer_index(params_file.parent / "unopt_pdbs")
+    if inchi_key in conformer_index:
+        return conformer_index[inchi_key]
+
     unopt_pdbs = params_file.parent / "unopt_pdbs" / "{}*.pdb".format(inchi_key)
 
     num_conformers = len(glob(str(unopt_pdbs)))
 
     return num_conformers
 
+
+@lru_cache(maxsize=None)
+def load_conformer_index(unopt_pdbs_dir: Path) -> dict:
+    """
+    Loads the conformer index stored in the given ``unopt_pdbs`` directory. Each
+    line of the index holds an InChIKey, its number of conformers, and its SMILES
+    string, separated by tabs.
+
+    :param unopt_pdbs_dir: the ``unopt_pdbs`` directory of a workflow
+    :return: a dict mapping InChIKeys to numbers of conformers
+    """
+    conformer_index = {}
+    index_file = Path(unopt_pdbs_dir) / CONFORMER_INDEX_FILENAME
+    if index_file.is_file():
+        with index_file.open() as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) != 3:  # skip incomplete lines
+                    continue
+                conformer_index[fields[0]] = int(fields[1])
+    return conformer_index
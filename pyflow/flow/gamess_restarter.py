@@ -0,0 +1,188 @@
+import re
+from pathlib import Path
+from typing import List, Optional
+
+from pyflow.io.io_utils import file_exists, open_text
+from pyflow.io.output_parser import ELEMENT_SYMBOLS, parse_gamess_output
+
+
+class GamessRestarter:
+    """
+    Class which sets up failed or timed-out GAMESS calculations to be restarted.
+    The output (``.o``) file is read to determine why the calculation failed and
+    to find its last geometry, and the input file is rewritten accordingly:
+
+    * optimizations which exceeded ``NSTEP`` continue from their last geometry
+      with twice as many steps;
+    * calculations whose SCF didn't converge continue from their last geometry
+      and, for optimizations, recompute the initial Hessian (``HESS=CALC``);
+    * calculations which timed out or ran out of memory continue from their
+      last geometry (with the resources given by the restart wave).
+
+    Calculations which failed for any other reason are not restarted.
+    """
+
+    # fragments of the lines with which GAMESS reports each type of failure
+    NSTEP_FAILURE = "TOO MANY STEPS TAKEN"
+    SCF_FAILURES = ["SCF IS UNCONVERGED", "SCF HAS NOT CONVERGED"]
+    NORMAL_TERMINATION = "EXECUTION OF GAMESS TERMINATED NORMALLY"
+
+    # number of optimization steps taken by GAMESS if NSTEP isn't given
+    DEFAULT_NSTEP = 20
+
+    def __init__(self, input_file: Path, output_file: Path):
+        """
+        Constructs a GamessRestarter for the given failed calculation.
+
+        :param input_file: the input file of the calculation
+        :param output_file: the output file of the calculation
+        """
+        self.input_file = Path(input_file)
+        self.output_file = Path(output_file)
+
+    def get_failure_reason(self, failure: str = "error") -> Optional[str]:
+        """
+        Determines why the calculation failed: ``"nstep"`` (too many optimization
+        steps), ``"scf"`` (SCF convergence failure), or the given ``failure`` if it
+        is ``"timeout"`` or ``"memory"`` (see
+        :func:`pyflow.io.output_parser.classify_failure`).
+
+        :param failure: the type of failure of the calculation
+        :return: the reason of the failure, or None if the calculation can't be restarted
+        """
+        if not file_exists(self.output_file):
+            return None
+
+        nstep_failure = False
+        scf_failure = False
+        with open_text(self.output_file) as f:
+            for line in f:
+                if GamessRestarter.NSTEP_FAILURE in line:
+                    nstep_failure = True
+                elif any(fragment in line for fragment in GamessRestarter.SCF_FAILURES):
+                    scf_failure = True
+
+        if nstep_failure:
+            return "nstep"
+        elif scf_failure:
+            return "scf"
+        elif failure in ("timeout", "memory"):
+            return failure
+        return None
+
+    def get_new_input(self, failure: str = "error", system_options: dict = None) -> Optional[str]:
+        """
+        Returns the text of the input file with which to restart the calculation.
+
+        :param failure: the type of failure of the calculation
+        :param system_options: options of the ``$SYSTEM`` group to set (e.g., escalated ``MWORDS`` and ``TIMLIM``)
+        :return: the text of the new input file, or None if the calculation can't be restarted
+        """
+        reason = self.get_failure_reason(failure)
+        if reason is None:
+            return None
+
+        with open_text(self.input_file) as f:
+            text = f.read()
+
+        # the last optimization step or, if there is none, the input geometry
+        geometry = parse_gamess_output(self.output_file)["coordinates"]
+        if geometry:
+            text = GamessRestarter.set_geometry(text, geometry)
+
+        statpt_options = {}
+        if reason == "nstep":
+            nstep = GamessRestarter.get_option(text, "STATPT", "NSTEP")
+            statpt_options["NSTEP"] = 2 * int(nstep or GamessRestarter.DEFAULT_NSTEP)
+        elif reason == "scf" and (GamessRestarter.get_option(text, "CONTRL", "RUNTYP") or "").upper() == "OPTIMIZE":
+            statpt_options["HESS"] = "CALC"
+        if statpt_options:
+            text = GamessRestarter.set_options(text, "STATPT", statpt_options)
+
+        if system_options:
+            text = GamessRestarter.set_options(text, "SYSTEM", system_options)
+
+        return text
+
+    @staticmethod
+    def _find_group(text: str, group: str) -> Optional[re.Match]:
+        """
+        Finds the given group (e.g., ``STATPT``) in the text of an input file.
+        """
+        pattern = r"\$" + group + r"\b(.*?)\$END"
+        return re.search(pattern, text, flags=re.IGNORECASE | re.DOTALL)
+
+    @staticmethod
+    def get_option(text: str, group: str, option: str) -> Optional[str]:
+        """
+        Returns the value of the given option of a group in the text of an input file.
+
+        :param text: the text of the input file
+        :param group: the name of the group (e.g., ``STATPT``)
+        :param option: the name of the option (e.g., ``NSTEP``)
+        :return: the value of the option, or None if it isn't set
+        """
+        match = GamessRestarter._find_group(text, group)
+        if match is None:
+            return None
+        for token in match.group(1).split():
+            name, _, value = token.partition("=")
+            if name.upper() == option.upper():
+                return value
+        return None
+
+    @staticmethod
+    def set_options(text: str, group: str, options: dict) -> str:
+        """
+        Sets the given options of a group in the text of an input file. The group
+        is added before the ``$DATA`` group if it doesn't exist.
+
+        :param text: the text of the input file
+        :param group: the name of the group (e.g., ``STATPT``)
+        :param options: a dict mapping option names to their new values
+        :return: the new text of the input file
+        """
+        options = {name.upper(): value for name, value in options.items()}
+
+        match = GamessRestarter._find_group(text, group)
+        tokens = [] if match is None else match.group(1).split()
+
+        new_tokens = []
+        for token in tokens:
+            name = token.partition("=")[0].upper()
+            if name not in options:
+                new_tokens.append(token)
+        new_tokens.extend(["{}={}".format(name, value) for name, value in options.items()])
+
+        group_text = " ".join(["${}".format(group.upper())] + new_tokens + ["$END"])
+        if match is not None:
+            return text[:match.start()] + group_text + text[match.end():]
+
+        data_match = GamessRestarter._find_group(text, "DATA")
+        start = text.rfind("\n", 0, data_match.start()) + 1 if data_match is not None else 0
+        return text[:start] + " {}\n".format(group_text) + text[start:]
+
+    @staticmethod
+    def set_geometry(text: str, geometry: List[str]) -> str:
+        """
+        Replaces the atoms of the ``$DATA`` group in the text of an input file,
+        keeping its title and symmetry lines.
+
+        :param text: the text of the input file
+        :param geometry: a list of XYZ lines (element symbol and coordinates in Angstroms)
+        :return: the new text of the input file
+        """
+        match = GamessRestarter._find_group(text, "DATA")
+        if match is None:
+            return text
+
+        # the group starts with the rest of the $DATA line, the title line and the symmetry line
+        data_lines = match.group(1).split("\n")
+        header = data_lines[:3]
+
+        atoms = []
+        for line in geometry:
+            symbol, x, y, z = line.split()
+            atoms.append("{:<2} {:5.1f} {:>14} {:>14} {:>14}".format(symbol, ELEMENT_SYMBOLS.index(symbol), x, y, z))
+
+        return text[:match.start(1)] + "\n".join(header + atoms) + "\n " + text[match.end(1):]
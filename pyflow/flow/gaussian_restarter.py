@@ -5,7 +5,9 @@ from typing import List
 
 import numpy as np
 
-from pyflow.io.io_utils import find_string
+from pyflow.io.gaussian_writer import GaussianWriter
+from pyflow.io.io_utils import file_exists, find_string, open_text
+from pyflow.io.output_parser import CHECKPOINT_MARKER
 
 
 class GaussianRestarter:
@@ -125,13 +127,27 @@ class GaussianRestarter:
 
         return new_route
 
+    # determines if the given job was stopped before its time limit with a checkpoint file to restart from
+    def has_checkpoint(self) -> bool:
+        chk_file = self.input_file.with_suffix(".chk")
+        if not file_exists(chk_file) or (chk_file.is_file() and chk_file.stat().st_size == 0):
+            return False
+        return len(find_string(self.output_file, CHECKPOINT_MARKER)) > 0
+
+    # sets up a job to be restarted from the geometry and wavefunction in its checkpoint file
+    @staticmethod
+    def restart_from_checkpoint(route: str) -> str:
+        if route.startswith("# Restart"):  # frequency restarts read the rwf file instead
+            return route
+        return GaussianWriter.get_checkpoint_route(route)
+
     # sets up a frequency calculation to be restarted
     def restart_freq(self) -> str:
         return "# Restart"
 
     # Removes the rwf files associated with the given log file
     def clear_gau_files(self):
-        with self.output_file.open() as f:
+        with open_text(self.output_file) as f:
             p_id = None
             inp_id = None
             for line in f:
@@ -153,7 +169,7 @@ class GaussianRestarter:
                 os.remove(f)
 
     def get_new_route(self):
-        if not self.output_file.exists():
+        if not file_exists(self.output_file):
             return None
 
         if self.needs_restart() and not self.error_fail():
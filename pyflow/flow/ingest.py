@@ -0,0 +1,131 @@
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+from pyflow.flow.flow_utils import CONFORMER_INDEX_FILENAME, load_conformer_index
+
+
+def ingest(workflow_dir: str, smiles_file: str, num_confs: int = 4, num_workers: int = 1,
+           energy_window: float = None, rms_threshold: float = None) -> None:
+    """
+    Generates conformers for the molecules in the given SMILES file and writes
+    them directly to the ``unopt_pdbs`` directory of the given workflow.
+
+    The SMILES file is streamed, so memory usage does not depend on its size.
+    Each molecule is recorded in the conformer index of the workflow (see
+    :func:`pyflow.flow.flow_utils.load_conformer_index`) once all of its
+    conformers have been written, and molecules that are already in the index
+    are skipped. An interrupted ingestion can therefore be resumed by running
+    the same command again.
+
+    :param workflow_dir: the main directory of the workflow
+    :param smiles_file: a file with one SMILES string per line
+    :param num_confs: the number of conformers to generate for each molecule
+    :param num_workers: the number of processes used to generate conformers
+    :param energy_window: discard conformers more than this MMFF energy (kcal/mol) above the lowest
+    :param rms_threshold: discard conformers within this heavy-atom RMSD (Angstroms) of a lower-energy one
+    :return: None
+    :raises FileNotFoundError: if the workflow has no ``unopt_pdbs`` directory
+    """
+    from tqdm import tqdm
+
+    from pyflow.mol.pymolgen import get_threads_per_worker, imap_unordered
+
+    unopt_pdbs = Path(workflow_dir).resolve() / "unopt_pdbs"
+    if not unopt_pdbs.is_dir():
+        message = "Unable to find {}; ensure that the workflow has been set up.".format(unopt_pdbs)
+        raise FileNotFoundError(message)
+
+    indexed_keys = set(load_conformer_index(unopt_pdbs))
+
+    # conformers left on disk by molecules which were never indexed (e.g., from
+    # an interrupted ingestion) are replaced if those molecules are ingested again
+    unindexed_files = {}
+    for f in unopt_pdbs.glob("*.pdb"):
+        inchi_key = f.stem.split("_")[0]
+        if inchi_key not in indexed_keys:
+            unindexed_files.setdefault(inchi_key, []).append(f.name)
+
+    num_threads = get_threads_per_worker(num_workers)
+    counts = {"invalid": 0, "skipped": 0}
+
+    def get_tasks() -> Iterator[Tuple]:
+        for smiles, inchi_key in _read_smiles(smiles_file, counts):
+            if inchi_key in indexed_keys:
+                counts["skipped"] += 1
+                continue
+            indexed_keys.add(inchi_key)  # also skips duplicates within the file
+            stale_files = unindexed_files.pop(inchi_key, [])
+            yield (smiles, inchi_key, str(unopt_pdbs), num_confs, num_threads, stale_files,
+                   energy_window, rms_threshold)
+
+    num_ingested = 0
+    num_failed = 0
+    with (unopt_pdbs / CONFORMER_INDEX_FILENAME).open("a") as index_file:
+        results = imap_unordered(_ingest_molecule, get_tasks(), num_workers)
+        for smiles, inchi_key, num_written_confs in tqdm(results, desc="Ingesting molecules..."):
+            if num_written_confs == 0:
+                num_failed += 1
+                continue
+            index_file.write("{}\t{}\t{}\n".format(inchi_key, num_written_confs, smiles))
+            index_file.flush()
+            num_ingested += 1
+
+    load_conformer_index.cache_clear()
+
+    print("Ingested {} molecule(s) into {}".format(num_ingested, unopt_pdbs))
+    print("Skipped {} molecule(s) already in the workflow".format(counts["skipped"]))
+    print("Skipped {} invalid SMILES string(s)".format(counts["invalid"]))
+    print("Failed to generate conformers for {} molecule(s)".format(num_failed))
+
+
+def _read_smiles(smiles_file: str, counts: dict) -> Iterator[Tuple[str, str]]:
+    """
+    Reads the given SMILES file line by line and yields the valid SMILES strings
+    with their InChIKeys. Invalid SMILES strings are counted in ``counts["invalid"]``.
+
+    :param smiles_file: a file with one SMILES string per line
+    :param counts: a dict of counters to update
+    :return: an iterator of (SMILES string, InChIKey) tuples
+    """
+    from rdkit import Chem
+
+    with open(smiles_file) as f:
+        for line in f:
+            smiles = line.strip()
+            if not smiles:
+                continue
+
+            mol = Chem.MolFromSmiles(smiles)
+            if mol is None:
+                counts["invalid"] += 1
+                continue
+
+            yield smiles, Chem.InchiToInchiKey(Chem.MolToInchi(mol))
+
+
+def _ingest_molecule(smiles: str, inchi_key: str, out_folder: str, num_confs: int, num_threads: int,
+                     stale_files: List[str], energy_window: float = None,
+                     rms_threshold: float = None) -> Tuple[str, str, int]:
+    """
+    Removes the given stale conformer files and generates new conformers for the
+    given molecule.
+
+    :param smiles: the SMILES string of the molecule
+    :param inchi_key: the InChIKey of the molecule
+    :param out_folder: the directory in which to write the conformers
+    :param num_confs: the number of conformers to generate
+    :param num_threads: the number of threads used by RDKit (0 for all available threads)
+    :param stale_files: the names of previously written conformer files to remove
+    :param energy_window: the MMFF energy window (kcal/mol) used to prune conformers
+    :param rms_threshold: the RMSD threshold (Angstroms) used to prune conformers
+    :return: a 3-tuple with the SMILES string, the InChIKey, and the number of written conformers
+    """
+    from pyflow.mol.pymolgen import embed_molecule
+
+    for filename in stale_files:
+        (Path(out_folder) / filename).unlink(missing_ok=True)
+
+    _, num_written_confs, _ = embed_molecule(smiles, out_folder, num_confs, num_threads,
+                                             energy_window, rms_threshold)
+
+    return smiles, inchi_key, num_written_confs
@@ -0,0 +1,586 @@
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import os
+import re
+import subprocess
+import time
+from getpass import getuser
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pyflow.flow.flow_utils import load_run_params
+
+
+class SubmissionError(Exception):
+    """
+    Raised when a Slurm submission fails permanently (e.g., because of an
+    invalid partition) or keeps failing after all retries.
+    """
+    pass
+
+
+class SlurmExecutor:
+    """
+    Class for submitting Slurm jobs. Submissions are retried with exponential
+    backoff on transient errors (e.g., a busy controller or a job submission
+    limit), are spaced by a minimum interval shared by all processes of the
+    user, and are held while the queue has no room for them (see
+    :meth:`wait_for_headroom`). Before a submission whose reply timed out is
+    retried, the queue is checked for a job it may have created anyway.
+
+    If a ``state_dir`` is given, each submission made from within a Slurm job
+    (e.g., a step submitter) is recorded in its ``.submissions`` file, keyed by
+    the submitted script and the ID of the submitting job. A submitter which is
+    requeued by Slurm therefore gets back the job IDs of its earlier
+    submissions instead of submitting them again.
+
+    The executor also queries and updates running arrays for the adaptive
+    throttle (see :class:`pyflow.flow.throttle_controller.ThrottleController`).
+
+    The ``sbatch``, ``squeue``, ``sinfo`` and ``scontrol`` commands can be
+    replaced (e.g., by scripts which mimic them for testing) through the
+    ``sbatch_command``, ``squeue_command``, ``sinfo_command`` and
+    ``scontrol_command`` run parameters.
+    """
+
+    SUBMISSIONS_FILENAME = ".submissions"
+
+    # file with the submission time of each submitted job (see get_submit_time)
+    SUBMIT_TIMES_FILENAME = ".submit_times"
+
+    # file which serializes and spaces the submissions of all processes of the user
+    RATE_LIMIT_FILE = Path.home() / ".pyflow_submit.lock"
+
+    # number of seconds for which a queue occupancy query is reused
+    QUEUE_QUERY_TTL = 30
+
+    # fragments of sbatch errors which are worth retrying
+    TRANSIENT_ERRORS = ["socket timed out", "unable to contact slurm controller", "temporarily unavailable",
+                        "try again", "connection refused", "connection timed out", "zero bytes were transmitted",
+                        "slurm_persist_conn", "job submit limit", "maxsubmit", "qosmaxsubmitjob",
+                        "assocmaxsubmitjob", "too many pending jobs"]
+
+    # fragments of sbatch errors after which the submission may have reached the controller anyway
+    TIMEOUT_ERRORS = ["socket timed out", "connection timed out", "zero bytes were transmitted"]
+
+    # number of seconds by which the clock of the controller may lag behind, when matching
+    # queued jobs against the start of a submission
+    SUBMIT_TIME_SLACK = 60
+
+    JOB_ID_PATTERN = re.compile(r"Submitted batch job (\d+)")
+
+    def __init__(self,
+                 state_dir: Path = None,
+                 sbatch_command: str = "sbatch",
+                 squeue_command: str = "squeue",
+                 sinfo_command: str = "sinfo",
+                 scontrol_command: str = "scontrol",
+                 submit_retries: int = 5,
+                 submit_backoff: float = 10,
+                 submit_interval: float = 1,
+                 max_queued_jobs: int = 0,
+                 queue_hold_time: float = 3600):
+        """
+        Constructs a SlurmExecutor.
+
+        :param state_dir: the directory in which submissions are recorded (None to not record them)
+        :param sbatch_command: the command used to submit jobs
+        :param squeue_command: the command used to query the queue
+        :param sinfo_command: the command used to query the partitions
+        :param scontrol_command: the command used to update running jobs
+        :param submit_retries: the number of times a failed submission is retried
+        :param submit_backoff: the delay (in seconds) before the first retry, doubled for each retry
+        :param submit_interval: the minimum time (in seconds) between two submissions of the user
+        :param max_queued_jobs: the number of jobs the user may have in the queue (0 for no limit)
+        :param queue_hold_time: the maximum time (in seconds) a submission is held waiting for headroom
+        """
+        self.state_dir = Path(state_dir) if state_dir is not None else None
+        self.sbatch_command = sbatch_command
+        self.squeue_command = squeue_command
+        self.sinfo_command = sinfo_command
+        self.scontrol_command = scontrol_command
+        self.submit_retries = submit_retries
+        self.submit_backoff = submit_backoff
+        self.submit_interval = submit_interval
+        self.max_queued_jobs = max_queued_jobs
+        self.queue_hold_time = queue_hold_time
+        self._submissions = None
+        self._queued_jobs = None
+        self._queue_query_time = 0.0
+
+    @classmethod
+    def from_run_params(cls, state_dir: Path = None) -> SlurmExecutor:
+        """
+        Constructs a SlurmExecutor from the ``"slurm"`` block of the run parameters.
+
+        :param state_dir: the directory in which submissions are recorded
+        :return: a SlurmExecutor object
+        """
+        params = load_run_params(program="slurm")
+        return cls(state_dir=state_dir,
+                   sbatch_command=params.get("sbatch_command", "sbatch"),
+                   squeue_command=params.get("squeue_command", "squeue"),
+                   sinfo_command=params.get("sinfo_command", "sinfo"),
+                   scontrol_command=params.get("scontrol_command", "scontrol"),
+                   submit_retries=params.get("submit_retries", 5),
+                   submit_backoff=params.get("submit_backoff", 10),
+                   submit_interval=params.get("submit_interval", 1),
+                   max_queued_jobs=params.get("max_queued_jobs", 0),
+                   queue_hold_time=params.get("queue_hold_time", 3600))
+
+    def submit(self, sbatch_file: Path, num_jobs: int = 1) -> int:
+        """
+        Submits the given sbatch file, unless it was already submitted by the
+        current Slurm job, and returns the job ID.
+
+        :param sbatch_file: the path to the sbatch file
+        :param num_jobs: the number of jobs (e.g., array tasks) the submission adds to the queue
+        :return: the job ID of the submitted job
+        :raises SubmissionError: if the submission fails permanently or keeps failing
+        """
+        sbatch_file = Path(sbatch_file).resolve()
+        key = self.get_submission_key(sbatch_file)
+
+        if key is not None and key in self.get_submissions():
+            return self.get_submissions()[key]
+
+        self.wait_for_headroom(num_jobs)
+
+        job_id = None
+        error = None
+        submit_start = time.time()
+        for attempt in range(self.submit_retries + 1):
+            if attempt > 0:
+                time.sleep(self.submit_backoff * 2 ** (attempt - 1))
+
+                # a submission which timed out may have reached the controller anyway
+                if SlurmExecutor.is_timeout(error):
+                    job_id = self.find_job(SlurmExecutor.get_jobname(sbatch_file), submitted_after=submit_start)
+                    if job_id is not None:
+                        break
+
+            try:
+                job_id = self._run_sbatch(sbatch_file)
+                break
+            except SubmissionError as e:
+                error = str(e)
+                if not SlurmExecutor.is_transient(error) or attempt == self.submit_retries:
+                    raise
+                print("Submission of {} failed ({}); retrying".format(sbatch_file.name, error.strip()))
+
+        if self._queued_jobs is not None:
+            self._queued_jobs += num_jobs
+
+        if key is not None:
+            self._record_submission(key, job_id)
+        self._record_submit_time(job_id)
+
+        return job_id
+
+    def _run_sbatch(self, sbatch_file: Path) -> int:
+        """
+        Runs ``sbatch`` on the given file, waiting for the minimum interval since
+        the last submission of the user.
+        """
+        SlurmExecutor.RATE_LIMIT_FILE.touch(exist_ok=True)
+        with SlurmExecutor.RATE_LIMIT_FILE.open("r+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                try:
+                    last_submission = float(f.read().strip() or 0)
+                except ValueError:  # e.g., a file truncated by a crashed process
+                    last_submission = 0
+                delay = last_submission + self.submit_interval - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+                try:
+                    process = subprocess.run([self.sbatch_command, str(sbatch_file)], capture_output=True,
+                                             text=True, cwd=sbatch_file.parent, timeout=300)
+                except subprocess.TimeoutExpired:
+                    raise SubmissionError("socket timed out waiting for sbatch")
+                finally:
+                    f.seek(0)
+                    f.truncate()
+                    f.write(str(time.time()))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        match = SlurmExecutor.JOB_ID_PATTERN.search(process.stdout)
+        if process.returncode != 0 or match is None:
+            raise SubmissionError(process.stderr or process.stdout)
+
+        return int(match.group(1))
+
+    @staticmethod
+    def is_transient(error: str) -> bool:
+        """
+        Determines if the given sbatch error is transient (i.e., worth retrying).
+
+        :param error: the error message
+        :return: True if the error is transient, False otherwise
+        """
+        error = error.lower()
+        return any(fragment in error for fragment in SlurmExecutor.TRANSIENT_ERRORS)
+
+    @staticmethod
+    def is_timeout(error: Optional[str]) -> bool:
+        """
+        Determines if the given sbatch error leaves it unknown whether the job
+        was submitted (e.g., a timed out reply from the controller).
+
+        :param error: the error message
+        :return: True if the job may have been submitted, False otherwise
+        """
+        if not error:
+            return False
+        error = error.lower()
+        return any(fragment in error for fragment in SlurmExecutor.TIMEOUT_ERRORS)
+
+    def get_queued_jobs(self) -> Optional[int]:
+        """
+        Returns the number of jobs (counting each array task) the user has in the
+        queue. The queue is queried at most once every ``QUEUE_QUERY_TTL``
+        seconds, and jobs submitted in the meantime are added to the result.
+
+        :return: the number of queued jobs, or None if the queue can't be queried
+        """
+        if self._queued_jobs is None or time.time() - self._queue_query_time > SlurmExecutor.QUEUE_QUERY_TTL:
+            try:
+                process = subprocess.run([self.squeue_command, "-h", "-r", "-u", getuser(), "-o", "%i"],
+                                         capture_output=True, text=True, timeout=120)
+            except (OSError, subprocess.TimeoutExpired):
+                return None
+            if process.returncode != 0:
+                return None
+
+            self._queued_jobs = len(process.stdout.split())
+            self._queue_query_time = time.time()
+
+        return self._queued_jobs
+
+    def wait_for_headroom(self, num_jobs: int) -> None:
+        """
+        Holds until the user has room in the queue for the given number of jobs
+        (according to the ``max_queued_jobs`` run parameter), or until the
+        ``queue_hold_time`` has passed. Submissions larger than the limit itself
+        only wait for an empty queue.
+
+        :param num_jobs: the number of jobs to be submitted
+        :return: None
+        """
+        if self.max_queued_jobs <= 0:
+            return None
+
+        num_jobs = min(num_jobs, self.max_queued_jobs)
+        deadline = time.time() + self.queue_hold_time
+        delay = self.submit_backoff
+
+        while True:
+            queued_jobs = self.get_queued_jobs()
+            if queued_jobs is None or queued_jobs + num_jobs <= self.max_queued_jobs or time.time() >= deadline:
+                return None
+
+            print("Waiting for room in the queue ({} of {} jobs queued)".format(queued_jobs, self.max_queued_jobs))
+            time.sleep(min(delay, max(deadline - time.time(), 0)))
+            delay = min(delay * 2, SlurmExecutor.QUEUE_QUERY_TTL * 10)
+            self._queued_jobs = None
+
+    def find_job(self, jobname: Optional[str], submitted_after: float = None) -> Optional[int]:
+        """
+        Looks for a queued job of the user with the given name. Jobs submitted
+        before ``submitted_after`` (e.g., by an earlier run of the same wave) are
+        ignored, allowing for ``SUBMIT_TIME_SLACK`` seconds of clock skew.
+
+        :param jobname: the name of the job
+        :param submitted_after: the earliest submission time (seconds since the epoch) of the job
+        :return: the job ID of the job, or None if there is no such job
+        """
+        if not jobname:
+            return None
+
+        try:
+            process = subprocess.run([self.squeue_command, "-h", "-u", getuser(), "-n", jobname, "-o", "%F %V"],
+                                     capture_output=True, text=True, timeout=120)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if process.returncode != 0:
+            return None
+
+        job_ids = []
+        for line in process.stdout.splitlines():
+            fields = line.split()
+            if len(fields) != 2 or not fields[0].isdigit():
+                continue
+            if submitted_after is not None:
+                try:
+                    submit_time = time.mktime(time.strptime(fields[1], "%Y-%m-%dT%H:%M:%S"))
+                except ValueError:
+                    continue
+                if submit_time < submitted_after - SlurmExecutor.SUBMIT_TIME_SLACK:
+                    continue
+            job_ids.append(int(fields[0]))
+
+        return max(job_ids) if job_ids else None
+
+    def get_array_tasks(self, job_ids: List[int]) -> Optional[List[Tuple[int, str, str]]]:
+        """
+        Returns the array, the state and the reason of each queued task of the
+        given arrays, using a single ``squeue`` query.
+
+        :param job_ids: the job IDs of the arrays
+        :return: a list of (job ID, state, reason) tuples (e.g., ``(123, "PENDING", "Priority")``),
+                 or None if the queue can't be queried
+        """
+        job_list = ",".join([str(job_id) for job_id in job_ids])
+        try:
+            process = subprocess.run([self.squeue_command, "-h", "-r", "-j", job_list, "-o", "%F %T %r"],
+                                     capture_output=True, text=True, timeout=120)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+
+        # squeue fails once none of the jobs are known to the controller anymore
+        if process.returncode != 0:
+            return [] if "invalid job id" in process.stderr.lower() else None
+
+        tasks = []
+        for line in process.stdout.splitlines():
+            fields = line.split(None, 2)
+            if len(fields) >= 2 and fields[0].isdigit():
+                tasks.append((int(fields[0]), fields[1], fields[2].strip() if len(fields) > 2 else ""))
+        return tasks
+
+    def get_idle_cores(self, partition: str) -> Optional[int]:
+        """
+        Returns the number of idle cores in the given partition.
+
+        :param partition: the name of the partition
+        :return: the number of idle cores, or None if the partition can't be queried
+        """
+        try:
+            process = subprocess.run([self.sinfo_command, "-h", "-p", partition, "-o", "%C"],
+                                     capture_output=True, text=True, timeout=120)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if process.returncode != 0:
+            return None
+
+        # each line is formatted as allocated/idle/other/total
+        idle_cores = 0
+        for line in process.stdout.split():
+            fields = line.split("/")
+            if len(fields) != 4 or not fields[1].isdigit():
+                return None
+            idle_cores += int(fields[1])
+        return idle_cores
+
+    def set_array_throttle(self, job_id: int, throttle: int) -> bool:
+        """
+        Updates the maximum number of simultaneously running tasks of the given array.
+
+        :param job_id: the job ID of the array
+        :param throttle: the new maximum number of running tasks
+        :return: True if the array was updated, False otherwise
+        """
+        return self._run_scontrol("update", "JobId={}".format(job_id), "ArrayTaskThrottle={}".format(throttle))
+
+    def hold_job(self, job_id: int) -> bool:
+        """
+        Holds the pending tasks of the given job or array.
+
+        :param job_id: the job ID
+        :return: True if the job was held, False otherwise
+        """
+        return self._run_scontrol("hold", str(job_id))
+
+    def release_job(self, job_id: int) -> bool:
+        """
+        Releases the held tasks of the given job or array.
+
+        :param job_id: the job ID
+        :return: True if the job was released, False otherwise
+        """
+        return self._run_scontrol("release", str(job_id))
+
+    def _run_scontrol(self, *args: str) -> bool:
+        """
+        Runs ``scontrol`` with the given arguments.
+        """
+        try:
+            process = subprocess.run([self.scontrol_command] + list(args), capture_output=True, text=True,
+                                     timeout=120)
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+        return process.returncode == 0
+
+    @staticmethod
+    def get_jobname(sbatch_file: Path) -> Optional[str]:
+        """
+        Reads the job name from the ``#SBATCH -J`` line of the given sbatch file.
+
+        :param sbatch_file: the path to the sbatch file
+        :return: the job name, or None if the file doesn't set one
+        """
+        with Path(sbatch_file).open() as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3 and fields[0] == "#SBATCH" and fields[1] in ("-J", "--job-name"):
+                    return fields[2]
+        return None
+
+    def get_submission_key(self, sbatch_file: Path) -> Optional[str]:
+        """
+        Computes the key under which the submission of the given sbatch file is
+        recorded: a hash of the path and contents of the file, and of the ID of
+        the Slurm job making the submission. Submissions made outside of Slurm
+        jobs (e.g., by ``pyflow begin`` on a login node) aren't recorded.
+
+        :param sbatch_file: the path to the sbatch file
+        :return: the hexadecimal key, or None if the submission isn't recorded
+        """
+        submitting_job_id = os.environ.get("SLURM_JOB_ID")
+        if self.state_dir is None or submitting_job_id is None:
+            return None
+
+        sha = hashlib.sha256()
+        sha.update(str(sbatch_file).encode())
+        sha.update(Path(sbatch_file).read_bytes())
+        sha.update(submitting_job_id.encode())
+        return sha.hexdigest()
+
+    def get_submissions(self) -> Dict[str, int]:
+        """
+        Returns the recorded submissions, loading them if necessary.
+
+        :return: a dict mapping submission keys to job IDs
+        """
+        if self._submissions is None:
+            self._submissions = {}
+            submissions_file = self.state_dir / SlurmExecutor.SUBMISSIONS_FILENAME
+            if submissions_file.is_file():
+                with submissions_file.open() as f:
+                    for line in f:
+                        fields = line.split()
+                        if len(fields) == 2 and fields[1].isdigit():
+                            self._submissions[fields[0]] = int(fields[1])
+        return self._submissions
+
+    def _record_submission(self, key: str, job_id: int) -> None:
+        """
+        Appends the given submission to the ``.submissions`` file.
+        """
+        with (self.state_dir / SlurmExecutor.SUBMISSIONS_FILENAME).open("a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write("{}\t{}\n".format(key, job_id))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        self.get_submissions()[key] = job_id
+
+    def _record_submit_time(self, job_id: int) -> None:
+        """
+        Appends the current time as the submission time of the given job to the
+        ``.submit_times`` file.
+        """
+        if self.state_dir is None:
+            return None
+
+        with (self.state_dir / SlurmExecutor.SUBMIT_TIMES_FILENAME).open("a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write("{}\t{:.3f}\n".format(job_id, time.time()))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get_submit_time(self, job_id: int) -> Optional[float]:
+        """
+        Returns the time at which the given job was submitted through this
+        workflow (e.g., to compute the time which its tasks waited in the queue).
+
+        :param job_id: the ID of the job
+        :return: the submission time (seconds since the epoch), or None if it wasn't recorded
+        """
+        if self.state_dir is None:
+            return None
+
+        submit_times_file = self.state_dir / SlurmExecutor.SUBMIT_TIMES_FILENAME
+        if not submit_times_file.is_file():
+            return None
+
+        submit_time = None
+        with submit_times_file.open() as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 2 and fields[0] == str(job_id):
+                    submit_time = float(fields[1])
+        return submit_time
+
+
+class LocalExecutor(SlurmExecutor):
+    """
+    In-memory stand-in for :class:`SlurmExecutor` which runs nothing. Submitted
+    arrays start with all of their tasks pending; the state of their tasks and
+    of the partition are set directly (see :meth:`set_tasks`), and throttle
+    updates and holds are recorded. This makes it possible to exercise
+    submission logic and the adaptive throttle without a cluster.
+    """
+
+    def __init__(self, idle_cores: int = 0, **kwargs):
+        """
+        Constructs a LocalExecutor.
+
+        :param idle_cores: the number of idle cores reported for every partition
+        :param kwargs: keyword arguments passed to :class:`SlurmExecutor`
+        """
+        super().__init__(**kwargs)
+        self.idle_cores = idle_cores
+        self.next_job_id = 1
+        self.tasks = {}  # type: Dict[int, List[Tuple[int, str, str]]]
+        self.throttles = {}  # type: Dict[int, int]
+        self.throttle_updates = []  # type: List[Tuple[int, int]]
+        self.held_job_ids = set()
+
+    def submit(self, sbatch_file: Path, num_jobs: int = 1) -> int:
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        self.tasks[job_id] = [(job_id, "PENDING", "Priority")] * num_jobs
+        return job_id
+
+    def set_tasks(self, job_id: int, running: int = 0, pending: int = 0, reason: str = "Priority") -> None:
+        """
+        Sets the numbers of running and pending tasks of the given array.
+
+        :param job_id: the job ID of the array
+        :param running: the number of running tasks
+        :param pending: the number of pending tasks
+        :param reason: the reason for which the pending tasks are pending
+        :return: None
+        """
+        self.tasks[job_id] = [(job_id, "RUNNING", "None")] * running + [(job_id, "PENDING", reason)] * pending
+
+    def get_queued_jobs(self) -> Optional[int]:
+        return sum(len(tasks) for tasks in self.tasks.values())
+
+    def get_array_tasks(self, job_ids: List[int]) -> Optional[List[Tuple[int, str, str]]]:
+        return [task for job_id in job_ids for task in self.tasks.get(job_id, [])]
+
+    def get_idle_cores(self, partition: str) -> Optional[int]:
+        return self.idle_cores
+
+    def set_array_throttle(self, job_id: int, throttle: int) -> bool:
+        self.throttles[job_id] = throttle
+        self.throttle_updates.append((job_id, throttle))
+        return True
+
+    def hold_job(self, job_id: int) -> bool:
+        self.held_job_ids.add(job_id)
+        return True
+
+    def release_job(self, job_id: int) -> bool:
+        self.held_job_ids.discard(job_id)
+        return True
@@ -0,0 +1,141 @@
+import fcntl
+import json
+import os
+import resource
+import socket
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+
+class TaskMetrics:
+    """
+    Class which collects the performance metrics of a task of an array (i.e.,
+    of ``pyflow run`` or ``pyflow handle``) and appends them as a single JSON
+    line to the ``metrics.jsonl`` file of its wave. Each record holds:
+
+    - ``phase``: ``"run"`` or ``"handle"``
+    - ``input_file``: the name of the input file of the task
+    - ``job_id``, ``array_job_id``, ``array_task_id``, ``node``: the Slurm job of the task
+    - ``start``: the time (seconds since the epoch) at which the process started
+    - ``startup_time``: the seconds between the start of the process and the
+      start of the task (i.e., Python startup and imports)
+    - ``queue_wait``: the seconds between the submission of the array and the start
+      of the task (``run`` only)
+
+    and, depending on the phase, other metrics (e.g., ``qc_wall_time``,
+    ``child_cpu_time``, ``child_max_rss_kb`` and ``log_size`` for ``run``, and
+    ``handle_time`` for ``handle``). Metrics which can't be determined are null.
+    """
+
+    METRICS_FILENAME = "metrics.jsonl"
+
+    def __init__(self, phase: str):
+        """
+        Constructs a TaskMetrics object for the current process, recording how
+        long the process took to start.
+
+        :param phase: the phase of the task ("run" or "handle")
+        """
+        now = time.time()
+        process_start = TaskMetrics.get_process_start_time()
+
+        self.record = OrderedDict([("phase", phase),
+                                   ("input_file", None),
+                                   ("job_id", os.environ.get("SLURM_JOB_ID")),
+                                   ("array_job_id", os.environ.get("SLURM_ARRAY_JOB_ID")),
+                                   ("array_task_id", os.environ.get("SLURM_ARRAY_TASK_ID")),
+                                   ("node", os.environ.get("SLURMD_NODENAME", socket.gethostname())),
+                                   ("start", process_start or now),
+                                   ("startup_time", None if process_start is None else now - process_start),
+                                   ("queue_wait", None)])
+
+    @staticmethod
+    def get_process_start_time() -> Optional[float]:
+        """
+        Returns the time at which the current process started, from ``/proc``.
+
+        :return: the start time (seconds since the epoch), or None if it can't be determined
+        """
+        try:
+            with open("/proc/self/stat") as f:
+                # the command name (field 2) may contain spaces, so fields are counted after it
+                start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+            with open("/proc/stat") as f:
+                boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        except (OSError, IndexError, ValueError, StopIteration):
+            return None
+
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+
+    def add(self, **metrics) -> None:
+        """
+        Adds the given metrics to the record.
+
+        :param metrics: the metrics to add
+        :return: None
+        """
+        self.record.update(metrics)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """
+        Context manager which records the number of seconds spent in its block
+        under the given name, even if the block raises an exception.
+
+        :param name: the name of the metric
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record[name] = time.time() - start
+
+    def add_queue_wait(self, submit_time: Optional[float]) -> None:
+        """
+        Records the time which the task waited in the queue: from the given
+        submission time of its array to the start of the task (``$SLURM_JOB_START_TIME``
+        if Slurm provides it, or the start of the process otherwise).
+
+        :param submit_time: the time at which the array was submitted (seconds since the epoch)
+        :return: None
+        """
+        if submit_time is None:
+            return None
+
+        start = float(os.environ.get("SLURM_JOB_START_TIME", self.record["start"]))
+        self.record["queue_wait"] = max(start - submit_time, 0.0)
+
+    def add_child_usage(self) -> None:
+        """
+        Records the CPU time (user and system, in seconds) and the maximum resident
+        set size (in KB) of the child processes (i.e., the QC program) which have
+        terminated.
+
+        :return: None
+        """
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.record["child_cpu_time"] = usage.ru_utime + usage.ru_stime
+        self.record["child_max_rss_kb"] = usage.ru_maxrss
+
+    def write(self, wave_dir: Path) -> None:
+        """
+        Appends the record to the ``metrics.jsonl`` file of the given wave. The
+        file is locked while it is appended to, since many tasks may finish at the
+        same time. Failing to write the record doesn't fail the task.
+
+        :param wave_dir: the wave directory
+        :return: None
+        """
+        try:
+            with (Path(wave_dir) / TaskMetrics.METRICS_FILENAME).open("a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.write(json.dumps(self.record) + "\n")
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        except OSError as e:
+            print("Unable to record the metrics of the task: {}".format(e))
@@ -0,0 +1,157 @@
+import time
+from typing import List, Optional
+
+from pyflow.flow.slurm_executor import SlurmExecutor
+
+
+class ThrottleController:
+    """
+    Class which adapts the throttle (the maximum number of simultaneously
+    running tasks, i.e., ``simul_jobs``) of the arrays of a wave while they run.
+    At each update, the controller observes the tasks of the arrays, the idle
+    cores of the partition, and the rate at which tasks complete:
+
+    * if tasks are pending because of an account or QOS limit, the throttle
+      is lowered to the number of running tasks, so the wave stops claiming
+      slots it can't use;
+    * if tasks are only held back by the throttle itself and the partition has
+      idle cores, the throttle is raised by the number of tasks the idle cores
+      can hold, by at most half the throttle or the number of tasks completed
+      since the last update (whichever is larger);
+    * otherwise (e.g., tasks waiting for resources), the throttle is kept.
+
+    The throttle is split evenly across the arrays that still have tasks. If
+    it is smaller than the number of such arrays, the arrays beyond the
+    throttle are held (see :meth:`set_throttle`).
+    """
+
+    # pending reason of tasks held back by the array throttle
+    THROTTLE_REASON = "JobArrayTaskLimit"
+
+    # pending reasons which indicate that the user has reached a limit of the scheduler; "Priority"
+    # isn't one of them since it is the normal pending reason of freshly queued tasks
+    PENALTY_REASONS = ["QOSMaxJobsPerUserLimit", "AssocMaxJobsLimit", "QOSGrpCpuLimit",
+                       "AssocGrpCpuLimit", "QOSMaxCpuPerUserLimit", "AssocGrpCPUMinutesLimit",
+                       "QOSGrpCPUMinutesLimit", "QOSMaxNodePerUserLimit", "AssocGrpNodeLimit"]
+
+    def __init__(self,
+                 executor: SlurmExecutor,
+                 job_ids: List[int],
+                 partition: str,
+                 cores_per_task: int,
+                 throttle: int,
+                 max_throttle: int = 0,
+                 min_throttle: int = 1):
+        """
+        Constructs a ThrottleController for the given arrays.
+
+        :param executor: the executor used to query and update the arrays
+        :param job_ids: the job IDs of the arrays
+        :param partition: the partition on which the arrays run
+        :param cores_per_task: the number of cores requested by each task
+        :param throttle: the initial total throttle of the arrays (e.g., ``simul_jobs``)
+        :param max_throttle: the maximum total throttle (0 for no maximum)
+        :param min_throttle: the minimum total throttle
+        """
+        self.executor = executor
+        self.job_ids = list(job_ids)
+        self.partition = partition
+        self.cores_per_task = max(cores_per_task, 1)
+        self.throttle = throttle
+        self.max_throttle = max_throttle
+        self.min_throttle = max(min_throttle, 1)
+        self._num_remaining = None
+        self._active_job_ids = list(self.job_ids)
+        self._held_job_ids = set()
+
+    def update(self) -> Optional[int]:
+        """
+        Observes the arrays and adjusts their throttle.
+
+        :return: the new total throttle, or None once all of the tasks have finished
+        """
+        tasks = self.executor.get_array_tasks(self.job_ids)
+        if tasks is None:  # the queue couldn't be queried; try again at the next update
+            return self.throttle
+        if not tasks:
+            return None
+
+        running = sum(1 for _, state, _ in tasks if state in ("RUNNING", "COMPLETING", "CONFIGURING"))
+        # the tasks of held arrays are held back by the throttle
+        pending_reasons = [ThrottleController.THROTTLE_REASON if job_id in self._held_job_ids else reason
+                           for job_id, state, reason in tasks if state == "PENDING"]
+
+        num_completed = 0 if self._num_remaining is None else max(self._num_remaining - len(tasks), 0)
+        self._num_remaining = len(tasks)
+
+        new_throttle = self.throttle
+        if any(reason in ThrottleController.PENALTY_REASONS for reason in pending_reasons):
+            new_throttle = min(self.throttle, running)
+        elif ThrottleController.THROTTLE_REASON in pending_reasons:
+            idle_cores = self.executor.get_idle_cores(self.partition) or 0
+            idle_slots = idle_cores // self.cores_per_task
+            if idle_slots > 0:
+                max_step = max(self.throttle // 2, num_completed, 1)
+                new_throttle = self.throttle + min(idle_slots, max_step)
+
+        if self.max_throttle > 0:
+            new_throttle = min(new_throttle, self.max_throttle)
+        new_throttle = max(new_throttle, self.min_throttle)
+
+        active_job_ids = sorted(set([job_id for job_id, _, _ in tasks]))
+        self.set_throttle(new_throttle, active_job_ids)
+
+        return self.throttle
+
+    def set_throttle(self, throttle: int, active_job_ids: List[int]) -> None:
+        """
+        Sets the total throttle of the arrays, splitting it evenly across the
+        given arrays which still have tasks. Since Slurm reads a throttle of 0
+        as no throttle, only the first ``throttle`` arrays get a share, and the
+        pending tasks of the others are held until the throttle is raised. The
+        arrays are only updated when the throttle or the active arrays change.
+
+        :param throttle: the new total throttle
+        :param active_job_ids: the job IDs of the arrays which still have tasks
+        :return: None
+        """
+        if throttle == self.throttle and active_job_ids == self._active_job_ids:
+            return None
+
+        num_shared = min(len(active_job_ids), throttle)
+        share, remainder = divmod(throttle, max(num_shared, 1))
+        for i, job_id in enumerate(active_job_ids):
+            if i < num_shared:
+                if job_id in self._held_job_ids:
+                    self.executor.release_job(job_id)
+                    self._held_job_ids.discard(job_id)
+                self.executor.set_array_throttle(job_id, share + 1 if i < remainder else share)
+            elif job_id not in self._held_job_ids:
+                self.executor.hold_job(job_id)
+                self._held_job_ids.add(job_id)
+
+        self.throttle = throttle
+        self._active_job_ids = active_job_ids
+
+    def run(self, interval: float, max_time: float = 0) -> None:
+        """
+        Updates the throttle every ``interval`` seconds until all of the tasks
+        of the arrays have finished, or until ``max_time`` seconds have passed.
+        Arrays held by the controller are released before it stops.
+
+        :param interval: the number of seconds between updates
+        :param max_time: the maximum number of seconds to run for (0 for no maximum)
+        :return: None
+        """
+        deadline = time.time() + max_time
+        while True:
+            throttle = self.update()
+            if throttle is None:
+                return None
+            if max_time > 0 and time.time() + interval >= deadline:
+                for job_id in sorted(self._held_job_ids):
+                    self.executor.release_job(job_id)
+                self._held_job_ids.clear()
+                return None
+            print("Throttle of arrays {}: {}".format(",".join([str(job_id) for job_id in self.job_ids]), throttle))
+            time.sleep(interval)
@@ -0,0 +1,124 @@
+from pathlib import Path
+from typing import List, Union
+
+from pyflow.io.wave_archive import WaveArchive
+
+
+class WaveLayout:
+    """
+    Class which determines where the files of a workflow wave are stored.
+
+    By default (``shard_depth == 0``), all input, output, and Slurm files of a
+    wave are kept in a single, flat ``wave_N_calcs`` directory (and in its flat
+    ``completed`` and ``failed`` subdirectories). With a positive ``shard_depth``,
+    each file is instead stored in nested shard directories named after
+    two-character prefixes of the InChIKey which begins the filename. For example,
+    with ``shard_depth == 2``, the file ``ABCDEFGHIJKLMN-OPQRSTUVWX-Y_pm7_0.com``
+    is stored in ``wave_1_calcs/AB/CD/`` and, once completed, in
+    ``wave_1_calcs/completed/AB/CD/``.
+
+    Since the first block of an InChIKey is a hash of the molecule's connectivity,
+    files are spread evenly over the shard directories, while all of the conformers
+    of a molecule end up in the same shard.
+    """
+
+    # number of InChIKey characters used to name each level of shard directories
+    SHARD_WIDTH = 2
+
+    def __init__(self, wave_dir: Path, shard_depth: int = 0):
+        """
+        Constructs a WaveLayout object which resolves the paths of files stored in
+        the given ``wave_dir``.
+
+        :param wave_dir: the wave directory (e.g., ``wave_1_calcs``)
+        :param shard_depth: the number of shard directory levels (0 for a flat layout)
+        """
+        self.wave_dir = Path(wave_dir)
+        self.shard_depth = shard_depth
+        self._created_dirs = set()
+
+    def is_sharded(self) -> bool:
+        """
+        Determines if this layout uses shard directories.
+
+        :return: True if files are stored in shard directories, False otherwise
+        """
+        return self.shard_depth > 0
+
+    def get_shard(self, filename: str) -> Path:
+        """
+        Returns the shard directory (relative to a wave directory or one of its
+        subdirectories) in which the file with the given name is stored.
+
+        :param filename: the name of the file
+        :return: a relative Path object to the shard directory
+        """
+        shard = Path()
+        for level in range(self.shard_depth):
+            start = level * WaveLayout.SHARD_WIDTH
+            shard = shard / filename[start:start + WaveLayout.SHARD_WIDTH]
+        return shard
+
+    def get_dir(self, sub_dir: str = None) -> Path:
+        """
+        Returns the path to the wave directory or to the given subdirectory of the
+        wave directory (e.g., ``completed`` or ``failed``).
+
+        :param sub_dir: the name of the subdirectory
+        :return: a Path object to the directory
+        """
+        if sub_dir is None:
+            return self.wave_dir
+        return self.wave_dir / sub_dir
+
+    def get_path(self, filename: str, sub_dir: str = None, create: bool = False) -> Path:
+        """
+        Returns the path at which the file with the given name is stored.
+
+        :param filename: the name of the file
+        :param sub_dir: the subdirectory of the wave directory in which the file is stored
+        :param create: if True, creates the shard directory if it doesn't exist yet
+        :return: a Path object to the file
+        """
+        file_dir = self.get_dir(sub_dir) / self.get_shard(filename)
+
+        if create and self.is_sharded() and file_dir not in self._created_dirs:
+            file_dir.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(file_dir)
+
+        return file_dir / filename
+
+    def glob(self, pattern: str, sub_dir: str = None) -> List[Path]:
+        """
+        Returns a list of the files matching the given pattern in the wave directory
+        or in the given subdirectory. Only the shard directories are searched, so
+        files in other subdirectories (e.g., ``completed``) are never matched.
+
+        If the wave has been archived (see :class:`pyflow.io.wave_archive.WaveArchive`),
+        the matching archive members are included at their original paths.
+
+        :param pattern: the filename pattern to match
+        :param sub_dir: the subdirectory of the wave directory to search
+        :return: a list of Path objects to the matching files
+        """
+        shard_pattern = "/".join(["?" * WaveLayout.SHARD_WIDTH] * self.shard_depth + [pattern])
+        files = list(self.get_dir(sub_dir).glob(shard_pattern))
+
+        archive = WaveArchive.get(self.wave_dir)
+        if archive.exists():
+            if sub_dir is not None:
+                shard_pattern = "{}/{}".format(sub_dir, shard_pattern)
+            on_disk = set(files)
+            archived_files = [self.wave_dir / name for name in archive.match(shard_pattern)]
+            files.extend([f for f in archived_files if f not in on_disk])
+
+        return files
+
+    def get_relative_path(self, filepath: Union[Path, str]) -> str:
+        """
+        Returns the given path relative to the wave directory.
+
+        :param filepath: the path to the file
+        :return: the path to the file relative to the wave directory
+        """
+        return Path(filepath).relative_to(self.wave_dir).as_posix()
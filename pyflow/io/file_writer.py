@@ -1,13 +1,28 @@
 from __future__ import annotations
 
+import hashlib
+import os
 import sys
 from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
 
-from pyflow.io.io_utils import yes_no_query
+from pyflow.io.io_utils import file_exists, yes_no_query
+from pyflow.io.sidecar import get_sidecar_file
 from pyflow.mol import mol_utils
 from pyflow.mol.mol_utils import get_formatted_geometry, get_supported_babel_formats
 
 
+def escape_template(text: str) -> str:
+    """
+    Escapes the braces in the given text so that it can be included literally in
+    an input file template (see :meth:`AbstractInputFileWriter.compile_template`).
+
+    :param text: the text to escape
+    :return: the escaped text
+    """
+    return text.replace("{", "{{").replace("}", "}}")
+
+
 class FileWriter:
     """
     Generalized class for writing text to a file.
@@ -28,19 +43,63 @@ class FileWriter:
 
     def write(self):
         """
-        Writes ``self.text`` to the file located at ``self.filepath``.
+        Writes ``self.text`` to the file located at ``self.filepath``. The text is
+        written to a temporary file which is then renamed, so the file is never
+        left partially written.
 
         :return: None
         """
+        if self.confirm_overwrite():
+            FileWriter.write_atomic(self.filepath, self.text.encode())
+
+    def confirm_overwrite(self) -> bool:
+        """
+        Determines if ``self.filepath`` may be written, prompting the user if the
+        file already exists and ``self.overwrite`` is False.
+
+        :return: True if the file may be written, False otherwise
+        """
         if self.overwrite or not self.filepath.exists():
-            self.filepath.write_text(self.text)
-        else:
-            message = "{} already exists. Do you wish to overwrite this file?" \
-                      "[y/n]:\n"
+            return True
+
+        message = "{} already exists. Do you wish to overwrite this file?" \
+                  "[y/n]:\n"
+
+        return yes_no_query(message.format(self.filepath.as_posix()))
+
+    @staticmethod
+    def get_temp_path(filepath: Path) -> Path:
+        """
+        Returns the temporary path to which the given file is written before it
+        is renamed.
+
+        :param filepath: the path to the file
+        :return: a Path object to the (hidden) temporary file
+        """
+        return filepath.with_name(".{}.{}.tmp".format(filepath.name, os.getpid()))
 
-            overwrite = yes_no_query(message.format(self.filepath.as_posix()))
-            if overwrite:
-                self.filepath.write_text(self.text)
+    @staticmethod
+    def write_atomic(filepath: Path, data: bytes, fsync: bool = False) -> None:
+        """
+        Writes the given data to a temporary file next to ``filepath`` and
+        renames it to ``filepath``.
+
+        :param filepath: the path to the file
+        :param data: the contents of the file
+        :param fsync: if True, flushes the temporary file to disk before renaming it
+        :return: None
+        """
+        tmp_path = FileWriter.get_temp_path(filepath)
+        try:
+            with tmp_path.open("wb") as f:
+                f.write(data)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
 
     def append(self, text):
         """
@@ -60,6 +119,158 @@ class FileWriter:
         return self.text
 
 
+class FileBatch:
+    """
+    Class for writing many files (e.g., the input files of a workflow step) as a
+    batch. Files are queued with :meth:`add` and written by :meth:`flush`, or
+    when the batch is used as a context manager, on exit.
+
+    Writes are grouped by directory: the files of a directory are written to
+    temporary files and then renamed to their final names, and the directory
+    itself is synced once. An interrupted batch therefore never leaves partially
+    written files behind. The files themselves are only flushed to disk with
+    ``fsync_files``, since syncing every file is slow on parallel file systems. Files whose contents are unchanged
+    are skipped without being rewritten (or prompting the user), so writing the
+    same batch again does almost no I/O.
+    """
+
+    # number of queued files at which the batch is automatically flushed
+    MAX_PENDING = 1000
+
+    def __init__(self, overwrite: bool = False, fsync: bool = True, fsync_files: bool = False):
+        """
+        Constructs an empty FileBatch.
+
+        :param overwrite: if True, will overwrite changed files without prompting user
+        :param fsync: if True, flushes each written directory to disk
+        :param fsync_files: if True, also flushes each written file to disk before it is renamed
+        """
+        self.overwrite = overwrite
+        self.fsync = fsync
+        self.fsync_files = fsync_files
+        self.num_written = 0
+        self.num_unchanged = 0
+        self.num_skipped = 0
+        self.bytes_written = 0
+        self._pending = {}  # type: Dict[Path, List[FileWriter]]
+        self._num_pending = 0
+
+    def __enter__(self) -> FileBatch:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.flush()
+
+    def add(self, writer: FileWriter) -> None:
+        """
+        Queues the file of the given FileWriter to be written.
+
+        :param writer: the FileWriter of the file
+        :return: None
+        """
+        writer.overwrite = writer.overwrite or self.overwrite
+        self._pending.setdefault(writer.filepath.parent, []).append(writer)
+        self._num_pending += 1
+
+        if self._num_pending >= FileBatch.MAX_PENDING:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes all of the queued files, one directory at a time.
+
+        :return: None
+        """
+        for directory, writers in self._pending.items():
+            self._write_dir(directory, writers)
+
+        self._pending = {}
+        self._num_pending = 0
+
+    def _write_dir(self, directory: Path, writers: List[FileWriter]) -> None:
+        """
+        Writes the given files, which are all in the given directory.
+        """
+        staged = []
+        try:
+            for writer in writers:
+                data = writer.get_text().encode()
+                if FileBatch.is_unchanged(writer.filepath, data):
+                    self.num_unchanged += 1
+                    continue
+                if not writer.confirm_overwrite():
+                    self.num_skipped += 1
+                    continue
+
+                tmp_path = FileWriter.get_temp_path(writer.filepath)
+                staged.append((tmp_path, writer.filepath))
+                with tmp_path.open("wb") as f:
+                    f.write(data)
+                    if self.fsync_files:
+                        f.flush()
+                        os.fsync(f.fileno())
+                self.bytes_written += len(data)
+
+            for tmp_path, filepath in staged:
+                os.replace(tmp_path, filepath)
+        except BaseException:
+            for tmp_path, _ in staged:
+                tmp_path.unlink(missing_ok=True)
+            raise
+
+        self.num_written += len(staged)
+
+        if self.fsync and staged:
+            FileBatch._fsync_dir(directory)
+
+    @staticmethod
+    def is_unchanged(filepath: Path, data: bytes) -> bool:
+        """
+        Determines if the given file exists and already holds the given data.
+        The sizes are compared before the contents are hashed, so most changed
+        files are detected without being read.
+
+        :param filepath: the path to the file
+        :param data: the new contents of the file
+        :return: True if the file holds the given data, False otherwise
+        """
+        try:
+            if filepath.stat().st_size != len(data):
+                return False
+            return hashlib.sha256(filepath.read_bytes()).digest() == hashlib.sha256(data).digest()
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _fsync_dir(directory: Path) -> None:
+        """
+        Flushes the entries of the given directory to disk (where supported).
+        """
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return None
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def get_summary(self) -> str:
+        """
+        Returns a summary of the files written by this batch.
+
+        :return: a human-readable summary
+        """
+        summary = "wrote {} file(s) ({} bytes); {} unchanged".format(self.num_written, self.bytes_written,
+                                                                     self.num_unchanged)
+        if self.num_skipped:
+            summary += "; {} skipped".format(self.num_skipped)
+        return summary
+
+
 class AbstractInputFileWriter(FileWriter):
     """
     Abstract class for writing input files.
@@ -75,6 +286,10 @@ class AbstractInputFileWriter(FileWriter):
         Constructor for an AbstractInputFileWriter. This class abstracts the most
         general fields and methods of input file writers.
 
+        If the ``geometry_file`` has a final-geometry sidecar (see
+        :mod:`pyflow.io.sidecar`), the coordinates are read from the sidecar
+        rather than from the (typically much larger) geometry file.
+
         :param program: quantum chemistry program
         :param filepath: path to the new input file
         :param geometry_file: initial coordinates for the input file
@@ -85,6 +300,9 @@ class AbstractInputFileWriter(FileWriter):
         if filepath is None:
             filepath = Path().cwd() / geometry_file.name
 
+        geometry_file, geometry_format = AbstractInputFileWriter.resolve_geometry_file(geometry_file,
+                                                                                      geometry_format)
+
         super().__init__(filepath=filepath, overwrite=overwrite)
 
         self.args = {"title": filepath.stem,
@@ -101,20 +319,12 @@ class AbstractInputFileWriter(FileWriter):
             if k not in self.args:
                 self.args[k] = v
 
-        # get formatted coordinates
-        self.coordinates = get_formatted_geometry(str(self.args["geometry_file"]),
-                                                  geometry_format=geometry_format,
-                                                  output_format=self.get_openbabel_format())
-
-        # charge
-        if self.args.get("smiles_geometry_file") is None:
-            self.args["smiles_geometry_file"] = self.args["geometry_file"]
-            self.args["smiles_geometry_format"] = self.args["geometry_format"]
-
-        smiles = mol_utils.get_smiles(str(self.args["smiles_geometry_file"]),
-                                      geometry_format=self.args["smiles_geometry_format"])
-
-        self.args["charge"] = mol_utils.get_charge(smiles) + self.args.get("charge", 0)
+        # get formatted coordinates and charge
+        self.coordinates, self.args["charge"] = self.load_geometry(self.args["geometry_file"],
+                                                                   geometry_format,
+                                                                   self.args.get("smiles_geometry_file"),
+                                                                   self.args.get("smiles_geometry_format"),
+                                                                   self.args.get("charge", 0))
 
     @classmethod
     def from_config(cls,
@@ -140,6 +350,132 @@ class AbstractInputFileWriter(FileWriter):
                    **step_config,
                    **kwargs)
 
+    @staticmethod
+    def resolve_geometry_file(geometry_file: Path, geometry_format: str) -> Tuple[Path, str]:
+        """
+        Returns the final-geometry sidecar of the given geometry file (and its
+        format) if it exists, or the given geometry file and format otherwise.
+
+        :param geometry_file: the geometry file
+        :param geometry_format: the format of the geometry file
+        :return: a 2-tuple with the geometry file to read and its format
+        """
+        sidecar_file = get_sidecar_file(geometry_file)
+        if file_exists(sidecar_file):
+            return sidecar_file, "xyz"
+        return geometry_file, geometry_format
+
+    @classmethod
+    def load_geometry(cls,
+                      geometry_file: Path,
+                      geometry_format: str,
+                      smiles_geometry_file: Path = None,
+                      smiles_geometry_format: str = None,
+                      charge: int = 0) -> Tuple[str, int]:
+        """
+        Loads the per-molecule fields of an input file: the coordinates of the
+        given geometry file (formatted for this type of input file) and the charge
+        of the molecule, determined from the SMILES string of the given
+        ``smiles_geometry_file`` (the geometry file by default) and incremented
+        by ``charge``.
+
+        :param geometry_file: initial coordinates for the input file
+        :param geometry_format: format of the initial coordinates file
+        :param smiles_geometry_file: the geometry file from which to determine the charge
+        :param smiles_geometry_format: the format of the ``smiles_geometry_file``
+        :param charge: the amount by which to increment the charge of the molecule
+        :return: a 2-tuple with the formatted coordinates and the charge
+        """
+        geometry_file, geometry_format = AbstractInputFileWriter.resolve_geometry_file(geometry_file,
+                                                                                      geometry_format)
+        coordinates = get_formatted_geometry(str(Path(geometry_file).resolve()),
+                                             geometry_format=geometry_format,
+                                             output_format=cls.get_openbabel_format())
+
+        if smiles_geometry_file is None:
+            smiles_geometry_file = geometry_file
+            smiles_geometry_format = geometry_format
+
+        smiles = mol_utils.get_smiles(str(smiles_geometry_file), geometry_format=smiles_geometry_format)
+
+        return coordinates, mol_utils.get_charge(smiles) + charge
+
+    @classmethod
+    def compile_template(cls, args: dict) -> str:
+        """
+        Builds the text of an input file from the given arguments (e.g., a step
+        configuration) with ``{title}``, ``{charge}``, and ``{coordinates}`` slots
+        for the per-molecule fields. The template is filled in by :meth:`render`.
+
+        :param args: the arguments shared by all of the input files
+        :return: the template
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def render(cls, template: str, title: str, charge: int, coordinates: str) -> str:
+        """
+        Fills in the per-molecule fields of a template built by :meth:`compile_template`.
+
+        :param template: the template
+        :param title: the title of the input file
+        :param charge: the charge of the molecule
+        :param coordinates: the coordinates, as formatted by OpenBabel
+        :return: the text of the input file
+        """
+        return template.format(title=title, charge=charge, coordinates=cls.format_coordinates(coordinates))
+
+    @classmethod
+    def format_coordinates(cls, coordinates: str) -> str:
+        """
+        Reformats the coordinates generated by OpenBabel for this type of input file.
+
+        :param coordinates: the coordinates, as formatted by OpenBabel
+        :return: the reformatted coordinates
+        """
+        return coordinates
+
+    @classmethod
+    def write_batch(cls,
+                    args: dict,
+                    records: Iterable[Tuple[Path, str, int, str]],
+                    overwrite: bool = False) -> FileBatch:
+        """
+        Writes many input files which share the given arguments (e.g., a step
+        configuration). The template is compiled once, and each input file is
+        then rendered from a (filepath, title, charge, coordinates) record, where
+        the coordinates are formatted by OpenBabel (see :meth:`load_geometry`).
+        The files are written atomically as a :class:`FileBatch`.
+
+        :param args: the arguments shared by all of the input files
+        :param records: an iterable of (filepath, title, charge, coordinates) tuples
+        :param overwrite: if True, will overwrite changed files without prompting user
+        :return: the FileBatch, which holds the numbers of written and unchanged files
+        """
+        template = cls.compile_template(args)
+
+        with FileBatch(overwrite=overwrite) as batch:
+            for filepath, title, charge, coordinates in records:
+                batch.add(FileWriter(filepath, cls.render(template, title, charge, coordinates)))
+
+        return batch
+
+    def write(self) -> None:
+        """
+        Renders this input file from its template and writes it.
+
+        :return: None
+        """
+        self.append(self.render(self.compile_template(self.args),
+                                self.args["title"],
+                                self.args["charge"],
+                                self.coordinates))
+
+        if self.args.get("verbose", False):
+            print("\n" + self.get_text())
+
+        super().write()
+
     @classmethod
     def get_openbabel_format(self) -> str:
         raise NotImplementedError
@@ -5,7 +5,7 @@ import sys
 from pathlib import Path
 
 from pyflow.flow.flow_utils import load_run_params
-from pyflow.io.file_writer import AbstractInputFileWriter
+from pyflow.io.file_writer import AbstractInputFileWriter, escape_template
 
 
 # script for creating GAMESS input files
@@ -16,76 +16,104 @@ class GamessWriter(AbstractInputFileWriter):
     def get_openbabel_format(self) -> str:
         return "inp"
 
-    def write(self) -> None:
-
-        # reformat coordinates
-        coordinates = "\n".join([" $DATA", self.args["title"], self.coordinates.split("\n", 4)[4]])
+    @classmethod
+    def compile_template(cls, args: dict) -> str:
 
-        # $CONTRL group
+        # $CONTRL group (ICHARG is filled in by render since it depends on the charge)
         control_group = [" $CONTRL"]
 
-        if self.args["runtyp"] is not None:
-            control_group.append("RUNTYP={}".format(self.args["runtyp"]))
-        if self.args["dfttyp"] is not None:
-            control_group.append("DFTTYP={}".format(self.args["dfttyp"]))
-        if self.args["charge"] != 0:
-            control_group.append("ICHARG={}".format(self.args["charge"]))
-        if self.args["multiplicity"] is not None:
-            control_group.append("MULT={}".format(self.args["multiplicity"]))
-        if self.args["maxit"] is not None:
-            control_group.append("MAXIT={}".format(self.args["maxit"]))
+        if args["runtyp"] is not None:
+            control_group.append("RUNTYP={}".format(args["runtyp"]))
+        if args["dfttyp"] is not None:
+            control_group.append("DFTTYP={}".format(args["dfttyp"]))
+        control_group.append("{icharg}")
+        if args["multiplicity"] is not None:
+            control_group.append("MULT={}".format(args["multiplicity"]))
+        if args["maxit"] is not None:
+            control_group.append("MAXIT={}".format(args["maxit"]))
 
         control_group.append("$END\n")
 
-        if len(control_group) > 2:
-            self.append(" ".join(control_group))
+        template = [" ".join(control_group)]
 
         # $SYSTEM group
         system_group = [" $SYSTEM"]
-        if self.args["memory"]:
-            mwords = 125 * int(self.args["memory"])
-            system_group.append("MWORDS={}".format(mwords))
-        if self.args["time"]:
-            system_group.append("TIMLIM={}".format(self.args["time"]))
+        for option, value in cls.get_system_options(args).items():
+            system_group.append("{}={}".format(option, value))
         system_group.append("$END\n")
         if len(system_group) > 2:
-            self.append(" ".join(system_group))
+            template.append(escape_template(" ".join(system_group)))
 
         # $BASIS group
         basis_group = [" $BASIS"]
-        if self.args["gbasis"]:
-            basis_group.append("GBASIS={}".format(self.args["gbasis"]))
+        if args["gbasis"]:
+            basis_group.append("GBASIS={}".format(args["gbasis"]))
         basis_group.append("$END\n")
         if len(basis_group) > 2:
-            self.append(" ".join(basis_group))
+            template.append(escape_template(" ".join(basis_group)))
 
         # $STATPT group
         statpt_group = [" $STATPT"]
-        if self.args["opttol"]:
-            statpt_group.append("OPTTOL={}".format(self.args["opttol"]))
-        if self.args["hess"]:
-            statpt_group.append("HESS={}".format(self.args["hess"]))
-        if self.args["nstep"]:
-            statpt_group.append("NSTEP={}".format(self.args["nstep"]))
+        if args["opttol"]:
+            statpt_group.append("OPTTOL={}".format(args["opttol"]))
+        if args["hess"]:
+            statpt_group.append("HESS={}".format(args["hess"]))
+        if args["nstep"]:
+            statpt_group.append("NSTEP={}".format(args["nstep"]))
         statpt_group.append("$END\n")
         if len(statpt_group) > 2:
-            self.append(" ".join(statpt_group))
+            template.append(escape_template(" ".join(statpt_group)))
 
         # $DFT group
         dft_group = [" $DFT"]
-        if self.args["idcver"]:
-            dft_group.append("IDCVER={}".format(self.args["idcver"]))
+        if args["idcver"]:
+            dft_group.append("IDCVER={}".format(args["idcver"]))
         dft_group.append("$END\n")
         if len(dft_group) > 2:
-            self.append(" ".join(dft_group))
+            template.append(escape_template(" ".join(dft_group)))
 
         # $DATA group
-        self.append(coordinates)
+        template.append(" $DATA\n{title}\n{coordinates}")
+
+        return "".join(template)
+
+    @staticmethod
+    def get_system_options(args: dict) -> dict:
+        """
+        Returns the options of the ``$SYSTEM`` group: the memory (``MWORDS``, from
+        the ``memory`` in GB) and the time limit (``TIMLIM``, from the ``time`` in minutes).
+
+        :param args: the arguments of the input file (e.g., a step configuration)
+        :return: a dict mapping option names to their values
+        """
+        options = {}
+        if args["memory"]:
+            options["MWORDS"] = 125 * int(args["memory"])
+        if args["time"]:
+            options["TIMLIM"] = args["time"]
+        return options
 
-        if self.args.get("verbose", False):
-            print("\n" + self.get_text())
+    @classmethod
+    def render(cls, template: str, title: str, charge: int, coordinates: str) -> str:
+        # fill in the $CONTRL group, which is omitted if it has no options
+        control_line, rest = template.split("\n", 1)
+        options = []
+        for option in control_line.split()[1:-1]:
+            if option == "{icharg}":
+                if charge != 0:
+                    options.append("ICHARG={}".format(charge))
+            else:
+                options.append(option)
+
+        control_group = ""
+        if options:
+            control_group = " ".join([" $CONTRL"] + options + ["$END\n"])
+
+        return control_group + rest.format(title=title, coordinates=cls.format_coordinates(coordinates))
 
-        super().write()
+    @classmethod
+    def format_coordinates(cls, coordinates: str) -> str:
+        return coordinates.split("\n", 4)[4]
 
 
 def parse_args():
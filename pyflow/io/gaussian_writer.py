@@ -6,48 +6,94 @@ from pathlib import Path
 from typing import List
 
 from pyflow.flow.flow_utils import load_run_params
-from pyflow.io.file_writer import AbstractInputFileWriter
+from pyflow.io.file_writer import AbstractInputFileWriter, escape_template
 
 
 class GaussianWriter(AbstractInputFileWriter):
 
+    # name of the checkpoint file of the previous step from which the guess is read
+    # (see the ``reuse_guess_from_previous`` step parameter)
+    PREV_CHK_TEMPLATE = "{title}_prev.chk"
+
     @classmethod
     def get_openbabel_format(cls) -> str:
         return "xyz"
 
-    def write(self) -> None:
-
-        # remove charge/multiplicity from OpenBabel generated coordinates
-        coordinates = self.coordinates.split("\n", 2)[2]
+    @classmethod
+    def compile_template(cls, args: dict) -> str:
 
         # link 0 commands
-        if self.args.get("rwf", False) and self.args.get("chk", False):  # save rwf and chk file
-            link0 = "%chk={}.chk\n%rwf={}.rwf\n%Save\n"
-        elif self.args.get("rwf", False):
-            link0 = "%chk={}.chk\n%NoSave\n%rwf={}.rwf\n"
-        elif self.args.get("chk", False):
-            link0 = "%rwf={}.rwf\n%NoSave\n%chk={}.chk\n"
+        if args.get("rwf", False) and args.get("chk", False):  # save rwf and chk file
+            link0 = "%chk={title}.chk\n%rwf={title}.rwf\n%Save\n"
+        elif args.get("rwf", False):
+            link0 = "%chk={title}.chk\n%NoSave\n%rwf={title}.rwf\n"
+        elif args.get("chk", False):
+            link0 = "%rwf={title}.rwf\n%NoSave\n%chk={title}.chk\n"
         else:
-            link0 = "%chk={}.chk\n%rwf={}.rwf\n%NoSave\n"
+            link0 = "%chk={title}.chk\n%rwf={title}.rwf\n%NoSave\n"
 
-        self.append(link0.format(self.args["title"], self.args["title"]))
+        route = args["route"]
+
+        # calculations read their geometry and/or guess from an old checkpoint file: that of
+        # the previous step (placed next to the input file) or that of a restarted calculation
+        if args.get("reuse_guess_from_previous", False):
+            link0 = "%oldchk=" + GaussianWriter.PREV_CHK_TEMPLATE + "\n" + link0
+            route = GaussianWriter.get_checkpoint_route(route, geom="geom=" not in route.lower())
+        elif args.get("oldchk", ""):
+            link0 = escape_template("%oldchk={}\n".format(args["oldchk"])) + link0
+
+        template = [link0]
 
         # memory and processor specification
-        self.append("%mem={}GB\n%nproc={}\n".format(self.args["memory"], self.args["nproc"]))
+        template.append(escape_template("%mem={}GB\n%nproc={}\n".format(args["memory"], args["nproc"])))
 
         # route
-        self.append("{}\n\n".format(self.args["route"]))
+        template.append(escape_template("{}\n\n".format(route)))
 
         # title, charge, multiplicity, and coordinates
-        if not self.args.get("no_mol_info", False):
-            self.append("{}\n\n".format(self.args["title"]))
-            self.append("{} {}\n".format(self.args["charge"], self.args["multiplicity"]))
-            self.append("{}\n".format(coordinates))
+        if not args.get("no_mol_info", False):
+            template.append("{title}\n\n")
+            template.append("{charge} " + escape_template(str(args["multiplicity"])) + "\n")
+            if "geom=check" in route.lower():  # the geometry is read from the checkpoint file
+                template.append("\n")
+            else:
+                template.append("{coordinates}\n")
 
-        if self.args.get("verbose", False):
-            print("\n" + self.get_text())
+        return "".join(template)
 
-        super().write()
+    @classmethod
+    def format_coordinates(cls, coordinates: str) -> str:
+        # remove charge/multiplicity from OpenBabel generated coordinates
+        return coordinates.split("\n", 2)[2]
+
+    @staticmethod
+    def get_checkpoint_route(route: str, geom: bool = True) -> str:
+        """
+        Returns the given route with the keywords which read the guess (and, if
+        ``geom`` is True, the geometry) from the checkpoint file. Any other guess
+        (and geometry) keywords are replaced.
+
+        :param route: the route
+        :param geom: whether to read the geometry from the checkpoint file
+        :return: the new route
+        """
+        replaced = ("geom=", "guess=") if geom else ("guess=",)
+        keywords = [k for k in route.split(" ") if k and not k.lower().startswith(replaced)]
+        if geom:
+            keywords.append("geom=check")
+        keywords.append("guess=read")
+        return " ".join(keywords)
+
+    @staticmethod
+    def remove_checkpoint_keywords(route: str) -> str:
+        """
+        Removes the keywords added by :meth:`get_checkpoint_route` from the given route.
+
+        :param route: the route
+        :return: the new route
+        """
+        keywords = [k for k in route.split(" ") if k and k.lower() not in ("geom=check", "guess=read")]
+        return " ".join(keywords)
 
 
 def parse_args(sys_args: List[str]) -> dict:
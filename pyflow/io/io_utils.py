@@ -1,5 +1,14 @@
+import gzip
+import io
+import os
+import shutil
+from collections import deque
 from pathlib import Path
-from typing import List
+from typing import BinaryIO, List, Optional, TextIO
+
+# magic numbers identifying the supported compression formats
+COMPRESSION_MAGIC = {"gzip": b"\x1f\x8b",
+                     "zstd": b"\x28\xb5\x2f\xfd"}
 
 
 def remove_file(filepath: str, force: bool = False, message: str = None) -> bool:
@@ -66,18 +75,208 @@ def find_string(filepath: Path, search_string: str) -> List[str]:
     :return: a list of lines with matches
     :raises FileNotFoundError: if the given file does not exist
     """
-    if filepath.is_file():
-        matches = []
+    try:
+        f = open_text(filepath)
+    except FileNotFoundError:
+        raise FileNotFoundError("The file {} does not exist.".format(filepath))
+
+    matches = []
+
+    with f:
+        for line in f:
+            if search_string in line:
+                matches.append(line)
+
+    return matches
+
+
+def get_compression(filepath: Path) -> Optional[str]:
+    """
+    Determines the compression format of the given file from its magic number.
+
+    :param filepath: the path to the file
+    :return: the compression format ("gzip" or "zstd"), or None if the file is not compressed
+    """
+    with open_binary(filepath) as f:
+        header = f.read(4)
+
+    for compression, magic in COMPRESSION_MAGIC.items():
+        if header.startswith(magic):
+            return compression
+    return None
+
+
+def open_binary(filepath: Path) -> BinaryIO:
+    """
+    Opens the given file for reading bytes. If the file has been packed into
+    a wave archive (see :class:`pyflow.io.wave_archive.WaveArchive`), the archive
+    member is opened instead.
+
+    :param filepath: the path to the file
+    :return: a buffered binary file object
+    :raises FileNotFoundError: if the file does not exist and is not archived
+    """
+    try:
+        return Path(filepath).open("rb")
+    except FileNotFoundError:
+        from pyflow.io.wave_archive import WaveArchive
+        archived = WaveArchive.locate(filepath)
+        if archived is None:
+            raise
+        archive, name = archived
+        return archive.open(name)
 
-        with filepath.open() as f:
-            for line in f:
-                if search_string in line:
-                    matches.append(line)
 
-        return matches
+def open_text(filepath: Path) -> TextIO:
+    """
+    Opens the given file for reading text. Files compressed with
+    :func:`compress_file` are transparently decompressed as they are read, and
+    archived files are read directly from their wave archive.
+
+    :param filepath: the path to the file
+    :return: a file object
+    """
+    f = open_binary(filepath)
+    header = f.peek(4)[:4]
 
+    if header.startswith(COMPRESSION_MAGIC["gzip"]):
+        return io.TextIOWrapper(_GzipReader(fileobj=f))
+    elif header.startswith(COMPRESSION_MAGIC["zstd"]):
+        zstandard = _import_zstandard()
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(f))
     else:
-        raise FileNotFoundError("The file {} does not exist.".format(filepath))
+        return io.TextIOWrapper(f)
+
+
+def read_tail(filepath: Path, num_lines: int, block_size: int = 65536) -> List[str]:
+    """
+    Returns the last ``num_lines`` lines of the given file. Uncompressed files
+    are read backwards in blocks of ``block_size`` bytes from their end, so the
+    time taken doesn't depend on the size of the file; compressed (and archived)
+    files are read in full.
+
+    :param filepath: the path to the file
+    :param num_lines: the number of lines to return
+    :param block_size: the number of bytes read at a time
+    :return: a list of lines (with their line endings)
+    """
+    filepath = Path(filepath)
+    if not filepath.is_file() or get_compression(filepath) is not None:
+        with open_text(filepath) as f:
+            return list(deque(f, maxlen=num_lines))
+
+    data = b""
+    with filepath.open("rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        while end > 0 and data.count(b"\n") <= num_lines:
+            start = max(end - block_size, 0)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+
+    return data.decode(errors="replace").splitlines(keepends=True)[-num_lines:]
+
+
+def file_exists(filepath: Path) -> bool:
+    """
+    Determines if the given file exists, either on disk or as a member of a
+    wave archive.
+
+    :param filepath: the path to the file
+    :return: True if the file exists, False otherwise
+    """
+    if Path(filepath).is_file():
+        return True
+    from pyflow.io.wave_archive import WaveArchive
+    return WaveArchive.locate(filepath) is not None
+
+
+class _GzipReader(gzip.GzipFile):
+    """
+    GzipFile which also closes its underlying file object when it is closed.
+    """
+
+    def close(self) -> None:
+        fileobj = self.fileobj
+        super().close()
+        if fileobj is not None:
+            fileobj.close()
+
+
+def compress_file(filepath: Path, compression: str) -> None:
+    """
+    Compresses the given file in place (*i.e.*, the compressed file keeps the
+    original filename). The file is compressed as a stream into a temporary
+    file which then replaces the original file, so memory usage does not depend
+    on the size of the file. Files that are already compressed are left untouched.
+
+    :param filepath: the path to the file to compress
+    :param compression: the compression format ("gzip" or "zstd")
+    :return: None
+    :raises ValueError: if the compression format is not supported
+    """
+    if compression not in COMPRESSION_MAGIC:
+        raise ValueError("Unsupported compression format '{}'".format(compression))
+
+    filepath = Path(filepath)
+    if get_compression(filepath) is not None:
+        return None
+
+    tmp_filepath = filepath.with_name(".{}.tmp".format(filepath.name))
+
+    with filepath.open("rb") as f_in:
+        if compression == "gzip":
+            with gzip.open(tmp_filepath, "wb", compresslevel=6) as f_out:
+                shutil.copyfileobj(f_in, f_out)
+        else:
+            zstandard = _import_zstandard()
+            with tmp_filepath.open("wb") as f_out:
+                zstandard.ZstdCompressor().copy_stream(f_in, f_out)
+
+    os.replace(tmp_filepath, filepath)
+
+
+def decompress_file(filepath: Path, dest: Path) -> None:
+    """
+    Writes the decompressed contents of the given file (see :func:`compress_file`)
+    to ``dest``. Files that are not compressed are copied, and files that have
+    been packed into a wave archive are read from the archive. The contents are
+    streamed into a temporary file which then replaces ``dest``.
+
+    :param filepath: the path to the (compressed) file
+    :param dest: the path to the decompressed file
+    :return: None
+    """
+    dest = Path(dest)
+    tmp_dest = dest.with_name(".{}.tmp".format(dest.name))
+
+    compression = get_compression(filepath)
+
+    f_in = open_binary(filepath)
+    if compression == "gzip":
+        f_in = _GzipReader(fileobj=f_in)
+    elif compression == "zstd":
+        f_in = _import_zstandard().ZstdDecompressor().stream_reader(f_in)
+
+    with f_in, tmp_dest.open("wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+
+    os.replace(tmp_dest, dest)
+
+
+def _import_zstandard():
+    """
+    Imports the optional ``zstandard`` module.
+
+    :return: the zstandard module
+    :raises ImportError: if the zstandard module is not installed
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("The 'zstandard' package is required for zstd compression; "
+                          "install it with 'pip install zstandard' or use gzip compression.")
+    return zstandard
 
 
 def yes_no_query(query: str) -> bool:
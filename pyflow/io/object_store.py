@@ -0,0 +1,147 @@
+import fcntl
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+from pyflow.io.io_utils import open_binary
+
+# ioctl request for cloning a file (reflink) on Linux filesystems which support it
+FICLONE = 0x40049409
+
+
+class ObjectStore:
+    """
+    Class for storing files by the SHA-256 hash of their contents. Each unique
+    file is stored once in the ``root`` directory (as ``root/ab/abcdef...``), and
+    files with identical contents share the same stored object.
+
+    Stored files may still be modified by the workflow they come from, so objects
+    never share an inode with them: objects are created with a reflink when the
+    filesystem supports it, and with a regular copy otherwise. Objects are
+    read-only, and are made available (see :meth:`link`) with a hardlink when
+    possible. Files linked from the store are therefore read-only and must not
+    be edited in place, since the edit would corrupt the object for every user
+    of the store; they can be replaced (e.g., by
+    :func:`pyflow.io.io_utils.compress_file`) instead.
+    """
+
+    # size of the chunks in which files are hashed and copied
+    CHUNK_SIZE = 1 << 20
+
+    # permissions of the stored objects
+    OBJECT_MODE = 0o444
+
+    def __init__(self, root: Path):
+        """
+        Constructs an ObjectStore which stores objects in the given ``root`` directory.
+
+        :param root: the directory in which to store the objects
+        """
+        self.root = Path(root)
+
+    @staticmethod
+    def hash_file(filepath: Path) -> str:
+        """
+        Computes the SHA-256 hash of the contents of the given file.
+
+        :param filepath: the path to the file
+        :return: the hexadecimal digest
+        """
+        sha = hashlib.sha256()
+        with open_binary(filepath) as f:
+            for chunk in iter(lambda: f.read(ObjectStore.CHUNK_SIZE), b""):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    def get_object_path(self, digest: str) -> Path:
+        """
+        Returns the path to the object with the given digest.
+
+        :param digest: the hexadecimal digest of the object
+        :return: a Path object to the stored object
+        """
+        return self.root / digest[:2] / digest
+
+    def contains(self, digest: str) -> bool:
+        """
+        Determines if an object with the given digest is stored.
+
+        :param digest: the hexadecimal digest of the object
+        :return: True if the object is stored, False otherwise
+        """
+        return self.get_object_path(digest).is_file()
+
+    def put(self, filepath: Path) -> str:
+        """
+        Stores the given file (unless an identical file is already stored) and
+        returns its digest.
+
+        :param filepath: the path to the file to store
+        :return: the hexadecimal digest of the file
+        """
+        digest = ObjectStore.hash_file(filepath)
+        object_path = self.get_object_path(digest)
+
+        if not object_path.is_file():
+            object_path.parent.mkdir(parents=True, exist_ok=True)
+            ObjectStore._copy(Path(filepath), object_path, mode=ObjectStore.OBJECT_MODE)
+
+        return digest
+
+    def link(self, digest: str, dest: Path) -> None:
+        """
+        Makes the object with the given digest available at the path ``dest``.
+
+        :param digest: the hexadecimal digest of the object
+        :param dest: the destination path
+        :return: None
+        """
+        dest = Path(dest)
+        if dest.exists():
+            dest.unlink()
+        ObjectStore._link_or_copy(self.get_object_path(digest), dest)
+
+    @staticmethod
+    def _link_or_copy(source: Path, dest: Path) -> None:
+        """
+        Creates ``dest`` from ``source`` with a hardlink if possible, otherwise
+        with a reflink or a regular copy (see :meth:`_copy`).
+
+        :param source: the source file
+        :param dest: the destination path
+        :return: None
+        """
+        try:
+            os.link(source, dest)
+            return None
+        except FileExistsError:
+            return None
+        except OSError:
+            pass
+
+        ObjectStore._copy(source, dest)
+
+    @staticmethod
+    def _copy(source: Path, dest: Path, mode: int = None) -> None:
+        """
+        Creates ``dest`` from ``source`` with a reflink if the filesystem supports
+        it, otherwise with a regular copy. The copy is written to a temporary file
+        which is then renamed, so ``dest`` is never left partially written.
+
+        :param source: the source file
+        :param dest: the destination path
+        :param mode: the permissions of ``dest`` (by default, those of a new file)
+        :return: None
+        """
+        tmp_dest = dest.with_name(".{}.{}.tmp".format(dest.name, os.getpid()))
+
+        with open_binary(source) as f_in, tmp_dest.open("wb") as f_out:
+            try:
+                fcntl.ioctl(f_out.fileno(), FICLONE, f_in.fileno())
+            except (OSError, AttributeError, ValueError):
+                shutil.copyfileobj(f_in, f_out, ObjectStore.CHUNK_SIZE)
+
+        if mode is not None:
+            os.chmod(tmp_dest, mode)
+        os.replace(tmp_dest, dest)
@@ -0,0 +1,346 @@
+from collections import deque
+from pathlib import Path
+from typing import List
+
+from pyflow.io.io_utils import file_exists, open_text, read_tail
+
+# conversion factor from Hartree to electronvolts
+HARTREE_TO_EV = 27.2113246
+
+# conversion factor from Bohr to Angstroms
+BOHR_TO_ANGSTROM = 0.529177210903
+
+# element symbols indexed by atomic number
+ELEMENT_SYMBOLS = ["X",
+                   "H", "He", "Li", "Be", "B", "C", "N", "O", "F", "Ne",
+                   "Na", "Mg", "Al", "Si", "P", "S", "Cl", "Ar", "K", "Ca",
+                   "Sc", "Ti", "V", "Cr", "Mn", "Fe", "Co", "Ni", "Cu", "Zn",
+                   "Ga", "Ge", "As", "Se", "Br", "Kr", "Rb", "Sr", "Y", "Zr",
+                   "Nb", "Mo", "Tc", "Ru", "Rh", "Pd", "Ag", "Cd", "In", "Sn",
+                   "Sb", "Te", "I", "Xe", "Cs", "Ba", "La", "Ce", "Pr", "Nd",
+                   "Pm", "Sm", "Eu", "Gd", "Tb", "Dy", "Ho", "Er", "Tm", "Yb",
+                   "Lu", "Hf", "Ta", "W", "Re", "Os", "Ir", "Pt", "Au", "Hg",
+                   "Tl", "Pb", "Bi", "Po", "At", "Rn"]
+
+# line appended to the output file of a calculation killed at its time limit
+TIMEOUT_MARKER = "PyFlow: calculation killed after exceeding its time limit"
+
+# line appended to the output file of a Gaussian 16 calculation which was stopped
+# before its time limit and left a checkpoint file from which it can be restarted
+CHECKPOINT_MARKER = "PyFlow: checkpoint saved"
+
+# fragments (lowercase) of the messages of calculations which ran out of memory,
+# from the QC programs and from Slurm
+MEMORY_ERRORS = ["galloc: could not allocate memory", "out-of-memory", "out of memory", "not enough memory",
+                 "memory allocation failed", "insufficient memory", "insufficient distributed memory",
+                 "insufficient replicated memory", "oom-kill", "exceeded job memory limit"]
+
+# fragments of the lines with which each QC program reports that it terminated
+TERMINATION_LINES = {"gaussian16": ["Normal termination", "Error termination"],
+                     "gamess": ["EXECUTION OF GAMESS TERMINATED"],
+                     "xtb": ["normal termination of xtb", "abnormal termination of xtb"]}
+
+# number of lines at the end of an output file in which a termination line is expected
+TERMINATION_TAIL_LINES = 50
+
+# number of lines at the end of a GAMESS output file which are read first to determine
+# its termination status (see parse_gamess_termination)
+GAMESS_TAIL_LINES = 500
+
+
+def format_xyz_line(symbol: str, x: float, y: float, z: float) -> str:
+    """
+    Formats an atom and its Cartesian coordinates (in Angstroms) as a line of
+    an XYZ file.
+
+    :param symbol: the element symbol of the atom
+    :param x: the x coordinate
+    :param y: the y coordinate
+    :param z: the z coordinate
+    :return: the formatted line
+    """
+    return "{:<2} {:>14.8f} {:>14.8f} {:>14.8f}".format(symbol, x, y, z)
+
+
+def parse_gaussian_output(output_file: Path) -> dict:
+    """
+    Parses a Gaussian 16 output file in a single pass and returns a dict with
+    the following keys:
+
+    - ``coordinates``: the last geometry in the file as a list of XYZ lines (Angstroms)
+    - ``energy``: the last SCF energy, in eV (None if not found)
+    - ``charge``: the charge of the molecule (None if not found)
+    - ``multiplicity``: the multiplicity of the molecule (None if not found)
+    - ``num_normal_terminations``: the number of "Normal termination" lines
+
+    :param output_file: the path to the output file
+    :return: a dict with the parsed results
+    """
+    coordinates = []
+    energy = None
+    charge = None
+    multiplicity = None
+    num_normal_terminations = 0
+
+    with open_text(output_file) as f:
+        for line in f:
+            if "orientation:" in line:
+                # skip the header of the orientation table
+                for _ in range(4):
+                    next(f)
+                coordinates = _read_gaussian_orientation(f)
+            elif "SCF Done" in line:
+                energy = float(line.split("A.U.")[0].split()[-1]) * HARTREE_TO_EV
+            elif line.lstrip().startswith("Charge =") and "Multiplicity =" in line:
+                fields = line.split()
+                charge = int(fields[2])
+                multiplicity = int(fields[5])
+            elif "Normal termination" in line:
+                num_normal_terminations += 1
+
+    return {"coordinates": coordinates,
+            "energy": energy,
+            "charge": charge,
+            "multiplicity": multiplicity,
+            "num_normal_terminations": num_normal_terminations}
+
+
+def parse_gaussian_times(output_file: Path) -> dict:
+    """
+    Parses the CPU and elapsed times reported by Gaussian 16 at the end of each
+    job (e.g., ``Job cpu time:  0 days  0 hours  5 minutes 12.3 seconds.``) and
+    returns a dict with the following keys:
+
+    - ``cpu_time``: the total CPU time of the jobs in the file, in seconds (None if not found)
+    - ``elapsed_time``: the total elapsed time of the jobs in the file, in seconds (None if not found)
+
+    :param output_file: the path to the output file
+    :return: a dict with the parsed times
+    """
+    times = {"cpu_time": None, "elapsed_time": None}
+
+    with open_text(output_file) as f:
+        for line in f:
+            if "Job cpu time:" in line:
+                key = "cpu_time"
+            elif "Elapsed time:" in line:
+                key = "elapsed_time"
+            else:
+                continue
+            fields = line.split(":", 1)[1].split()
+            days, hours, minutes, seconds = [float(fields[i]) for i in (0, 2, 4, 6)]
+            times[key] = (times[key] or 0.0) + ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+    return times
+
+
+def _read_gaussian_orientation(f) -> List[str]:
+    """
+    Reads the rows of a Gaussian "Standard orientation" or "Input orientation"
+    table from the given open file, stopping at the closing dashed line.
+
+    :param f: an open file positioned at the first row of the table
+    :return: a list of XYZ lines
+    """
+    coordinates = []
+    for line in f:
+        if line.strip().startswith("---"):
+            break
+        fields = line.split()
+        symbol = ELEMENT_SYMBOLS[int(fields[1])]
+        x, y, z = [float(i) for i in fields[3:6]]
+        coordinates.append(format_xyz_line(symbol, x, y, z))
+    return coordinates
+
+
+def parse_xtb_output(output_file: Path) -> dict:
+    """
+    Parses the output (stdout and stderr) of an xtb calculation in a single pass
+    and returns a dict with the following keys:
+
+    - ``energy``: the last total energy, in eV (None if not found)
+    - ``normal_termination``: whether xtb terminated normally
+    - ``opt_converged``: whether a geometry optimization converged
+
+    :param output_file: the path to the output file
+    :return: a dict with the parsed results
+    """
+    energy = None
+    normal_termination = False
+    opt_converged = False
+
+    with open_text(output_file) as f:
+        for line in f:
+            if "TOTAL ENERGY" in line:
+                energy = float(line.split()[3]) * HARTREE_TO_EV
+            elif "normal termination of xtb" in line:
+                normal_termination = True
+            elif "GEOMETRY OPTIMIZATION CONVERGED" in line:
+                opt_converged = True
+
+    return {"energy": energy,
+            "normal_termination": normal_termination,
+            "opt_converged": opt_converged}
+
+
+def parse_gamess_output(output_file: Path) -> dict:
+    """
+    Parses a GAMESS output file in a single pass and returns a dict with the
+    following keys:
+
+    - ``coordinates``: the last geometry in the file as a list of XYZ lines
+      (Angstroms), i.e., the last optimization step or, if there is none, the
+      input geometry
+    - ``energy``: the final energy, in eV (None if not found)
+    - ``opt_energies``: the energy of each optimization step, in eV
+    - ``charge``: the charge of the molecule (None if not found)
+    - ``multiplicity``: the multiplicity of the molecule (None if not found)
+    - ``normal_termination``: whether GAMESS terminated normally
+    - ``opt_converged``: whether a geometry optimization converged
+
+    :param output_file: the path to the output file
+    :return: a dict with the parsed results
+    """
+    coordinates = []
+    energy = None
+    opt_energies = []
+    charge = None
+    multiplicity = None
+    normal_termination = False
+    opt_converged = False
+
+    with open_text(output_file) as f:
+        for line in f:
+            if "COORDINATES OF ALL ATOMS ARE (ANGS)" in line:
+                # skip the header of the coordinates table
+                for _ in range(2):
+                    next(f)
+                coordinates = _read_gamess_coordinates(f, 1.0)
+            elif "COORDINATES (BOHR)" in line and line.split()[:2] == ["ATOM", "ATOMIC"]:
+                next(f)
+                coordinates = _read_gamess_coordinates(f, BOHR_TO_ANGSTROM)
+            elif "FINAL" in line and "ENERGY IS" in line:
+                energy = float(line.split("ENERGY IS")[1].split()[0]) * HARTREE_TO_EV
+            elif line.lstrip().startswith("NSERCH:") and "E=" in line:
+                opt_energies.append(float(line.split("E=")[1].split()[0]) * HARTREE_TO_EV)
+            elif "CHARGE OF MOLECULE" in line:
+                charge = int(line.split("=")[1])
+            elif "SPIN MULTIPLICITY" in line:
+                multiplicity = int(line.split("=")[1])
+            elif "EQUILIBRIUM GEOMETRY LOCATED" in line:
+                opt_converged = True
+            elif "EXECUTION OF GAMESS TERMINATED NORMALLY" in line:
+                normal_termination = True
+
+    if energy is None and opt_energies:
+        energy = opt_energies[-1]
+
+    return {"coordinates": coordinates,
+            "energy": energy,
+            "opt_energies": opt_energies,
+            "charge": charge,
+            "multiplicity": multiplicity,
+            "normal_termination": normal_termination,
+            "opt_converged": opt_converged}
+
+
+def _read_gamess_coordinates(f, scale: float) -> List[str]:
+    """
+    Reads the rows of a GAMESS coordinates table (element label, nuclear charge,
+    and Cartesian coordinates) from the given open file, stopping at the first
+    line which isn't a row.
+
+    :param f: an open file positioned at the first row of the table
+    :param scale: the factor which converts the coordinates to Angstroms
+    :return: a list of XYZ lines
+    """
+    coordinates = []
+    for line in f:
+        fields = line.split()
+        if len(fields) != 5:
+            break
+        try:
+            nuclear_charge, x, y, z = [float(i) for i in fields[1:]]
+        except ValueError:
+            break
+        coordinates.append(format_xyz_line(ELEMENT_SYMBOLS[int(round(nuclear_charge))],
+                                           x * scale, y * scale, z * scale))
+    return coordinates
+
+
+def parse_gamess_termination(output_file: Path) -> dict:
+    """
+    Determines the termination status of a GAMESS output file, reading its last
+    ``GAMESS_TAIL_LINES`` lines first. The whole file is only parsed (see
+    :func:`parse_gamess_output`) if GAMESS terminated normally but the tail
+    doesn't show whether an optimization converged. Returns a dict with the
+    following keys:
+
+    - ``normal_termination``: whether GAMESS terminated normally
+    - ``opt_converged``: whether a geometry optimization converged
+
+    :param output_file: the path to the output file
+    :return: a dict with the parsed results
+    """
+    tail = read_tail(output_file, GAMESS_TAIL_LINES)
+
+    normal_termination = any("EXECUTION OF GAMESS TERMINATED NORMALLY" in line for line in tail)
+    opt_converged = any("EQUILIBRIUM GEOMETRY LOCATED" in line for line in tail)
+
+    if normal_termination and not opt_converged and len(tail) == GAMESS_TAIL_LINES:
+        opt_converged = parse_gamess_output(output_file)["opt_converged"]
+
+    return {"normal_termination": normal_termination,
+            "opt_converged": opt_converged}
+
+
+def classify_failure(output_file: Path, program: str, error_file: Path = None) -> str:
+    """
+    Classifies the failure of a calculation from its output file and, if given,
+    the Slurm error file of its job. The failure is one of:
+
+    - ``"memory"``: the calculation ran out of memory
+    - ``"timeout"``: the calculation was killed at its time limit (see
+      :data:`TIMEOUT_MARKER`), or its output file ends without a termination
+      line (e.g., because the Slurm job itself was killed)
+    - ``"error"``: any other failure (e.g., an error termination)
+
+    :param output_file: the path to the output file
+    :param program: the QC program which wrote the output file
+    :param error_file: the path to the Slurm error file of the job
+    :return: the type of failure
+    """
+    if not file_exists(output_file):
+        return "error"
+
+    memory_error = False
+    timed_out = False
+    tail = deque(maxlen=TERMINATION_TAIL_LINES)
+
+    with open_text(output_file) as f:
+        for line in f:
+            lowered = line.lower()
+            if any(error in lowered for error in MEMORY_ERRORS):
+                memory_error = True
+            elif TIMEOUT_MARKER in line:
+                timed_out = True
+            tail.append(line)
+
+    if error_file is not None and Path(error_file).exists():
+        with open_text(error_file) as f:
+            for line in f:
+                lowered = line.lower()
+                if any(error in lowered for error in MEMORY_ERRORS):
+                    memory_error = True
+                elif "due to time limit" in lowered:
+                    timed_out = True
+
+    if memory_error:
+        return "memory"
+
+    terminated = any(fragment in line for line in tail for fragment in TERMINATION_LINES.get(program, []))
+    if timed_out or not terminated:
+        return "timeout"
+
+    return "error"
+
@@ -0,0 +1,217 @@
+import fcntl
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from pyflow.io.object_store import ObjectStore
+
+# pattern of the decimal numbers (e.g., coordinates) which are rounded when normalizing input files
+DECIMAL_PATTERN = re.compile(r"^[-+]?\d*\.\d+(?:[eEdD][-+]?\d+)?$")
+
+
+class ResultCache:
+    """
+    Class for caching the results of completed calculations across workflows.
+    Results are keyed by a hash of the normalized input file (see
+    :meth:`get_key`), so identical calculations on the same molecule are only
+    run once, regardless of the workflow or the names of the files.
+
+    The cache consists of an :class:`pyflow.io.object_store.ObjectStore` holding
+    the output files and their final-geometry sidecars, and of an append-only,
+    tab-separated index with one line per cached calculation holding the key,
+    the digest of the output file, and the digest of its sidecar (``-`` if the
+    output has no sidecar). The index is loaded once, so looking up any number
+    of keys doesn't touch the file system.
+    """
+
+    INDEX_FILENAME = "index.tsv"
+
+    # number of decimals to which coordinates (and other decimal numbers) are rounded
+    PRECISION = 4
+
+    # step parameters which determine how a calculation is run or judged but are not part of its input file
+    KEY_STEP_PARAMS = ["opt", "freq", "single_point", "gfn", "solvent"]
+
+    def __init__(self, root: Path):
+        """
+        Constructs a ResultCache which stores its index and objects in the given
+        ``root`` directory.
+
+        :param root: the directory of the cache
+        """
+        self.root = Path(root)
+        self.index_file = self.root / ResultCache.INDEX_FILENAME
+        self.object_store = ObjectStore(self.root / "objects")
+        self._index = None
+
+    @staticmethod
+    def get_key(input_file: Path, program: str, step_config: dict) -> str:
+        """
+        Computes the cache key of the given input file. The input file is
+        normalized by removing the parts which don't affect the results (e.g.,
+        the title, the Gaussian 16 link 0 commands, and the GAMESS ``$SYSTEM``
+        group), by lowercasing it, and by rounding all decimal numbers to
+        ``PRECISION`` decimals. The key is the SHA-256 hash of the normalized
+        input, the program, and the step parameters in ``KEY_STEP_PARAMS``.
+
+        :param input_file: the path to the input file
+        :param program: the program which runs the input file
+        :param step_config: the configuration of the step
+        :return: the hexadecimal key
+        """
+        lines = Path(input_file).read_text().splitlines()
+
+        if program == "gaussian16":
+            lines = ResultCache._strip_gaussian_input(lines)
+        elif program == "gamess":
+            lines = ResultCache._strip_gamess_input(lines)
+
+        normalized = [ResultCache._normalize_line(line) for line in lines]
+        params = {param: step_config[param] for param in ResultCache.KEY_STEP_PARAMS if param in step_config}
+
+        sha = hashlib.sha256()
+        sha.update(program.encode())
+        sha.update(json.dumps(params, sort_keys=True).encode())
+        sha.update("\n".join([line for line in normalized if line]).encode())
+        return sha.hexdigest()
+
+    @staticmethod
+    def is_cacheable(input_file: Path, program: str) -> bool:
+        """
+        Determines if the results of the given input file can be cached. Gaussian
+        16 input files which read their geometry from a checkpoint file (e.g.,
+        ``geom=check``) are not cacheable, since their key wouldn't depend on the
+        geometry.
+
+        :param input_file: the path to the input file
+        :param program: the program which runs the input file
+        :return: True if the input file is cacheable, False otherwise
+        """
+        if program != "gaussian16":
+            return True
+
+        with Path(input_file).open() as f:
+            for line in f:
+                if line.startswith("#"):
+                    return "check" not in "".join([k for k in line.lower().split() if k.startswith("geom=")])
+        return True
+
+    @staticmethod
+    def _strip_gaussian_input(lines: list) -> list:
+        """
+        Removes the link 0 commands and the title section from the lines of a
+        Gaussian 16 input file.
+        """
+        lines = [line for line in lines if not line.startswith("%")]
+
+        # sections are separated by blank lines: route, title, molecule specification, ...
+        sections = "\n".join(lines).split("\n\n")
+        if len(sections) > 2:
+            sections = sections[:1] + sections[2:]
+        return "\n".join(sections).splitlines()
+
+    @staticmethod
+    def _strip_gamess_input(lines: list) -> list:
+        """
+        Removes the ``$SYSTEM`` group and the title line of the ``$DATA`` group
+        from the lines of a GAMESS input file.
+        """
+        stripped = []
+        skip_title = False
+        for line in lines:
+            if skip_title:
+                skip_title = False
+                continue
+            if line.strip().upper().startswith("$SYSTEM"):
+                continue
+            if line.strip().upper() == "$DATA":
+                skip_title = True
+            stripped.append(line)
+        return stripped
+
+    @staticmethod
+    def _normalize_line(line: str) -> str:
+        """
+        Lowercases the given line, collapses its whitespace, and rounds its decimal numbers.
+        """
+        tokens = []
+        for token in line.lower().split():
+            if DECIMAL_PATTERN.match(token):
+                value = round(float(token.replace("d", "e")), ResultCache.PRECISION) + 0.0
+                token = "{:.{}f}".format(value, ResultCache.PRECISION)
+            tokens.append(token)
+        return " ".join(tokens)
+
+    def get_index(self) -> Dict[str, Tuple[str, Optional[str]]]:
+        """
+        Returns the index of the cache, loading it if necessary.
+
+        :return: a dict mapping keys to (output digest, sidecar digest) tuples
+        """
+        if self._index is None:
+            self._index = {}
+            if self.index_file.is_file():
+                with self.index_file.open() as f:
+                    for line in f:
+                        fields = line.rstrip("\n").split("\t")
+                        if len(fields) != 3:  # skip incomplete lines
+                            continue
+                        key, output_digest, sidecar_digest = fields
+                        self._index[key] = (output_digest, None if sidecar_digest == "-" else sidecar_digest)
+        return self._index
+
+    def lookup(self, keys: Iterable[str]) -> Dict[str, Tuple[str, Optional[str]]]:
+        """
+        Looks up the given keys in the cache.
+
+        :param keys: the keys to look up
+        :return: a dict mapping the keys which are cached to (output digest, sidecar digest) tuples
+        """
+        index = self.get_index()
+        return {key: index[key] for key in keys if key in index}
+
+    def restore(self, entry: Tuple[str, Optional[str]], output_file: Path, sidecar_file: Path) -> None:
+        """
+        Makes the cached output file (and its sidecar) of the given cache entry
+        available at the given paths.
+
+        :param entry: an (output digest, sidecar digest) tuple returned by :meth:`lookup`
+        :param output_file: the path at which to place the output file
+        :param sidecar_file: the path at which to place the sidecar file
+        :return: None
+        """
+        output_digest, sidecar_digest = entry
+        self.object_store.link(output_digest, output_file)
+        if sidecar_digest is not None:
+            self.object_store.link(sidecar_digest, sidecar_file)
+
+    def add(self, key: str, output_file: Path, sidecar_file: Path = None) -> None:
+        """
+        Stores the given output file (and its sidecar, if it exists) in the cache
+        under the given key. The index is locked while it is appended to, since
+        many array tasks may add results at the same time.
+
+        :param key: the key of the input file which produced the output file
+        :param output_file: the completed output file
+        :param sidecar_file: the final-geometry sidecar of the output file
+        :return: None
+        """
+        output_digest = self.object_store.put(output_file)
+        sidecar_digest = None
+        if sidecar_file is not None and Path(sidecar_file).is_file():
+            sidecar_digest = self.object_store.put(sidecar_file)
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self.index_file.open("a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write("{}\t{}\t{}\n".format(key, output_digest, sidecar_digest or "-"))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        # the index is only updated if it was loaded, so that adding results doesn't read the whole index
+        if self._index is not None:
+            self._index[key] = (output_digest, sidecar_digest)
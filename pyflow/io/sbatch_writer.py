@@ -1,12 +1,12 @@
 from __future__ import annotations
 
 import argparse
-import subprocess
 import sys
 from pathlib import Path
 from typing import List
 
 from pyflow.flow.flow_utils import load_run_params
+from pyflow.flow.slurm_executor import SlurmExecutor
 from pyflow.io.file_writer import FileWriter
 
 
@@ -105,23 +105,27 @@ class SbatchWriter(FileWriter):
             self.append("#SBATCH --mail-user={}\n#SBATCH --mail-type=END\n".format(self.args["email"]))
 
         if self.args.get("dependency_type"):
-            self.append("#SBATCH --dependency={}:{}\n".format(self.args["dependency_type"], self.args["dependency_id"]))
+            dependency_ids = self.args["dependency_id"]
+            if isinstance(dependency_ids, (list, tuple)):
+                dependency_ids = ":".join([str(job_id) for job_id in dependency_ids])
+            self.append("#SBATCH --dependency={}:{}\n".format(self.args["dependency_type"], dependency_ids))
 
         self.append("\n" + self.commands + "\n")
 
         super().write()
 
-    def submit(self) -> int:
+    def submit(self, executor: SlurmExecutor = None) -> int:
         """
-        Submits the sbatch file represented by this SbatchWriter using the ``sbatch`` command.
+        Submits the sbatch file represented by this SbatchWriter using the ``sbatch``
+        command. Transient submission errors are retried (see
+        :class:`pyflow.flow.slurm_executor.SlurmExecutor`).
 
+        :param executor: the SlurmExecutor used to submit the file (by default, one built from the run parameters)
         :return: the job ID of the submitted job
         """
-        working_dir = self.filepath.parent
-        process = subprocess.run(["sbatch", str(self.filepath.resolve())],
-                                 capture_output=True, check=True, cwd=working_dir)
-        job_id = int(process.stdout.split()[-1])
-        return job_id
+        if executor is None:
+            executor = SlurmExecutor.from_run_params()
+        return executor.submit(self.filepath, num_jobs=self.args.get("array") or 1)
 
 
 def parse_args(sys_args: List[str]) -> dict:
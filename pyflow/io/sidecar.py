@@ -0,0 +1,49 @@
+import json
+from pathlib import Path
+from typing import List
+
+from pyflow.io.io_utils import open_text
+
+# suffix of the final-geometry sidecar written next to each completed output file
+SIDECAR_SUFFIX = ".final.xyz"
+
+
+def get_sidecar_file(output_file: Path) -> Path:
+    """
+    Returns the path to the final-geometry sidecar corresponding to the given
+    output file (e.g., ``X_pm7_0.final.xyz`` for ``X_pm7_0.log``).
+
+    :param output_file: the path to the output file
+    :return: a Path object to the sidecar file
+    """
+    return Path(output_file).with_suffix(SIDECAR_SUFFIX)
+
+
+def write_sidecar(sidecar_file: Path, coordinates: List[str], **properties) -> None:
+    """
+    Writes a final-geometry sidecar. The sidecar is a valid XYZ file whose comment
+    line holds the given properties (e.g., the energy, charge, and termination
+    status of the calculation) as a single-line JSON object.
+
+    :param sidecar_file: the path to the sidecar file
+    :param coordinates: a list of XYZ lines (element symbol and coordinates in Angstroms)
+    :param properties: JSON-serializable properties to store in the comment line
+    :return: None
+    """
+    lines = [str(len(coordinates)), json.dumps(properties)] + coordinates
+    Path(sidecar_file).write_text("\n".join(lines) + "\n")
+
+
+def read_sidecar(sidecar_file: Path) -> dict:
+    """
+    Reads a final-geometry sidecar written by :func:`write_sidecar`.
+
+    :param sidecar_file: the path to the sidecar file
+    :return: a dict of the stored properties, with the XYZ lines stored under ``coordinates``
+    :raises FileNotFoundError: if the sidecar file does not exist
+    """
+    with open_text(sidecar_file) as f:
+        num_atoms = int(f.readline())
+        properties = json.loads(f.readline())
+        properties["coordinates"] = [f.readline().rstrip("\n") for _ in range(num_atoms)]
+    return properties
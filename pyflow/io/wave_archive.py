@@ -0,0 +1,341 @@
+import io
+import os
+import re
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from pyflow.io.io_utils import get_compression
+
+
+class WaveArchive:
+    """
+    Class for packing the finished files of a workflow wave into a single
+    archive file with a random-access index, which recovers the inode budget
+    used by thousands of small files while keeping every file readable.
+
+    The archive consists of two files stored in the wave directory:
+
+    - ``archive.pfa``: the concatenated members, each compressed independently
+      with zlib (members which are already compressed are stored as-is)
+    - ``archive.idx``: a tab-separated index with one line per member holding
+      the member name (its path relative to the wave directory), the offset and
+      size of the member in ``archive.pfa``, its uncompressed size, and its
+      storage method
+    - ``archive.del``: the names of the members which were superseded (e.g., the
+      failed jobs of the wave which were restarted), one per line; these members
+      are left in ``archive.pfa`` but are hidden from the index
+
+    Members are appended to the archive as a stream, and each index line is
+    only written once its member has been flushed to the archive, so an
+    interrupted archiving run can simply be resumed.
+    """
+
+    ARCHIVE_FILENAME = "archive.pfa"
+    INDEX_FILENAME = "archive.idx"
+    TOMBSTONE_FILENAME = "archive.del"
+
+    # pattern of the wave directory names in which archives are stored
+    WAVE_DIR_PATTERN = re.compile(r"^wave_\d+_calcs$")
+
+    # size of the chunks in which members are read and compressed
+    CHUNK_SIZE = 1 << 20
+
+    # size above which a compressed member is spooled to a temporary file rather than kept in memory
+    SPOOL_SIZE = 8 << 20
+
+    # cache of WaveArchive objects by wave directory
+    _archives = {}
+
+    def __init__(self, wave_dir: Path):
+        """
+        Constructs a WaveArchive object for the archive in the given wave directory.
+
+        :param wave_dir: the wave directory (e.g., ``wave_1_calcs``)
+        """
+        self.wave_dir = Path(wave_dir)
+        self.archive_file = self.wave_dir / WaveArchive.ARCHIVE_FILENAME
+        self.index_file = self.wave_dir / WaveArchive.INDEX_FILENAME
+        self.tombstone_file = self.wave_dir / WaveArchive.TOMBSTONE_FILENAME
+        self._index = None
+        self._signature = None
+
+    @classmethod
+    def get(cls, wave_dir: Path) -> "WaveArchive":
+        """
+        Returns the (cached) WaveArchive object for the given wave directory, so
+        that its index is only loaded once per process. The cached object is
+        replaced if the archive was changed since its index was loaded.
+
+        :param wave_dir: the wave directory
+        :return: a WaveArchive object
+        """
+        wave_dir = Path(wave_dir)
+        archive = cls._archives.get(wave_dir)
+        if archive is None or archive.is_stale():
+            archive = cls._archives[wave_dir] = WaveArchive(wave_dir)
+        return archive
+
+    @classmethod
+    def locate(cls, filepath: Path) -> Optional[Tuple["WaveArchive", str]]:
+        """
+        Finds the archive which holds the given (archived) file, if any.
+
+        :param filepath: the original path of the archived file
+        :return: a 2-tuple with the WaveArchive and the member name, or None if the file is not archived
+        """
+        filepath = Path(filepath).absolute()
+        for parent in filepath.parents:
+            if WaveArchive.WAVE_DIR_PATTERN.match(parent.name):
+                archive = cls.get(parent)
+                name = filepath.relative_to(parent).as_posix()
+                if archive.exists() and name in archive.get_index():
+                    return archive, name
+                return None
+        return None
+
+    def exists(self) -> bool:
+        """
+        Determines if the archive exists.
+
+        :return: True if the archive index exists, False otherwise
+        """
+        return self.index_file.is_file()
+
+    def is_stale(self) -> bool:
+        """
+        Determines if the archive was changed (e.g., by another WaveArchive object
+        or process) since its index was loaded.
+
+        :return: True if the loaded index may be out of date, False otherwise
+        """
+        return self._index is not None and self._signature != self._get_signature()
+
+    def _get_signature(self) -> Tuple[Optional[Tuple[int, int]], ...]:
+        """
+        Returns the modification time and size of the index and tombstone files.
+        """
+        signature = []
+        for f in [self.index_file, self.tombstone_file]:
+            try:
+                stat = f.stat()
+                signature.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def get_index(self) -> Dict[str, Tuple[int, int, int, str]]:
+        """
+        Returns the index of the archive, loading it if necessary. Superseded
+        members (see :meth:`remove`) are left out.
+
+        :return: a dict mapping member names to (offset, compressed size, size, method) tuples
+        """
+        if self._index is None:
+            self._signature = self._get_signature()
+            self._index = {}
+            if self.exists():
+                with self.index_file.open() as f:
+                    for line in f:
+                        fields = line.rstrip("\n").split("\t")
+                        if len(fields) != 5:  # skip incomplete lines
+                            continue
+                        name, offset, csize, size, method = fields
+                        self._index[name] = (int(offset), int(csize), int(size), method)
+            if self.tombstone_file.is_file():
+                with self.tombstone_file.open() as f:
+                    for line in f:
+                        if line.endswith("\n"):  # skip incomplete lines
+                            self._index.pop(line[:-1], None)
+        return self._index
+
+    def get_names(self) -> List[str]:
+        """
+        Returns the names of all archive members.
+
+        :return: a list of member names
+        """
+        return list(self.get_index())
+
+    def match(self, pattern: str) -> List[str]:
+        """
+        Returns the names of the archive members which match the given glob
+        pattern (relative to the wave directory).
+
+        :param pattern: the glob pattern, e.g., ``completed/*.log``
+        :return: a list of matching member names
+        """
+        num_parts = len(PurePosixPath(pattern).parts)
+        matches = []
+        for name in self.get_index():
+            name_path = PurePosixPath(name)
+            if len(name_path.parts) == num_parts and name_path.match(pattern):
+                matches.append(name)
+        return matches
+
+    def open(self, name: str) -> BinaryIO:
+        """
+        Opens the given archive member for reading, without unpacking the archive.
+        The member is decompressed as it is read.
+
+        :param name: the member name
+        :return: a binary file object
+        :raises FileNotFoundError: if the member is not in the archive
+        """
+        try:
+            offset, csize, size, method = self.get_index()[name]
+        except KeyError:
+            raise FileNotFoundError("'{}' is not in the archive {}".format(name, self.archive_file))
+        return io.BufferedReader(_MemberReader(self.archive_file, offset, csize, method))
+
+    def add(self, files: List[Path], num_threads: int = None) -> None:
+        """
+        Appends the given files (which must be located in the wave directory) to
+        the archive. The files are compressed in parallel and appended in order;
+        files that are already in the archive are skipped.
+
+        :param files: a list of Path objects to archive
+        :param num_threads: the number of compression threads
+        :return: None
+        """
+        if num_threads is None:
+            num_threads = os.cpu_count() or 1
+
+        index = self.get_index()
+        names = [Path(f).relative_to(self.wave_dir).as_posix() for f in files]
+        new_files = [(name, f) for name, f in zip(names, files) if name not in index]
+
+        # compress in windows so that memory usage stays bounded
+        window_size = 2 * num_threads
+        with ThreadPoolExecutor(max_workers=num_threads) as executor, \
+                self.archive_file.open("ab") as archive, self.index_file.open("a") as index_file:
+            for i in range(0, len(new_files), window_size):
+                window = new_files[i:i + window_size]
+                compressed = executor.map(WaveArchive._compress_member, [f for _, f in window])
+
+                entries = []
+                for (name, filepath), (spool, size, method) in zip(window, compressed):
+                    offset = archive.tell()
+                    if spool is None:
+                        with Path(filepath).open("rb") as f:
+                            shutil.copyfileobj(f, archive, WaveArchive.CHUNK_SIZE)
+                    else:
+                        with spool:
+                            shutil.copyfileobj(spool, archive, WaveArchive.CHUNK_SIZE)
+                    csize = archive.tell() - offset
+                    entries.append((name, offset, csize, csize if method == "stored" else size, method))
+
+                # only index the members once they are safely stored
+                archive.flush()
+                os.fsync(archive.fileno())
+                for name, offset, csize, size, method in entries:
+                    index_file.write("{}\t{}\t{}\t{}\t{}\n".format(name, offset, csize, size, method))
+                    index[name] = (offset, csize, size, method)
+                index_file.flush()
+
+    def remove(self, names: List[str]) -> None:
+        """
+        Removes the given members from the archive. The archive is append-only,
+        so the members are recorded in the tombstone file, which hides them from
+        the index (and thus from :meth:`match`, :meth:`open`, and :meth:`locate`).
+        Names which are not in the archive are ignored.
+
+        :param names: the names of the members to remove
+        :return: None
+        """
+        index = self.get_index()
+        names = [name for name in names if name in index]
+        if len(names) == 0:
+            return None
+
+        with self.tombstone_file.open("a") as f:
+            f.write("".join(["{}\n".format(name) for name in names]))
+            f.flush()
+
+        for name in names:
+            del index[name]
+
+    @staticmethod
+    def _compress_member(filepath: Path) -> Tuple[Optional[BinaryIO], int, str]:
+        """
+        Compresses the given file for storage in the archive, in chunks. The
+        compressed data is kept in memory up to ``SPOOL_SIZE`` bytes and spooled
+        to a temporary file beyond, so large members (e.g., checkpoint files)
+        don't need to fit in memory. Files which are already compressed (see
+        :func:`pyflow.io.io_utils.compress_file`) are stored as-is, and are
+        copied straight from the file into the archive.
+
+        :param filepath: the file to compress
+        :return: a 3-tuple with the compressed data (rewound, or None for stored files), the original size,
+                 and the storage method
+        """
+        if get_compression(filepath) is not None:
+            return None, Path(filepath).stat().st_size, "stored"
+
+        compressor = zlib.compressobj(6)
+        spool = tempfile.SpooledTemporaryFile(max_size=WaveArchive.SPOOL_SIZE)
+        size = 0
+        try:
+            with Path(filepath).open("rb") as f:
+                for chunk in iter(lambda: f.read(WaveArchive.CHUNK_SIZE), b""):
+                    size += len(chunk)
+                    spool.write(compressor.compress(chunk))
+            spool.write(compressor.flush())
+            spool.seek(0)
+        except BaseException:
+            spool.close()
+            raise
+        return spool, size, "zlib"
+
+
+class _MemberReader(io.RawIOBase):
+    """
+    Raw, read-only stream over a single archive member.
+    """
+
+    def __init__(self, archive_file: Path, offset: int, csize: int, method: str):
+        self._file = archive_file.open("rb")
+        self._file.seek(offset)
+        self._remaining = csize
+        self._decompressor = zlib.decompressobj() if method == "zlib" else None
+        self._buffer = b""
+        self._pos = 0
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self) -> None:
+        while self._pos >= len(self._buffer) and not self._eof:
+            if self._remaining > 0:
+                chunk = self._file.read(min(WaveArchive.CHUNK_SIZE, self._remaining))
+                self._remaining = self._remaining - len(chunk) if chunk else 0
+            else:
+                chunk = b""
+
+            if self._decompressor is None:
+                data = chunk
+            elif chunk:
+                data = self._decompressor.decompress(chunk)
+            else:
+                data = self._decompressor.flush()
+
+            if not chunk:
+                self._eof = True
+
+            self._buffer = data
+            self._pos = 0
+
+    def readinto(self, b) -> int:
+        self._fill()
+        n = min(len(b), len(self._buffer) - self._pos)
+        b[:n] = self._buffer[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
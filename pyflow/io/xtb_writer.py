@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Tuple
+
+from pyflow.io.file_writer import AbstractInputFileWriter
+
+
+# script for creating xtb input files
+
+class XtbWriter(AbstractInputFileWriter):
+    """
+    Writer for xtb input files. The input file is an XYZ file whose comment line
+    holds the charge and the number of unpaired electrons of the molecule
+    (e.g., ``chrg=0 uhf=0``), which are passed to xtb on the command line since
+    xtb doesn't read them from XYZ files (see :meth:`read_charge_and_uhf`).
+    """
+
+    @classmethod
+    def get_openbabel_format(cls) -> str:
+        return "xyz"
+
+    @classmethod
+    def compile_template(cls, args: dict) -> str:
+        # charge and unpaired electrons replace the OpenBabel generated comment line
+        uhf = args.get("multiplicity", 1) - 1
+        return "{num_atoms}\nchrg={charge} uhf=" + str(uhf) + "\n{coordinates}"
+
+    @classmethod
+    def render(cls, template: str, title: str, charge: int, coordinates: str) -> str:
+        num_atoms, _, coordinates = coordinates.split("\n", 2)
+        return template.format(num_atoms=num_atoms.strip(), charge=charge, coordinates=coordinates)
+
+    @staticmethod
+    def read_charge_and_uhf(input_file: Path) -> Tuple[int, int]:
+        """
+        Reads the charge and the number of unpaired electrons from the comment line
+        of the given xtb input file.
+
+        :param input_file: the path to the input file
+        :return: a 2-tuple with the charge and the number of unpaired electrons
+        """
+        with Path(input_file).open() as f:
+            f.readline()
+            comment = f.readline()
+
+        fields = dict(field.split("=", 1) for field in comment.split() if "=" in field)
+
+        return int(fields.get("chrg", 0)), int(fields.get("uhf", 0))
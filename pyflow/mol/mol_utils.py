@@ -1,11 +1,13 @@
 import os
+import numpy as np
 from openbabel import openbabel
 from pathlib import Path
 from typing import List
 
 from rdkit import Chem
 
-from pyflow.io.io_utils import find_string
+from pyflow.io.io_utils import find_string, get_compression, open_text
+from pyflow.io.output_parser import parse_gamess_output
 
 
 def get_charge(smiles: str) -> int:
@@ -23,7 +25,9 @@ def get_formatted_geometry(geometry_file: str, output_format: str, geometry_form
     """
     Returns the formatted molecular geometry from the given geometry file. The
     format of the geometry file is assumed based on the filename extension but
-    can be specified with the ``geometry_format`` keyword argument.
+    can be specified with the ``geometry_format`` keyword argument. Compressed
+    geometry files (see :func:`pyflow.io.io_utils.compress_file`) and files packed
+    into wave archives are supported.
 
     For a list of supported geometry formats, refer to the `Open Babel documentation
     <https://open-babel.readthedocs.io/en/latest/FileFormats/Overview.html>`_.
@@ -40,7 +44,11 @@ def get_formatted_geometry(geometry_file: str, output_format: str, geometry_form
     obConversion.SetInAndOutFormats(geometry_format, output_format)
 
     mol = openbabel.OBMol()
-    obConversion.ReadFile(mol, geometry_file)
+    if Path(geometry_file).is_file() and get_compression(geometry_file) is None:
+        obConversion.ReadFile(mol, geometry_file)
+    else:
+        with open_text(geometry_file) as f:
+            obConversion.ReadString(mol, f.read())
 
     formatted_output = obConversion.WriteString(mol)
 
@@ -64,7 +72,12 @@ def get_energy(output_file: str, format: str, excited_state: bool = False) -> fl
         energy_line = find_string(Path(output_file).resolve(), "SCF Done")[-1]
         energy = float(energy_line.split("A.U.")[0].split()[-1]) * 27.2113246
     elif format == "gamess":
-        raise NotImplementedError("GAMESS get_energy not implemented")
+        energy = parse_gamess_output(Path(output_file).resolve())["energy"]
+        if energy is None:
+            raise ValueError("Unable to find the energy in GAMESS output file {}".format(output_file))
+    elif format == "xtb":
+        energy_line = find_string(Path(output_file).resolve(), "TOTAL ENERGY")[-1]
+        energy = float(energy_line.split()[3]) * 27.2113246
     else:
         raise AttributeError("Unable to obtain energy from file format '{}'".format(format))
     return energy
@@ -119,3 +132,29 @@ def valid_smiles(smiles: str) -> bool:
     """
     mol = Chem.MolFromSmiles(smiles)
     return mol is not None
+
+
+def get_pairwise_rmsd(coordinates: np.ndarray) -> np.ndarray:
+    """
+    Returns the matrix of RMSDs between all pairs of the given conformers after
+    optimal alignment (Kabsch algorithm). All pairs are aligned at once using
+    batched singular value decompositions.
+
+    :param coordinates: an array of shape (num_conformers, num_atoms, 3) with the Cartesian coordinates
+    :return: an array of shape (num_conformers, num_conformers) with the RMSDs
+    """
+    coordinates = np.asarray(coordinates, dtype=float)
+    num_atoms = coordinates.shape[1]
+    centered = coordinates - coordinates.mean(axis=1, keepdims=True)
+
+    # covariance matrices and singular values for every pair of conformers
+    covariance = np.einsum("ink,jnl->ijkl", centered, centered)
+    u, s, vt = np.linalg.svd(covariance)
+
+    # correct for reflections
+    d = np.sign(np.linalg.det(u) * np.linalg.det(vt))
+    s[..., -1] *= d
+
+    squared_norms = np.sum(centered ** 2, axis=(1, 2))
+    deviation = squared_norms[:, None] + squared_norms[None, :] - 2 * s.sum(axis=-1)
+    return np.sqrt(np.clip(deviation, 0, None) / num_atoms)
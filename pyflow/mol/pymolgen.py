@@ -2,6 +2,7 @@ import argparse
 import os
 import sys
 import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 from itertools import chain
 
 from rdkit import Chem
@@ -9,6 +10,7 @@ from rdkit import rdBase
 from rdkit.Chem import AllChem
 from tqdm import tqdm
 
+from pyflow.flow.flow_utils import get_available_cpus
 from pyflow.mol.mol_utils import valid_smiles
 
 rdBase.DisableLog('rdApp.warning')
@@ -67,51 +69,197 @@ terminal_placeholder = '[*:1]([Y])'
 terminal_placeholder_mol = Chem.MolFromSmarts(terminal_placeholder)
 
 
+# reactions compiled once so that they can be reused for every core
+compiled_linker_rxns = {name: AllChem.ReactionFromSmarts(smarts)
+                        for name, smarts in linker_rxns.items()}
+compiled_terminal_rxns = {name: AllChem.ReactionFromSmarts(smarts)
+                          for name, smarts in terminal_rxns.items()}
+
+
+# applies the given reaction to every placeholder of the given molecule
+def substitute_placeholders(mol, rxn, place_holder_count, sanitize):
+    for i in range(place_holder_count):
+        new_mols = list(chain.from_iterable(rxn.RunReactants((mol,))))
+        mol = new_mols[0]
+        if sanitize:
+            Chem.SanitizeMol(mol)
+        else:
+            Chem.Cleanup(mol)
+    return mol
+
+
+# yields the unique canonical SMILES strings of the library for the given core
+# smiles as they are enumerated; SMILES strings in seen are skipped and seen is
+# updated with every new SMILES string
+def enumerate_library(parent_smiles, seen=None):
+    if seen is None:
+        seen = set()
+
+    parent_mol = Chem.MolFromSmiles(parent_smiles, sanitize=False)
+    linker_count = len(parent_mol.GetSubstructMatches(linker_placeholder_mol))
+
+    for linker_rxn in compiled_linker_rxns.values():
+        # append linkers to parent molecule to generate unsubstituted core
+        core = substitute_placeholders(parent_mol, linker_rxn, linker_count, sanitize=True)
+
+        # append terminal groups
+        terminal_count = len(core.GetSubstructMatches(terminal_placeholder_mol))
+        if terminal_count == 0:
+            new_mols = [core]
+        else:
+            new_mols = (substitute_placeholders(core, terminal_rxn, terminal_count, sanitize=False)
+                        for terminal_rxn in compiled_terminal_rxns.values())
+
+        for new_mol in new_mols:
+            # canonicalize smiles to remove duplicates
+            mol = Chem.MolFromSmiles(Chem.MolToSmiles(new_mol))
+            if mol is None:
+                continue
+            smiles = Chem.MolToSmiles(mol)
+            if smiles not in seen:
+                seen.add(smiles)
+                yield smiles
+
+
 # generates SMILES strings for the given core smiles
 def generate_library(parent_smiles):
-    parent_mol = Chem.MolFromSmiles(parent_smiles, sanitize=False)
+    return list(enumerate_library(parent_smiles))
+
+
+# yields the unique SMILES strings of the libraries for all of the given core
+# smiles; with more than one worker, the cores are processed in parallel
+def generate_libraries(list_of_parent_smiles, num_workers=1):
+    seen = set()
+    if num_workers <= 1:
+        for parent_smiles in list_of_parent_smiles:
+            yield from enumerate_library(parent_smiles, seen)
+        return
+
+    tasks = [(parent_smiles,) for parent_smiles in list_of_parent_smiles]
+    for library in imap_unordered(generate_library, tasks, num_workers):
+        for smiles in library:
+            if smiles not in seen:
+                seen.add(smiles)
+                yield smiles
+
+
+# runs func on each of the given argument tuples using a pool of num_workers
+# processes and yields the results as they complete; at most 2 * num_workers
+# tasks are in flight at any time so that memory usage stays bounded
+def imap_unordered(func, args_iter, num_workers):
+    if num_workers <= 1:
+        for args in args_iter:
+            yield func(*args)
+        return
+
+    args_iter = iter(args_iter)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        pending = set()
+        for args in args_iter:
+            pending.add(executor.submit(func, *args))
+            if len(pending) >= 2 * num_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+
+# returns the number of threads each of the given number of workers may use, sharing
+# the CPUs available to the process (e.g., those allocated by Slurm) rather than the node's
+def get_threads_per_worker(num_workers):
+    if num_workers <= 1:
+        return 0  # use all available threads
+    return max(1, get_available_cpus() // num_workers)
+
+
+# returns the IDs of the conformers to keep, lowest MMFF energy first; conformers
+# more than energy_window kcal/mol above the lowest energy conformer or within
+# rms_threshold Angstroms (heavy-atom RMSD) of a kept conformer are pruned
+def prune_conformers(mol, conf_ids, energies, energy_window=None, rms_threshold=None):
+    ranked = sorted(zip(conf_ids, energies), key=lambda x: x[1])
+    min_energy = ranked[0][1]
+
+    if energy_window:
+        ranked = [(conf_id, energy) for conf_id, energy in ranked
+                  if energy - min_energy <= energy_window]
+
+    if not rms_threshold:
+        return [conf_id for conf_id, _ in ranked]
+
+    # align copies of the conformers so that the written geometries are untouched
+    heavy_mol = Chem.RemoveHs(mol)
+    kept_ids = []
+    for conf_id, _ in ranked:
+        if all(AllChem.GetConformerRMS(heavy_mol, kept_id, conf_id) >= rms_threshold
+               for kept_id in kept_ids):
+            kept_ids.append(conf_id)
+    return kept_ids
+
+
+# embeds, optimizes and writes the conformers of a single molecule to PDB files
+# in out_folder; returns the SMILES string, the number of written conformers,
+# and the target number of conformers for the molecule (1 if it has no
+# rotatable bonds); conformers are optionally pruned (see prune_conformers)
+def embed_molecule(smile, out_folder, num_confs, num_threads=0, energy_window=None, rms_threshold=None):
+    print(smile)
+    mol = Chem.AddHs(Chem.MolFromSmiles(smile))
+
+    num_rotatable_bonds = AllChem.CalcNumRotatableBonds(mol)
+
+    if num_rotatable_bonds == 0:
+        target_num_confs = 1
+    else:
+        target_num_confs = num_confs
 
-    # append linkers to parent molecule to generate unsubstituted cores
-    unsubstituted_cores = []
-    place_holder_count = len(
-        parent_mol.GetSubstructMatches(linker_placeholder_mol))
-    for linker in linker_rxns:
-        rxn = AllChem.ReactionFromSmarts(linker_rxns[linker])
-        core = parent_mol
-        for i in range(place_holder_count):
-            new_mols = list(chain.from_iterable(rxn.RunReactants((core,))))
-            core = new_mols[0]
-            Chem.SanitizeMol(core)
-        unsubstituted_cores.append(core)
-
-    # append terminal groups
-    all_mols = []
-    for core in unsubstituted_cores:
-        place_holder_count = len(
-            core.GetSubstructMatches(terminal_placeholder_mol))
-        if place_holder_count == 0:
-            all_mols.append(core)
-            continue
-        for terminal in terminal_rxns:
-            new_mol = core
-            rxn = AllChem.ReactionFromSmarts(terminal_rxns[terminal])
-            for i in range(place_holder_count):
-                new_mols = list(
-                    chain.from_iterable(rxn.RunReactants((new_mol,))))
-                new_mol = new_mols[0]
-                Chem.Cleanup(new_mol)
-            all_mols.append(Chem.MolFromSmiles(Chem.MolToSmiles(new_mol)))
-
-    # canonicalize smiles to remove duplicates
-    all_mols = [Chem.MolFromSmiles(smiles) for smiles in
-                [Chem.MolToSmiles(mol) for mol in all_mols]]
-    all_smiles = list(set([Chem.MolToSmiles(mol) for mol in all_mols]))
-
-    return all_smiles
-
-
-# generates conformers for the given list of smiles strings
-def generate_conformers(list_of_smiles, library_name, num_confs):
+    # generate conformers
+    num_generated_confs = 0
+    embed_rms_threshold = 0.005
+
+    while num_generated_confs < target_num_confs and embed_rms_threshold > 0:
+        confs = AllChem.EmbedMultipleConfs(mol,
+                                           numConfs=target_num_confs,
+                                           useRandomCoords=False,
+                                           pruneRmsThresh=embed_rms_threshold,
+                                           numThreads=num_threads,
+                                           useBasicKnowledge=True,
+                                           forceTol=0.001)
+        num_generated_confs = len(confs)
+        embed_rms_threshold -= 0.001
+        print("RMS threshold updated to: {}".format(embed_rms_threshold))
+
+    if num_generated_confs == 0:
+        return smile, 0, target_num_confs
+
+    # optimize conformers
+    # opt = AllChem.UFFOptimizeMoleculeConfs(mol, numThreads=0, maxIters=1000, vdwThresh=10, ignoreInterfragInteractions=True)
+    opt = AllChem.MMFFOptimizeMoleculeConfs(mol, numThreads=num_threads, maxIters=10000, nonBondedThresh=10,
+                                            ignoreInterfragInteractions=True)
+    print(opt)
+
+    # prune high-energy and duplicate conformers
+    conf_ids = list(confs)
+    if energy_window or rms_threshold:
+        energies = [energy for _, energy in opt]
+        conf_ids = prune_conformers(mol, conf_ids, energies, energy_window, rms_threshold)
+        print("Kept {} of {} conformers".format(len(conf_ids), num_generated_confs))
+
+    # write conformers to PDB files, numbered contiguously
+    inchi_key = Chem.InchiToInchiKey(Chem.MolToInchi(mol))
+    for i, conf_id in enumerate(conf_ids):
+        conf_name = f"{inchi_key}_{i}.pdb"
+        pdb_file = os.path.join(out_folder, conf_name)
+        pdb_writer = Chem.PDBWriter(pdb_file)
+        pdb_writer.write(mol, conf_id)
+        pdb_writer.close()
+
+    return smile, len(conf_ids), target_num_confs
+
+
+# generates conformers for the given list of smiles strings; with more than
+# one worker, molecules are distributed over a pool of processes
+def generate_conformers(list_of_smiles, library_name, num_confs, num_workers=1,
+                        energy_window=None, rms_threshold=None):
     # create directory to store molecules
     if not os.path.exists(library_name):
         os.makedirs(library_name)
@@ -124,59 +272,23 @@ def generate_conformers(list_of_smiles, library_name, num_confs):
 
     start_time = time.time()
 
+    num_threads = get_threads_per_worker(num_workers)
+    tasks = [(smile, out_folder, num_confs, num_threads, energy_window, rms_threshold)
+             for smile in list_of_smiles]
+    results = imap_unordered(embed_molecule, tasks, num_workers)
+
     good_conformers = 0
     no_rotatable_bonds = 0
     no_conformers = 0
-    for smile in tqdm(list_of_smiles, desc="Generating conformers..."):
-        print(smile)
-        mol = Chem.AddHs(Chem.MolFromSmiles(smile))
-
-        num_rotatable_bonds = AllChem.CalcNumRotatableBonds(mol)
-
-        if num_rotatable_bonds == 0:
-            target_num_confs = 1
-        else:
-            target_num_confs = num_confs
-
-        # generate conformers
-        num_generated_confs = 0
-        rms_threshold = 0.005
-
-        while num_generated_confs < target_num_confs and rms_threshold > 0:
-            confs = AllChem.EmbedMultipleConfs(mol,
-                                               numConfs=target_num_confs,
-                                               useRandomCoords=False,
-                                               pruneRmsThresh=rms_threshold,
-                                               numThreads=0,
-                                               useBasicKnowledge=True,
-                                               forceTol=0.001)
-            num_generated_confs = len(confs)
-            rms_threshold -= 0.001
-            print("RMS threshold updated to: {}".format(rms_threshold))
-
+    for _, num_written_confs, target_num_confs in tqdm(results, total=len(tasks),
+                                                       desc="Generating conformers..."):
         # track number of successfully generated conformers
-        if num_generated_confs == 0:
+        if num_written_confs == 0:
             no_conformers += 1
-            continue
-        elif num_generated_confs == 1:
+        elif target_num_confs == 1:
             no_rotatable_bonds += 1
         else:
-            good_conformers += target_num_confs
-
-        # optimize conformers
-        # opt = AllChem.UFFOptimizeMoleculeConfs(mol, numThreads=0, maxIters=1000, vdwThresh=10, ignoreInterfragInteractions=True)
-        opt = AllChem.MMFFOptimizeMoleculeConfs(mol, numThreads=0, maxIters=10000, nonBondedThresh=10,
-                                                ignoreInterfragInteractions=True)
-        print(opt)
-
-        # write conformers to PDB files
-        inchi_key = Chem.InchiToInchiKey(Chem.MolToInchi(mol))
-        for conf_id in range(num_generated_confs):
-            conf_name = f"{inchi_key}_{conf_id}.pdb"
-            pdb_file = os.path.join(out_folder, conf_name)
-            pdb_writer = Chem.PDBWriter(pdb_file)
-            pdb_writer.write(mol, conf_id)
-            pdb_writer.close()
+            good_conformers += num_written_confs
 
     # reporting
     time_taken = round(time.time() - start_time, 2)
@@ -214,15 +326,16 @@ def main(args):
         sys.exit()
 
     # generate library
-    all_smiles = []
-    for smiles in tqdm(parent_smiles, desc="Generating molecules..."):
-        new_smiles = generate_library(smiles)
-        all_smiles += new_smiles
+    all_smiles = list(tqdm(generate_libraries(parent_smiles, args["num_workers"]),
+                           desc="Generating molecules..."))
 
     # generate conformers
     report, time_taken = generate_conformers(all_smiles,
                                              args["name"],
-                                             args["num_confs"])
+                                             args["num_confs"],
+                                             num_workers=args["num_workers"],
+                                             energy_window=args["energy_window"],
+                                             rms_threshold=args["rms_threshold"])
 
     # reporting
     total_num_confs = report[0]
@@ -260,6 +373,18 @@ def parse_args():
                         type=int,
                         default=4,
                         help="number of conformers to generate for each unique molecule")
+    parser.add_argument("-w", "--num_workers",
+                        type=int,
+                        default=1,
+                        help="number of processes across which to distribute the molecules")
+    parser.add_argument("-e", "--energy_window",
+                        type=float,
+                        default=None,
+                        help="discard conformers more than this MMFF energy (kcal/mol) above the lowest")
+    parser.add_argument("-r", "--rms_threshold",
+                        type=float,
+                        default=None,
+                        help="discard conformers within this heavy-atom RMSD (Angstroms) of a lower-energy one")
 
     args = vars(parser.parse_args())
 
@@ -0,0 +1,5 @@
+import os
+from pathlib import Path
+
+# the run parameters are loaded from the pyflow package when the modules are imported
+os.environ.setdefault("PYFLOW", str(Path(__file__).resolve().parents[2]))
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+for module in ["numpy", "openbabel", "rdkit"]:
+    pytest.importorskip(module)
+
+from pyflow.io.file_writer import FileBatch, FileWriter
+
+
+def count_fsyncs(monkeypatch):
+    fsyncs = []
+    fsync = os.fsync
+
+    def record(fd):
+        fsyncs.append(fd)
+        fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", record)
+    return fsyncs
+
+
+def test_batch_syncs_each_directory_once(tmp_path, monkeypatch):
+    fsyncs = count_fsyncs(monkeypatch)
+
+    with FileBatch() as batch:
+        for i in range(10):
+            batch.add(FileWriter(tmp_path / "{}.com".format(i), text="input {}\n".format(i)))
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted("{}.com".format(i) for i in range(10))
+    assert (tmp_path / "3.com").read_text() == "input 3\n"
+    assert batch.num_written == 10
+    assert len(fsyncs) == 1
+
+
+def test_batch_syncs_files_on_request(tmp_path, monkeypatch):
+    fsyncs = count_fsyncs(monkeypatch)
+
+    with FileBatch(fsync_files=True) as batch:
+        for i in range(3):
+            batch.add(FileWriter(tmp_path / "{}.com".format(i), text="input\n"))
+
+    assert len(fsyncs) == 4
+
+
+def test_batch_skips_unchanged_files(tmp_path):
+    (tmp_path / "a.com").write_text("same\n")
+    (tmp_path / "b.com").write_text("old\n")
+
+    with FileBatch(overwrite=True) as batch:
+        batch.add(FileWriter(tmp_path / "a.com", text="same\n"))
+        batch.add(FileWriter(tmp_path / "b.com", text="new\n"))
+
+    assert (batch.num_written, batch.num_unchanged) == (1, 1)
+    assert (tmp_path / "b.com").read_text() == "new\n"
@@ -0,0 +1,48 @@
+from pyflow.flow.flow_config import FlowConfig
+
+
+def test_num_helper_jobs_of_last_step():
+    assert FlowConfig.get_num_helper_jobs({"dependents": []}) == 1
+
+
+def test_num_helper_jobs_counts_final_jobs():
+    step_config = {"dependents": ["b", "c"], "save_output": True, "attempt_restart": True}
+    assert FlowConfig.get_num_helper_jobs(step_config) == 4
+
+    step_config["adaptive_throttle"] = True
+    assert FlowConfig.get_num_helper_jobs(step_config) == 5
+
+
+def get_config(**last_step_params):
+    config = {"initial_step": "pm7",
+              "steps": {"pm7": {"program": "gaussian16", "route": "#p pm7 opt", "dependents": ["rm1"]},
+                        "rm1": {"program": "gamess", "gbasis": "RM1", "dependents": ["dft"]},
+                        "dft": {"program": "gaussian16", "route": "#p M06/6-31+G(d,p) opt"}}}
+    config["steps"]["dft"].update(last_step_params)
+    return config
+
+
+def test_valid_config():
+    assert FlowConfig.valid_config(get_config())
+
+
+def test_valid_config_checks_every_step():
+    assert not FlowConfig.valid_config(get_config(deadline_margin=-1))
+    assert not FlowConfig.valid_config(get_config(max_array_size=1))
+    assert not FlowConfig.valid_config(get_config(max_submit_jobs=1))
+
+
+def test_reused_guess_requires_previous_gaussian_step():
+    assert not FlowConfig.valid_config(get_config(reuse_guess_from_previous=True))
+
+    config = get_config(reuse_guess_from_previous=True)
+    config["steps"]["rm1"] = {"program": "gaussian16", "route": "#p pm7 opt", "dependents": ["dft"]}
+    assert FlowConfig.valid_config(config)
+
+
+def test_restart_requires_restartable_program():
+    config = {"initial_step": "xtb", "steps": {"xtb": {"program": "xtb", "attempt_restart": True}}}
+    assert not FlowConfig.valid_config(config)
+
+    config["steps"]["xtb"]["attempt_restart"] = False
+    assert FlowConfig.valid_config(config)
@@ -0,0 +1,295 @@
+import os
+from pathlib import Path
+
+import pytest
+
+for module in ["numpy", "openbabel", "rdkit", "tqdm"]:
+    pytest.importorskip(module)
+
+from pyflow.flow.flow_runner import FlowRunner
+
+
+def test_split_simul_jobs():
+    assert FlowRunner.split_simul_jobs(50, 1) == [50]
+    assert FlowRunner.split_simul_jobs(50, 3) == [17, 17, 16]
+    assert FlowRunner.split_simul_jobs(3, 3) == [1, 1, 1]
+
+
+def test_split_simul_jobs_bounds_wave_concurrency():
+    for simul_jobs in range(1, 60):
+        for num_chunks in range(1, simul_jobs + 1):
+            shares = FlowRunner.split_simul_jobs(simul_jobs, num_chunks)
+            assert sum(shares) == simul_jobs
+            assert min(shares) >= 1
+
+
+def get_flow_runner(workflow_dir, step_id, wave_id=1):
+    from pyflow.flow import flow_utils
+    from pyflow.flow.flow_config import FlowConfig
+
+    flow_config = FlowConfig(str(flow_utils.get_default_config_file()), "default")
+    flow_runner = FlowRunner(step_id=step_id, wave_id=wave_id, flow_config=flow_config, workflow_dir=workflow_dir)
+    flow_runner.current_wave_dir.mkdir(parents=True)
+    return flow_runner
+
+
+def test_gamess_timeout_marker_survives_handling(tmp_path, monkeypatch):
+    from pyflow.io.output_parser import TIMEOUT_MARKER, classify_failure
+
+    flow_runner = get_flow_runner(tmp_path, "rm1-d")
+    wave_dir = flow_runner.current_wave_dir
+    monkeypatch.chdir(wave_dir)
+    monkeypatch.setenv("SLURM_ARRAY_JOB_ID", "123")
+    monkeypatch.setenv("SLURM_ARRAY_TASK_ID", "4")
+    input_file = wave_dir / "ABC_rm1-d_0.inp"
+    (wave_dir / "123_4.o").write_text(" EXECUTION OF GAMESS BEGUN\n")
+    (wave_dir / "123_4.e").write_text("")
+
+    flow_runner.record_timeout(input_file)
+    FlowRunner._rename_array_files(input_file.with_suffix(""))
+
+    assert TIMEOUT_MARKER in input_file.with_suffix(".o").read_text()
+    assert classify_failure(input_file.with_suffix(".o"), "gamess") == "timeout"
+
+
+def test_gaussian_timeout_marker(tmp_path):
+    from pyflow.io.output_parser import TIMEOUT_MARKER
+
+    flow_runner = get_flow_runner(tmp_path, "pm7")
+    input_file = flow_runner.current_wave_dir / "ABC_pm7_0.com"
+    input_file.with_suffix(".log").write_text(" Entering Link 1\n")
+
+    flow_runner.record_timeout(input_file)
+
+    assert input_file.with_suffix(".log").read_text().endswith(TIMEOUT_MARKER + "\n")
+
+
+# mimics xtb: fails for molecules named FAIL*, and otherwise optimizes them without moving any atom
+STUB_XTB = """#!/bin/bash
+echo "xtb $@"
+if [[ "$(basename "$1")" == FAIL* ]]; then
+    echo "abnormal termination of xtb"
+    exit 1
+fi
+cp "$1" xtbopt.xyz
+echo "          | TOTAL ENERGY               -5.070544440612 Eh   |"
+echo "   *** GEOMETRY OPTIMIZATION CONVERGED AFTER 3 ITERATIONS ***"
+echo "normal termination of xtb"
+"""
+
+
+def test_run_inline_xtb(tmp_path, monkeypatch):
+    import json
+    from pyflow.flow.flow_config import FlowConfig
+
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "xtb").write_text(STUB_XTB)
+    (bin_dir / "xtb").chmod(0o755)
+    monkeypatch.setenv("PATH", "{}:{}".format(bin_dir, os.environ["PATH"]))
+
+    config_file = tmp_path / "config.json"
+    config_file.write_text(json.dumps({"xtb": {"initial_step": "xtb",
+                                               "steps": {"xtb": {"program": "xtb", "inline": True,
+                                                                 "inline_workers": 2}}}}))
+    flow_config = FlowConfig(str(config_file), "xtb")
+    flow_runner = FlowRunner(step_id="xtb", wave_id=1, flow_config=flow_config, workflow_dir=tmp_path / "wf")
+    flow_runner.current_step_dir.mkdir(parents=True)
+    flow_runner.setup_wave_dir()
+
+    wave_dir = flow_runner.current_wave_dir
+    for name in ["ABC_xtb_0", "ABC_xtb_1", "FAIL_xtb_0"]:
+        (wave_dir / "{}.xyz".format(name)).write_text("2\nchrg=0 uhf=0\nH 0.0 0.0 0.0\nH 0.0 0.0 0.74\n")
+
+    flow_runner.run_inline(flow_runner._create_job_list_file())
+
+    completed = sorted(p.name for p in (wave_dir / "completed").iterdir())
+    failed = sorted(p.name for p in (wave_dir / "failed").iterdir())
+    assert [name for name in completed if name.endswith(".out")] == ["ABC_xtb_0.out", "ABC_xtb_1.out"]
+    assert failed == ["FAIL_xtb_0.out", "FAIL_xtb_0.xyz"]
+    assert "--chrg 0 --uhf 0 -P 1 --opt" in (wave_dir / "completed" / "ABC_xtb_0.out").read_text()
+    assert not list(wave_dir.glob(".*.xtb"))
+
+
+def test_timed_out_gaussian_restart_stages_checkpoint(tmp_path, monkeypatch):
+    from pyflow.io.gaussian_writer import GaussianWriter
+    from pyflow.io.output_parser import CHECKPOINT_MARKER
+
+    # the geometry is read from the checkpoint file, so the output file isn't converted
+    monkeypatch.setattr(GaussianWriter, "load_geometry", classmethod(lambda cls, *args, **kwargs: ("0 1\n\n", 0)))
+
+    flow_runner = get_flow_runner(tmp_path, "pm7")
+    failed_dir = flow_runner.current_wave_dir / "failed"
+    failed_dir.mkdir()
+    restart_dir = flow_runner.current_step_dir / "wave_2_calcs"
+    restart_dir.mkdir()
+
+    input_file = failed_dir / "ABC_pm7_0.com"
+    input_file.write_text("%chk=ABC_pm7_0.chk\n#p pm7 opt\n\nABC_pm7_0\n\n0 1\nH 0.0 0.0 0.0\nH 0.0 0.0 0.74\n\n")
+    output_file = input_file.with_suffix(".log")
+    output_file.write_text(" Step number   3 out of a maximum of  100\n\n{} after 3 optimization step(s)\n"
+                           .format(CHECKPOINT_MARKER))
+    input_file.with_suffix(".chk").write_bytes(b"checkpoint")
+
+    assert flow_runner.update_input_file(input_file, output_file, restart_dir, failure="timeout")
+
+    # the restart doesn't depend on the failed wave, which may be archived before it runs
+    for f in failed_dir.iterdir():
+        f.unlink()
+
+    new_input = (restart_dir / "ABC_pm7_0.com").read_text()
+    assert "%oldchk=ABC_pm7_0_prev.chk\n" in new_input
+    assert "geom=check" in new_input.lower()
+    assert (restart_dir / "ABC_pm7_0_prev.chk").read_bytes() == b"checkpoint"
+
+
+def test_input_filenames_reuse_previous_checkpoints(tmp_path):
+    flow_runner = get_flow_runner(tmp_path, "s0-vac")
+    flow_runner.current_step_config["reuse_guess_from_previous"] = True
+    prev_layout = flow_runner.get_wave_layout(flow_runner.get_prev_step_id(), flow_runner.get_prev_step_wave_dir())
+    prev_layout.get_dir("completed").mkdir(parents=True)
+
+    structure_files = []
+    for inchi_key in ["ABC", "DEF"]:
+        structure = prev_layout.get_path("{}_sp-dft_0.log".format(inchi_key), sub_dir="completed", create=True)
+        structure.write_text("")
+        structure_files.append(structure)
+    structure_files[0].with_suffix(".chk").write_bytes(b"checkpoint")
+
+    input_filenames = flow_runner.get_input_filenames(structure_files, flow_runner.current_wave_dir)
+
+    assert [f[0].name for f in input_filenames] == ["ABC_s0-vac.com", "DEF_s0-vac.com"]
+    assert [f[2] for f in input_filenames] == [structure_files[0].with_suffix(".chk"), None]
+
+
+def test_input_filenames_without_reused_guess(tmp_path):
+    flow_runner = get_flow_runner(tmp_path, "rm1-d")
+    structure = tmp_path / "ABC_pm7_0.log"
+    structure.with_suffix(".chk").write_bytes(b"checkpoint")
+
+    (input_filename, _, prev_chk_file), = flow_runner.get_input_filenames([structure], flow_runner.current_wave_dir)
+
+    assert input_filename.name == "ABC_rm1-d_0.inp"
+    assert prev_chk_file is None
+
+
+def test_fully_cached_wave_queues_dependents(tmp_path, monkeypatch):
+    from pyflow.flow.slurm_executor import LocalExecutor
+    from pyflow.io.result_cache import ResultCache
+
+    flow_runner = get_flow_runner(tmp_path, "pm7")
+    flow_runner.setup_wave_dir()
+    flow_runner.executor = LocalExecutor()
+    (tmp_path / "rm1-d").mkdir()
+
+    cache = ResultCache(tmp_path / "cache")
+    monkeypatch.setattr(flow_runner, "get_result_cache", lambda: cache)
+    input_file = flow_runner.current_wave_dir / "ABC_pm7_0.com"
+    input_file.write_text("%chk=ABC_pm7_0.chk\n#p pm7 opt\n\nABC_pm7_0\n\n0 1\nH 0.0 0.0 0.0\nH 0.0 0.0 0.74\n\n")
+    cached_output = tmp_path / "cached.log"
+    cached_output.write_text(" Normal termination of Gaussian 16\n")
+    cache.add(ResultCache.get_key(input_file, "gaussian16", flow_runner.current_step_config), cached_output)
+
+    monkeypatch.setattr(flow_runner, "setup_input_files",
+                        lambda show_progress, overwrite: flow_runner.apply_result_cache([input_file]))
+
+    flow_runner.run()
+
+    assert (flow_runner.current_wave_dir / "completed" / "ABC_pm7_0.log").is_file()
+    # only the submitter of the dependent step is queued
+    assert list(flow_runner.executor.tasks) == [1]
+    assert (tmp_path / "rm1-d" / "rm1-d_wave_1_submitter.sbatch").is_file()
+
+
+
+def test_cache_hits_count_as_set_up_conformers(tmp_path, monkeypatch):
+    from pyflow.io.result_cache import ResultCache
+
+    pm7 = get_flow_runner(tmp_path, "pm7")
+    pm7.setup_wave_dir()
+    cache = ResultCache(tmp_path / "cache")
+    monkeypatch.setattr(pm7, "get_result_cache", lambda: cache)
+
+    input_files = []
+    for i in range(2):
+        input_file = pm7.current_wave_dir / "ABC_pm7_{}.com".format(i)
+        input_file.write_text("#p pm7 opt\n\nABC_pm7_{}\n\n0 1\nH 0.0 0.0 0.{}\n\n".format(i, i))
+        input_files.append(input_file)
+    cached_output = tmp_path / "cached.log"
+    cached_output.write_text(" Normal termination of Gaussian 16\n")
+    cache.add(ResultCache.get_key(input_files[0], "gaussian16", pm7.current_step_config), cached_output)
+
+    # as in setup_input_files, the conformers are counted before the cache is applied
+    pm7.write_num_conformers(input_files)
+    pm7.apply_result_cache(input_files)
+    assert pm7._create_job_list_file() == 1
+
+    completed_dir = pm7.current_wave_dir / "completed"
+    (completed_dir / "ABC_pm7_1.log").write_text("")
+    source_files = sorted(completed_dir.glob("*.log"))
+
+    assert get_flow_runner(tmp_path, "rm1-d").remove_failed_confs(source_files) == source_files
+
+
+def write_completed_confs(flow_runner, names):
+    completed_dir = flow_runner.current_wave_dir / "completed"
+    completed_dir.mkdir(exist_ok=True)
+    for name in names:
+        (completed_dir / name).write_text("")
+    return [completed_dir / name for name in names]
+
+
+def test_restarted_conformers_join_their_molecule(tmp_path):
+    pm7_wave_1 = get_flow_runner(tmp_path, "pm7")
+    pm7_wave_1.write_num_conformers([Path("ABC_pm7_{}.com".format(i)) for i in range(3)] +
+                                    [Path("DEF_pm7_{}.com".format(i)) for i in range(2)])
+    wave_1_files = write_completed_confs(pm7_wave_1, ["ABC_pm7_0.log", "ABC_pm7_1.log",
+                                                      "DEF_pm7_0.log", "DEF_pm7_1.log"])
+
+    # ABC_pm7_2 failed in wave 1 and completed in the restart wave
+    pm7_wave_2 = get_flow_runner(tmp_path, "pm7", wave_id=2)
+    wave_2_files = write_completed_confs(pm7_wave_2, ["ABC_pm7_2.log"])
+    (pm7_wave_2.current_wave_dir / "input_files.txt").write_text("ABC_pm7_2.com\n")
+
+    assert get_flow_runner(tmp_path, "rm1-d").remove_failed_confs(wave_1_files) == wave_1_files[2:]
+    assert get_flow_runner(tmp_path, "rm1-d", wave_id=2).remove_failed_confs(wave_2_files) == \
+        wave_1_files[:2] + wave_2_files
+
+
+def test_molecules_with_missing_conformers_are_removed(tmp_path):
+    pm7 = get_flow_runner(tmp_path, "pm7", wave_id=2)
+    pm7.write_num_conformers([Path("ABC_pm7_{}.com".format(i)) for i in range(3)])
+    files = write_completed_confs(pm7, ["ABC_pm7_0.log", "ABC_pm7_2.log"])
+
+    assert get_flow_runner(tmp_path, "rm1-d", wave_id=2).remove_failed_confs(files) == []
+
+
+def test_archived_failures_are_restarted_once(tmp_path, monkeypatch):
+    from pyflow.io.gaussian_writer import GaussianWriter
+    from pyflow.io.output_parser import CHECKPOINT_MARKER, TIMEOUT_MARKER
+
+    monkeypatch.setattr(GaussianWriter, "load_geometry", classmethod(lambda cls, *args, **kwargs: ("0 1\n\n", 0)))
+
+    flow_runner = get_flow_runner(tmp_path, "pm7")
+    flow_runner.setup_wave_dir()
+    failed_dir = flow_runner.current_wave_dir / "failed"
+    input_file = failed_dir / "ABC_pm7_0.com"
+    input_file.write_text("%chk=ABC_pm7_0.chk\n#p pm7 opt\n\nABC_pm7_0\n\n0 1\nH 0.0 0.0 0.0\nH 0.0 0.0 0.74\n\n")
+    input_file.with_suffix(".log").write_text(" Step number   3 out of a maximum of  100\n\n"
+                                              "{} after 3 optimization step(s)\n{}\n".format(CHECKPOINT_MARKER,
+                                                                                          TIMEOUT_MARKER))
+    input_file.with_suffix(".chk").write_bytes(b"checkpoint")
+    flow_runner.archive(num_threads=1)
+
+    restarter = FlowRunner(step_id="pm7", wave_id=1, attempt_restart=True, flow_config=flow_runner.flow_config,
+                           workflow_dir=tmp_path)
+    assert restarter.needs_restart()
+
+    restart_runner = FlowRunner(step_id="pm7", wave_id=2, attempt_restart=True, flow_config=flow_runner.flow_config,
+                                workflow_dir=tmp_path)
+    restart_runner.setup_wave_dir()
+    restart_runner.setup_input_files(show_progress=False, overwrite=True)
+
+    assert (restart_runner.current_wave_dir / "ABC_pm7_0.com").is_file()
+    assert not restarter.needs_restart()
+    assert restart_runner.get_prev_wave_failed_input_files() == []
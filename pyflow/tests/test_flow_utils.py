@@ -0,0 +1,11 @@
+import os
+
+from pyflow.flow import flow_utils
+
+
+def test_available_cpus(monkeypatch):
+    monkeypatch.setenv("SLURM_CPUS_PER_TASK", "3")
+    assert flow_utils.get_available_cpus() == 3
+
+    monkeypatch.delenv("SLURM_CPUS_PER_TASK")
+    assert 1 <= flow_utils.get_available_cpus() <= os.cpu_count()
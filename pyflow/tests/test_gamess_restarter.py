@@ -0,0 +1,56 @@
+from pyflow.flow.gamess_restarter import GamessRestarter
+
+INPUT = """ $CONTRL RUNTYP=OPTIMIZE $END
+ $STATPT NSTEP=50 OPTTOL=0.0001 $END
+ $DATA
+ABC_rm1-d_0
+C1
+C      6.0   0.0   0.0   0.0
+H      1.0   1.09  0.0   0.0
+ $END
+"""
+
+
+def test_get_option():
+    assert GamessRestarter.get_option(INPUT, "STATPT", "nstep") == "50"
+    assert GamessRestarter.get_option(INPUT, "STATPT", "HESS") is None
+    assert GamessRestarter.get_option(INPUT, "SYSTEM", "MWORDS") is None
+
+
+def test_set_options_updates_existing_group():
+    text = GamessRestarter.set_options(INPUT, "STATPT", {"nstep": 100, "HESS": "CALC"})
+
+    assert " $STATPT OPTTOL=0.0001 NSTEP=100 HESS=CALC $END\n" in text
+    assert text.count("$STATPT") == 1
+
+
+def test_set_options_adds_group_before_data():
+    text = GamessRestarter.set_options(INPUT, "SYSTEM", {"MWORDS": 200, "TIMLIM": 600})
+
+    assert " $SYSTEM MWORDS=200 TIMLIM=600 $END\n $DATA\n" in text
+    assert GamessRestarter.get_option(text, "SYSTEM", "TIMLIM") == "600"
+
+
+def test_set_geometry_keeps_title_and_symmetry():
+    text = GamessRestarter.set_geometry(INPUT, ["C 0.1 0.2 0.3", "H 1.2 0.2 0.3"])
+    data_lines = text.split("$DATA")[1].split("$END")[0].splitlines()
+
+    assert data_lines[1:3] == ["ABC_rm1-d_0", "C1"]
+    assert [line.split() for line in data_lines[3:5]] == [["C", "6.0", "0.1", "0.2", "0.3"],
+                                                          ["H", "1.0", "1.2", "0.2", "0.3"]]
+    assert text.endswith("\n $END\n")
+
+
+def test_failure_reason(tmp_path):
+    input_file = tmp_path / "ABC_rm1-d_0.inp"
+    output_file = input_file.with_suffix(".o")
+    restarter = GamessRestarter(input_file, output_file)
+
+    assert restarter.get_failure_reason("timeout") is None
+
+    output_file.write_text(" EXECUTION OF GAMESS BEGUN\n")
+    assert restarter.get_failure_reason() is None
+    assert restarter.get_failure_reason("timeout") == "timeout"
+
+    output_file.write_text(" SCF IS UNCONVERGED, TOO MANY ITERATIONS\n")
+    assert restarter.get_failure_reason("timeout") == "scf"
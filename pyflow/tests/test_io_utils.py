@@ -0,0 +1,19 @@
+import gzip
+
+from pyflow.io.io_utils import read_tail
+
+
+def test_read_tail_across_blocks(tmp_path):
+    filepath = tmp_path / "ABC_pm7_0.log"
+    filepath.write_text("".join("line {}\n".format(i) for i in range(100)))
+
+    assert read_tail(filepath, 3, block_size=7) == ["line 97\n", "line 98\n", "line 99\n"]
+    assert len(read_tail(filepath, 1000)) == 100
+
+
+def test_read_tail_compressed(tmp_path):
+    filepath = tmp_path / "ABC_pm7_0.log.gz"
+    with gzip.open(filepath, "wt") as f:
+        f.write("first\nsecond\nlast")
+
+    assert read_tail(filepath, 2) == ["second\n", "last"]
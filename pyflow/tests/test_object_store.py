@@ -0,0 +1,49 @@
+import hashlib
+
+from pyflow.io.object_store import ObjectStore
+
+
+def test_put_and_link(tmp_path):
+    store = ObjectStore(tmp_path / "objects")
+    source = tmp_path / "ABC_pm7_0.log"
+    source.write_text("Normal termination\n")
+
+    digest = store.put(source)
+
+    assert digest == hashlib.sha256(b"Normal termination\n").hexdigest()
+    assert store.contains(digest)
+    assert store.get_object_path(digest) == tmp_path / "objects" / digest[:2] / digest
+
+    dest = tmp_path / "restored.log"
+    dest.write_text("stale")
+    store.link(digest, dest)
+
+    assert dest.read_text() == "Normal termination\n"
+
+
+def test_identical_files_share_object(tmp_path):
+    store = ObjectStore(tmp_path / "objects")
+    first = tmp_path / "first.log"
+    second = tmp_path / "second.log"
+    first.write_text("same")
+    second.write_text("same")
+
+    assert store.put(first) == store.put(second)
+    assert len(list((tmp_path / "objects").rglob("*"))) == 2  # one prefix directory, one object
+    assert not store.contains(hashlib.sha256(b"other").hexdigest())
+
+
+def test_objects_dont_share_inode_with_stored_file(tmp_path):
+    store = ObjectStore(tmp_path / "objects")
+    source = tmp_path / "ABC_pm7_0.log"
+    source.write_text("Normal termination\n")
+
+    digest = store.put(source)
+    object_path = store.get_object_path(digest)
+
+    assert object_path.stat().st_ino != source.stat().st_ino
+    assert object_path.stat().st_mode & 0o777 == ObjectStore.OBJECT_MODE
+
+    with source.open("a") as f:
+        f.write("edited in place\n")
+    assert ObjectStore.hash_file(object_path) == digest
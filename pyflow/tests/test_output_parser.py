@@ -0,0 +1,32 @@
+from pyflow.io.output_parser import TIMEOUT_MARKER, classify_failure
+
+
+def test_classify_missing_output(tmp_path):
+    assert classify_failure(tmp_path / "missing.log", "gaussian16") == "error"
+
+
+def test_classify_error_termination(tmp_path):
+    output_file = tmp_path / "a.log"
+    output_file.write_text(" Error termination via Lnk1e in l9999.exe\n")
+
+    assert classify_failure(output_file, "gaussian16") == "error"
+
+
+def test_classify_timeout(tmp_path):
+    output_file = tmp_path / "a.log"
+    output_file.write_text(" Error termination via Lnk1e\n\n{}\n".format(TIMEOUT_MARKER))
+    assert classify_failure(output_file, "gaussian16") == "timeout"
+
+    # an output which ends without a termination line was killed with its job
+    output_file.write_text(" Step number 12 out of a maximum of 100\n")
+    assert classify_failure(output_file, "gaussian16") == "timeout"
+
+
+def test_classify_memory(tmp_path):
+    output_file = tmp_path / "a.o"
+    output_file.write_text(" EXECUTION OF GAMESS TERMINATED -ABNORMALLY-\n")
+    error_file = tmp_path / "a.e"
+    error_file.write_text("slurmstepd: error: Detected 1 oom-kill event(s)\n")
+
+    assert classify_failure(output_file, "gamess") == "error"
+    assert classify_failure(output_file, "gamess", error_file=error_file) == "memory"
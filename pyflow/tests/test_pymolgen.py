@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("rdkit")
+pytest.importorskip("tqdm")
+
+from pyflow.mol import pymolgen
+
+
+def test_embed_molecule_without_pruning(tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("conformers were pruned")
+
+    monkeypatch.setattr(pymolgen, "prune_conformers", fail)
+
+    _, num_written_confs, target_num_confs = pymolgen.embed_molecule("CCCCCC", str(tmp_path), 5)
+
+    assert target_num_confs == 5
+    assert num_written_confs == len(list(tmp_path.glob("*.pdb")))
+    assert num_written_confs > 1
+
+
+def test_embed_molecule_with_rms_threshold(tmp_path, monkeypatch):
+    thresholds = []
+    prune_conformers = pymolgen.prune_conformers
+
+    def record(mol, conf_ids, energies, energy_window=None, rms_threshold=None):
+        thresholds.append(rms_threshold)
+        return prune_conformers(mol, conf_ids, energies, energy_window, rms_threshold)
+
+    monkeypatch.setattr(pymolgen, "prune_conformers", record)
+
+    # no two conformers of hexane are 100 Angstroms apart, so only the lowest energy one is kept
+    _, num_written_confs, _ = pymolgen.embed_molecule("CCCCCC", str(tmp_path), 5, rms_threshold=100.0)
+
+    assert thresholds == [100.0]
+    assert num_written_confs == 1
+    assert [p.name.rsplit("_", 1)[1] for p in tmp_path.glob("*.pdb")] == ["0.pdb"]
+
+
+def test_prune_conformers_energy_window():
+    from rdkit import Chem
+    from rdkit.Chem import AllChem
+
+    mol = Chem.AddHs(Chem.MolFromSmiles("CCCCCC"))
+    conf_ids = list(AllChem.EmbedMultipleConfs(mol, numConfs=3, randomSeed=1))
+    assert len(conf_ids) == 3
+
+    kept_ids = pymolgen.prune_conformers(mol, conf_ids, [3.0, 0.0, 1.0], energy_window=1.5)
+
+    assert kept_ids == [conf_ids[1], conf_ids[2]]
+
+
+def test_threads_per_worker_share_allocated_cpus(monkeypatch):
+    monkeypatch.setenv("SLURM_CPUS_PER_TASK", "8")
+
+    assert pymolgen.get_threads_per_worker(1) == 0
+    assert pymolgen.get_threads_per_worker(4) == 2
+    assert pymolgen.get_threads_per_worker(16) == 1
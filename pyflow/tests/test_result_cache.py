@@ -0,0 +1,98 @@
+from pyflow.io.result_cache import ResultCache
+
+GAUSSIAN_INPUT = """%chk={name}.chk
+%nprocshared={procs}
+#p PM7 opt
+
+{name}
+
+0 1
+C {x} 0.0 0.0
+H 1.09 0.0 0.0
+
+"""
+
+GAMESS_INPUT = """ $CONTRL RUNTYP=OPTIMIZE $END
+ $SYSTEM MWORDS={mwords} $END
+ $DATA
+{name}
+C1
+C 6.0 {x} 0.0 0.0
+ $END
+"""
+
+
+def get_key(tmp_path, template, program, step_config=None, **kwargs):
+    input_file = tmp_path / "input"
+    input_file.write_text(template.format(**kwargs))
+    return ResultCache.get_key(input_file, program, step_config or {})
+
+
+def test_gaussian_key_ignores_link0_and_title(tmp_path):
+    key = get_key(tmp_path, GAUSSIAN_INPUT, "gaussian16", name="ABC_pm7_0", procs=8, x="0.0")
+
+    assert get_key(tmp_path, GAUSSIAN_INPUT, "gaussian16", name="DEF_opt_3", procs=16, x="0.0") == key
+    assert get_key(tmp_path, GAUSSIAN_INPUT.lower(), "gaussian16", name="ABC_pm7_0", procs=8, x="0.0") == key
+    assert get_key(tmp_path, GAUSSIAN_INPUT, "gaussian16", name="ABC_pm7_0", procs=8, x="0.1") != key
+
+
+def test_key_rounds_decimals(tmp_path):
+    key = get_key(tmp_path, GAUSSIAN_INPUT, "gaussian16", name="ABC", procs=8, x="0.00001")
+
+    assert get_key(tmp_path, GAUSSIAN_INPUT, "gaussian16", name="ABC", procs=8, x="-0.00002") == key
+    assert get_key(tmp_path, GAUSSIAN_INPUT, "gaussian16", name="ABC", procs=8, x="1.0D-6") == key
+
+
+def test_gamess_key_ignores_system_group_and_title(tmp_path):
+    key = get_key(tmp_path, GAMESS_INPUT, "gamess", name="ABC_rm1-d_0", mwords=100, x="0.0")
+
+    assert get_key(tmp_path, GAMESS_INPUT, "gamess", name="DEF_rm1-d_1", mwords=400, x="0.0") == key
+    assert get_key(tmp_path, GAMESS_INPUT, "gamess", name="ABC_rm1-d_0", mwords=100, x="0.5") != key
+
+
+def test_key_depends_on_program_and_step_params(tmp_path):
+    key = get_key(tmp_path, GAUSSIAN_INPUT, "gaussian16", {"opt": True, "nproc": 8}, name="ABC", procs=8, x="0.0")
+
+    assert get_key(tmp_path, GAUSSIAN_INPUT, "gaussian16", {"opt": True, "nproc": 16},
+                   name="ABC", procs=8, x="0.0") == key
+    assert get_key(tmp_path, GAUSSIAN_INPUT, "gaussian16", {"opt": False}, name="ABC", procs=8, x="0.0") != key
+    assert get_key(tmp_path, GAUSSIAN_INPUT, "gamess", {"opt": True}, name="ABC", procs=8, x="0.0") != key
+
+
+def test_checkpoint_geometry_is_not_cacheable(tmp_path):
+    input_file = tmp_path / "ABC_s0-vac.com"
+    input_file.write_text("%oldchk=ABC_sp-dft.chk\n#p B3LYP Geom=Check Guess=Read\n\nABC\n\n0 1\n\n")
+
+    assert not ResultCache.is_cacheable(input_file, "gaussian16")
+    assert ResultCache.is_cacheable(input_file, "gamess")
+
+
+def test_add_and_restore(tmp_path):
+    output_file = tmp_path / "ABC_pm7_0.log"
+    output_file.write_text("Normal termination\n")
+    cache = ResultCache(tmp_path / "cache")
+
+    cache.add("key", output_file)
+    # index lines left incomplete by an interrupted writer are skipped
+    with cache.index_file.open("a") as f:
+        f.write("partial")
+
+    entry = ResultCache(tmp_path / "cache").lookup(["key", "other"])["key"]
+    assert entry[1] is None
+
+    restored = tmp_path / "restored.log"
+    cache.restore(entry, restored, tmp_path / "restored.xyz")
+    assert restored.read_text() == "Normal termination\n"
+    assert not (tmp_path / "restored.xyz").exists()
+
+
+def test_add_doesnt_load_index(tmp_path):
+    output_file = tmp_path / "ABC_pm7_0.log"
+    output_file.write_text("Normal termination\n")
+    ResultCache(tmp_path / "cache").add("old", output_file)
+
+    cache = ResultCache(tmp_path / "cache")
+    cache.add("new", output_file)
+
+    assert cache._index is None
+    assert set(cache.lookup(["old", "new"])) == {"old", "new"}
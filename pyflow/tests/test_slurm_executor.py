@@ -0,0 +1,127 @@
+import sys
+import time
+
+import pytest
+
+from pyflow.flow.slurm_executor import SlurmExecutor, SubmissionError
+
+# mimics sbatch: each call consumes the next line of the responses file
+FAKE_SBATCH = """#!{python}
+import sys
+from pathlib import Path
+
+responses = Path("{dir}/responses")
+response, *rest = responses.read_text().splitlines()
+responses.write_text("".join(line + "\\n" for line in rest))
+with open("{dir}/sbatch.log", "a") as f:
+    f.write(sys.argv[1] + "\\n")
+
+if response.startswith("ok"):
+    print("Submitted batch job " + response.split()[1])
+elif response.startswith("landed"):
+    # the job is queued, but the reply of the controller is lost
+    with open("{dir}/queue", "a") as f:
+        f.write("{{}} now\\n".format(response.split()[1]))
+    sys.exit("sbatch: error: Batch job submission failed: Socket timed out on send/recv operation")
+elif response == "timeout":
+    sys.exit("sbatch: error: Batch job submission failed: Socket timed out on send/recv operation")
+elif response == "limit":
+    sys.exit("sbatch: error: QOSMaxSubmitJobPerUserLimit")
+else:
+    sys.exit("sbatch: error: invalid partition specified")
+"""
+
+# mimics squeue -o "%F %V" for the jobs in the queue file
+FAKE_SQUEUE = """#!{python}
+import time
+from pathlib import Path
+
+with open("{dir}/squeue.log", "a") as f:
+    f.write("squeue\\n")
+
+queue = Path("{dir}/queue")
+for line in queue.read_text().splitlines() if queue.exists() else []:
+    job_id, submit_time = line.split()
+    if submit_time == "now":
+        submit_time = time.strftime("%Y-%m-%dT%H:%M:%S")
+    print(job_id, submit_time)
+"""
+
+
+@pytest.fixture
+def executor(tmp_path, monkeypatch):
+    for name, script in [("sbatch", FAKE_SBATCH), ("squeue", FAKE_SQUEUE)]:
+        command = tmp_path / name
+        command.write_text(script.format(python=sys.executable, dir=tmp_path))
+        command.chmod(0o755)
+
+    monkeypatch.setattr(SlurmExecutor, "RATE_LIMIT_FILE", tmp_path / "submit.lock")
+    monkeypatch.delenv("SLURM_JOB_ID", raising=False)
+
+    (tmp_path / "job.sbatch").write_text("#!/bin/bash\n#SBATCH -J wf_pm7_wave-1\n\necho\n")
+
+    return SlurmExecutor(state_dir=tmp_path,
+                         sbatch_command=str(tmp_path / "sbatch"),
+                         squeue_command=str(tmp_path / "squeue"),
+                         submit_retries=2,
+                         submit_backoff=0,
+                         submit_interval=0)
+
+
+def set_responses(tmp_path, *responses):
+    (tmp_path / "responses").write_text("".join(response + "\n" for response in responses))
+
+
+def count_calls(tmp_path, command):
+    log = tmp_path / "{}.log".format(command)
+    return len(log.read_text().splitlines()) if log.exists() else 0
+
+
+def test_submit(tmp_path, executor):
+    set_responses(tmp_path, "ok 101")
+
+    assert executor.submit(tmp_path / "job.sbatch") == 101
+    assert executor.get_submit_time(101) is not None
+
+
+def test_limit_is_retried_without_adopting_queued_jobs(tmp_path, executor):
+    set_responses(tmp_path, "limit", "ok 102")
+    # a job with the same name left by an earlier run of the wave
+    (tmp_path / "queue").write_text("55 now\n")
+
+    assert executor.submit(tmp_path / "job.sbatch") == 102
+    assert count_calls(tmp_path, "sbatch") == 2
+    assert count_calls(tmp_path, "squeue") == 0
+
+
+def test_timed_out_submission_which_landed_is_adopted(tmp_path, executor):
+    set_responses(tmp_path, "landed 103", "ok 104")
+
+    assert executor.submit(tmp_path / "job.sbatch") == 103
+    assert count_calls(tmp_path, "sbatch") == 1
+
+
+def test_timed_out_submission_ignores_stale_jobs(tmp_path, executor):
+    set_responses(tmp_path, "timeout", "ok 105")
+    stale_time = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(time.time() - 3600))
+    (tmp_path / "queue").write_text("999 {}\n".format(stale_time))
+
+    assert executor.submit(tmp_path / "job.sbatch") == 105
+    assert count_calls(tmp_path, "sbatch") == 2
+    assert count_calls(tmp_path, "squeue") == 1
+
+
+def test_permanent_error_is_not_retried(tmp_path, executor):
+    set_responses(tmp_path, "invalid", "ok 107")
+
+    with pytest.raises(SubmissionError):
+        executor.submit(tmp_path / "job.sbatch")
+    assert count_calls(tmp_path, "sbatch") == 1
+
+
+def test_corrupt_rate_limit_file(tmp_path, executor):
+    SlurmExecutor.RATE_LIMIT_FILE.write_text("\0\0garbage")
+    set_responses(tmp_path, "ok 108")
+
+    assert executor.submit(tmp_path / "job.sbatch") == 108
+    assert float(SlurmExecutor.RATE_LIMIT_FILE.read_text()) > 0
@@ -0,0 +1,74 @@
+from pyflow.flow.slurm_executor import LocalExecutor
+from pyflow.flow.throttle_controller import ThrottleController
+
+
+def get_controller(executor, num_arrays=1, num_tasks=100, throttle=10, **kwargs):
+    job_ids = [executor.submit("array.sbatch", num_jobs=num_tasks) for _ in range(num_arrays)]
+    controller = ThrottleController(executor=executor, job_ids=job_ids, partition="short", cores_per_task=2,
+                                    throttle=throttle, **kwargs)
+    return controller, job_ids
+
+
+def test_freshly_queued_tasks_keep_throttle():
+    executor = LocalExecutor()
+    controller, _ = get_controller(executor)
+
+    assert controller.update() == 10
+    assert executor.throttle_updates == []
+
+
+def test_limit_lowers_throttle_to_running_tasks():
+    executor = LocalExecutor()
+    controller, (job_id,) = get_controller(executor)
+    executor.set_tasks(job_id, running=4, pending=96, reason="QOSMaxJobsPerUserLimit")
+
+    assert controller.update() == 4
+    assert executor.throttles == {job_id: 4}
+
+
+def test_idle_cores_raise_throttle():
+    executor = LocalExecutor(idle_cores=100)
+    controller, (job_id,) = get_controller(executor, max_throttle=12)
+    executor.set_tasks(job_id, running=10, pending=90, reason=ThrottleController.THROTTLE_REASON)
+
+    assert controller.update() == 12
+    assert executor.throttles == {job_id: 12}
+
+
+def test_throttle_is_split_across_arrays():
+    executor = LocalExecutor()
+    controller, job_ids = get_controller(executor, num_arrays=3, throttle=9)
+    for job_id in job_ids:
+        executor.set_tasks(job_id, running=2, pending=10, reason="AssocGrpCpuLimit")
+
+    assert controller.update() == 6
+    assert [executor.throttles[job_id] for job_id in job_ids] == [2, 2, 2]
+
+
+def test_small_throttle_holds_extra_arrays():
+    executor = LocalExecutor(idle_cores=4)
+    controller, job_ids = get_controller(executor, num_arrays=3, throttle=3)
+    for job_id in job_ids:
+        executor.set_tasks(job_id, pending=10, reason="QOSMaxJobsPerUserLimit")
+    executor.set_tasks(job_ids[0], running=1, pending=9, reason="QOSMaxJobsPerUserLimit")
+
+    assert controller.update() == 1
+    assert executor.throttles == {job_ids[0]: 1}
+    assert executor.held_job_ids == set(job_ids[1:])
+
+    # the held arrays are released once the throttle is raised again
+    for job_id in job_ids[1:]:
+        executor.set_tasks(job_id, pending=10, reason="JobHeldUser")
+    executor.set_tasks(job_ids[0], running=1, pending=9, reason=ThrottleController.THROTTLE_REASON)
+
+    assert controller.update() == 2
+    assert executor.throttles == {job_ids[0]: 1, job_ids[1]: 1}
+    assert executor.held_job_ids == {job_ids[2]}
+
+
+def test_finished_arrays_stop_controller():
+    executor = LocalExecutor()
+    controller, (job_id,) = get_controller(executor)
+    executor.set_tasks(job_id)
+
+    assert controller.update() is None
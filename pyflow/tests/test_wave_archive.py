@@ -0,0 +1,72 @@
+import gzip
+import os
+
+from pyflow.io.wave_archive import WaveArchive
+
+
+def make_wave(tmp_path):
+    wave_dir = tmp_path / "wave_1_calcs"
+    (wave_dir / "completed").mkdir(parents=True)
+    files = {"completed/A_0.log": b"Normal termination\n" * 1000,
+             "completed/A_0.chk": os.urandom(3 * WaveArchive.CHUNK_SIZE + 17),
+             "completed/B_0.log": gzip.compress(b"Normal termination\n"),
+             "input_files.txt": b"A_0.com\nB_0.com\n"}
+    for name, data in files.items():
+        (wave_dir / name).write_bytes(data)
+    return wave_dir, files
+
+
+def test_archived_members_are_readable(tmp_path, monkeypatch):
+    # large members are spooled to temporary files rather than held in memory
+    monkeypatch.setattr(WaveArchive, "SPOOL_SIZE", WaveArchive.CHUNK_SIZE)
+    wave_dir, files = make_wave(tmp_path)
+
+    WaveArchive(wave_dir).add([wave_dir / name for name in files], num_threads=2)
+
+    archive = WaveArchive(wave_dir)
+    assert sorted(archive.get_names()) == sorted(files)
+    for name, data in files.items():
+        with archive.open(name) as f:
+            assert f.read() == data
+    assert archive.get_index()["completed/B_0.log"][3] == "stored"
+    assert archive.get_index()["completed/A_0.log"][3] == "zlib"
+    assert sorted(archive.match("completed/*.log")) == ["completed/A_0.log", "completed/B_0.log"]
+
+
+def test_archiving_resumes(tmp_path):
+    wave_dir, files = make_wave(tmp_path)
+    names = sorted(files)
+
+    WaveArchive(wave_dir).add([wave_dir / name for name in names[:2]], num_threads=1)
+    size = (wave_dir / WaveArchive.ARCHIVE_FILENAME).stat().st_size
+    WaveArchive(wave_dir).add([wave_dir / name for name in names], num_threads=1)
+
+    archive = WaveArchive(wave_dir)
+    assert sorted(archive.get_names()) == names
+    assert archive.get_index()[names[2]][0] == size
+
+
+def test_locate(tmp_path):
+    wave_dir, files = make_wave(tmp_path)
+    WaveArchive(wave_dir).add([wave_dir / "completed/A_0.log"], num_threads=1)
+    WaveArchive._archives.clear()
+
+    archive, name = WaveArchive.locate(wave_dir / "completed" / "A_0.log")
+    assert name == "completed/A_0.log"
+    assert WaveArchive.locate(wave_dir / "completed" / "A_1.log") is None
+
+
+def test_removed_members_are_hidden(tmp_path):
+    wave_dir, files = make_wave(tmp_path)
+    WaveArchive(wave_dir).add([wave_dir / name for name in files], num_threads=1)
+    archive = WaveArchive.get(wave_dir)
+    assert archive.match("completed/*.log") == ["completed/A_0.log", "completed/B_0.log"]
+
+    WaveArchive(wave_dir).remove(["completed/A_0.log", "completed/missing.log"])
+
+    # the cached archive is reloaded since the archive changed
+    assert WaveArchive.get(wave_dir) is not archive
+    assert WaveArchive.get(wave_dir).match("completed/*.log") == ["completed/B_0.log"]
+    assert WaveArchive.locate(wave_dir / "completed" / "A_0.log") is None
+    assert sorted(WaveArchive(wave_dir).get_names()) == sorted(set(files) - {"completed/A_0.log"})
+    assert (wave_dir / WaveArchive.TOMBSTONE_FILENAME).read_text() == "completed/A_0.log\n"
@@ -0,0 +1,39 @@
+from pathlib import Path
+
+from pyflow.flow.wave_layout import WaveLayout
+
+FILENAME = "ABCDEFGHIJKLMN-OPQRSTUVWX-Y_pm7_0.com"
+
+
+def test_flat_layout(tmp_path):
+    layout = WaveLayout(tmp_path)
+
+    assert not layout.is_sharded()
+    assert layout.get_shard(FILENAME) == Path()
+    assert layout.get_path(FILENAME) == tmp_path / FILENAME
+    assert layout.get_path(FILENAME, sub_dir="completed") == tmp_path / "completed" / FILENAME
+
+
+def test_sharded_layout(tmp_path):
+    layout = WaveLayout(tmp_path, shard_depth=2)
+
+    assert layout.is_sharded()
+    assert layout.get_shard(FILENAME) == Path("AB", "CD")
+    assert layout.get_path(FILENAME, sub_dir="failed") == tmp_path / "failed" / "AB" / "CD" / FILENAME
+    assert not (tmp_path / "failed").exists()
+
+    path = layout.get_path(FILENAME, create=True)
+
+    assert path.parent.is_dir()
+    assert layout.get_relative_path(path) == "AB/CD/" + FILENAME
+
+
+def test_glob_only_searches_shards(tmp_path):
+    layout = WaveLayout(tmp_path, shard_depth=1)
+    path = layout.get_path(FILENAME, create=True)
+    path.write_text("")
+    (tmp_path / "completed" / "AB").mkdir(parents=True)
+    (tmp_path / "completed" / "AB" / "ABCD_pm7_1.com").write_text("")
+
+    assert layout.glob("*.com") == [path]
+    assert layout.glob("*.com", sub_dir="completed") == [tmp_path / "completed" / "AB" / "ABCD_pm7_1.com"]